@@ -0,0 +1 @@
+"""Benchmarks and the UPS simulator, not part of the package."""
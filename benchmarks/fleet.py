@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Load benchmark of the exporter against a fleet of simulated UPSs.
+
+Starts a Simulator (benchmarks/simulator.py) with the given number of
+virtual UPSs in a separate process and measures collect() of each scraping
+mode: the latency of the first (cold) collect, including logins and API
+discovery, p50/p99 latency and throughput of the following collects and the
+CPU time of the exporter per collect. The CPU time includes the worker
+processes of the processes mode, read from /proc on Linux only.
+
+    python benchmarks/fleet.py [-n DEVICES] [-r ROUNDS] [--latency S]
+                               [--mode MODE ...]
+"""
+import contextlib
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from importlib.util import find_spec
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from benchmarks.simulator import (  # noqa: E402
+    Simulator,
+    settings_arguments,
+    settings_from_args,
+)
+from prometheus_eaton_ups_exporter.exporter import (  # noqa: E402
+    AsyncUPSMultiExporter,
+    ProcessUPSMultiExporter,
+    UPSMultiExporter,
+)
+
+
+def exporter_options(args) -> dict:
+    """Options shared by all modes."""
+    return {
+        'insecure': bool(args.certfile),
+        'login_timeout': args.login_timeout,
+        'scrape_timeout': args.scrape_timeout,
+        'keepalive_idle': args.keepalive_idle,
+        'tls_session_resumption': args.tls_session_resumption,
+        'refresh_intervals': dict(args.refresh_interval or ()),
+    }
+
+
+def endpoint_interval(value: str) -> tuple[str, float]:
+    """Parse ENDPOINT=SECONDS."""
+    endpoint, _, seconds = value.partition('=')
+    return endpoint, float(seconds)
+
+
+def sequential(config: dict, args) -> UPSMultiExporter:
+    return UPSMultiExporter(config, **exporter_options(args))
+
+
+def threaded(config: dict, args) -> UPSMultiExporter:
+    return UPSMultiExporter(config, threading=True,
+                            scrape_workers=args.scrape_workers,
+                            **exporter_options(args))
+
+
+def asyncio(config: dict, args) -> UPSMultiExporter:
+    return AsyncUPSMultiExporter(config, concurrency=args.concurrency,
+                                 **exporter_options(args))
+
+
+def processes(config: dict, args) -> UPSMultiExporter:
+    return ProcessUPSMultiExporter(config, processes=args.processes,
+                                   scrape_workers=args.scrape_workers,
+                                   **exporter_options(args))
+
+
+# Scraping modes, by name. New modes only need to be added here.
+MODES: dict[str, Callable[[dict, object], UPSMultiExporter]] = {
+    'sequential': sequential,
+    'threaded': threaded,
+    'processes': processes,
+}
+if find_spec('aiohttp') is not None:
+    MODES['asyncio'] = asyncio
+
+
+def run_simulator(devices: int,
+                  settings,
+                  certfile: str | None,
+                  connection) -> None:
+    """Serve a Simulator until the connection receives a message."""
+    with Simulator(devices, settings=settings,
+                   certfile=certfile) as simulator:
+        connection.send(simulator.config())
+        connection.recv()
+        connection.send(simulator.counts())
+
+
+def percentile(values: list,
+               ratio: float) -> float:
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def worker_cpu_time(exporter: UPSMultiExporter) -> float:
+    """CPU seconds of the running worker processes of an exporter.
+
+    RUSAGE_CHILDREN only accounts children that exited, so the time is
+    read from /proc/<pid>/stat, 0 on systems without it.
+    """
+    cpu = 0.
+    for worker in getattr(exporter, 'workers', ()):
+        try:
+            with open(f"/proc/{worker.process.pid}/stat") as stat:
+                # after the command in parentheses, utime and stime in ticks
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) \
+            / os.sysconf('SC_CLK_TCK')
+    return cpu
+
+
+def cpu_time(exporter: UPSMultiExporter) -> float:
+    """CPU seconds of the exporter process and its worker processes."""
+    return time.process_time() + worker_cpu_time(exporter)
+
+
+def timed_collect(exporter: UPSMultiExporter) -> tuple[float, float]:
+    """Wall and CPU seconds of one collect()."""
+    wall, cpu = time.perf_counter(), cpu_time(exporter)
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        list(exporter.collect())
+    return time.perf_counter() - wall, cpu_time(exporter) - cpu
+
+
+def benchmark(factory: Callable[[dict, object], UPSMultiExporter],
+              config: dict,
+              args) -> dict:
+    """Collect args.rounds times after a cold collect, return statistics."""
+    exporter = factory(config, args)
+    try:
+        cold, _ = timed_collect(exporter)
+        walls, cpus, scraped = [], [], 0
+        for _ in range(args.rounds):
+            wall, cpu = timed_collect(exporter)
+            walls.append(wall)
+            cpus.append(cpu)
+            scraped += sum(exporter.scrape_success.values())
+    finally:
+        exporter.close()
+    return {
+        'cold': cold,
+        'p50': percentile(walls, 0.5),
+        'p99': percentile(walls, 0.99),
+        'throughput': scraped / sum(walls),
+        'cpu': statistics.mean(cpus),
+        'success': scraped / (args.rounds * len(config)),
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', '--devices', type=int, default=50)
+    parser.add_argument('-r', '--rounds', type=int, default=20,
+                        help='Measured collects per mode')
+    parser.add_argument('--mode', action='append', choices=sorted(MODES),
+                        help='Modes to benchmark, default all')
+    parser.add_argument('--login-timeout', type=int, default=3)
+    parser.add_argument('--scrape-timeout', type=float, default=None)
+    parser.add_argument('--scrape-workers', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--keepalive-idle', type=float, default=None)
+    parser.add_argument('--tls-session-resumption', action='store_true')
+    parser.add_argument('--refresh-interval', type=endpoint_interval,
+                        action='append', metavar='ENDPOINT=SECONDS')
+    parser.add_argument('--certfile', help='PEM file with a certificate and '
+                                           'its key, to simulate HTTPS')
+    settings_arguments(parser)
+    args = parser.parse_args()
+    settings = settings_from_args(args)
+
+    connection, child_connection = multiprocessing.Pipe()
+    simulator = multiprocessing.Process(
+        target=run_simulator,
+        args=(args.devices, settings, args.certfile, child_connection),
+        daemon=True
+    )
+    simulator.start()
+    config = connection.recv()
+
+    print(f"{args.devices} UPSs, {args.rounds} collects, {settings}")
+    print(f"{'mode':<12}{'cold s':>9}{'p50 s':>9}{'p99 s':>9}"
+          f"{'UPS/s':>9}{'CPU s':>9}{'success':>9}")
+    try:
+        for name in args.mode or MODES:
+            result = benchmark(MODES[name], config, args)
+            print(f"{name:<12}{result['cold']:>9.3f}{result['p50']:>9.3f}"
+                  f"{result['p99']:>9.3f}{result['throughput']:>9.1f}"
+                  f"{result['cpu']:>9.3f}{result['success']:>9.0%}")
+    finally:
+        connection.send('stop')
+        counts = connection.recv()
+        simulator.join()
+    print(f"simulator: {counts['logins']} logins, "
+          f"{counts['requests']} requests, {counts['failures']} failures")
+
+
+if __name__ == "__main__":
+    main()
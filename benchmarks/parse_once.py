@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark the decoding of UPS API responses per scrape.
+
+Replays the JSON pages of a recorded scrape (tests/cassettes) and compares
+the CPU time of handling them the way load_page and get_measures used to
+(json() twice, a text scan and json() once more per page) with UPSResponse,
+which decodes every page once (with orjson, if installed).
+
+    python benchmarks/parse_once.py [-n ITERATIONS]
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from importlib.util import find_spec
+
+import yaml
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from prometheus_eaton_ups_exporter.scraper import UPSResponse  # noqa: E402
+
+CASSETTE = os.path.join(
+    os.path.dirname(__file__), os.pardir,
+    'tests', 'cassettes', 'test_get_measures.yaml'
+)
+
+
+def recorded_pages(cassette: str) -> list:
+    """(headers, body) of all JSON pages GET during a recorded scrape."""
+    with open(cassette) as cassette_file:
+        interactions = yaml.safe_load(cassette_file)['interactions']
+    return [
+        (
+            CaseInsensitiveDict({
+                key: values[0]
+                for key, values in interaction['response']['headers'].items()
+            }),
+            interaction['response']['body']['string'].encode()
+        )
+        for interaction in interactions
+        if interaction['request']['method'] == 'GET'
+        and interaction['response']['status']['code'] == 200
+    ]
+
+
+def make_response(headers: CaseInsensitiveDict,
+                  body: bytes) -> Response:
+    """Build a requests.Response like requests does for a received page."""
+    response = Response()
+    response.status_code = 200
+    response.headers = headers
+    response.encoding = get_encoding_from_headers(headers)
+    response._content = body
+    return response
+
+
+def decode_repeatedly(response: Response):
+    """Handle a page as load_page and get_measures did before."""
+    try:
+        if "errorCode" in response.json() or "code" in response.json():
+            pass
+    except ValueError:
+        pass
+    if "Unauthorized" in response.text:
+        pass
+    return response.json()
+
+
+def decode_once(response: Response):
+    """Handle a page as load_page and get_measures do with UPSResponse."""
+    page = UPSResponse(response)
+    document = page.json()
+    if isinstance(document, dict) and (
+            "errorCode" in document or "code" in document):
+        pass
+    return page.json()
+
+
+def cpu_per_scrape(decode,
+                   pages: list,
+                   iterations: int) -> float:
+    """CPU seconds spent decoding all pages of one scrape."""
+    start = time.process_time()
+    for _ in range(iterations):
+        for headers, body in pages:
+            decode(make_response(headers, body))
+    return (time.process_time() - start) / iterations
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', '--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    pages = recorded_pages(CASSETTE)
+    before = cpu_per_scrape(decode_repeatedly, pages, args.iterations)
+    after = cpu_per_scrape(decode_once, pages, args.iterations)
+
+    backend = 'json' if find_spec('orjson') is None else 'orjson'
+    print(f"JSON backend:       {backend}")
+    print(f"pages per scrape:   {len(pages)}")
+    print(f"decode repeatedly:  {before * 1e6:8.1f} us CPU per scrape")
+    print(f"decode once:        {after * 1e6:8.1f} us CPU per scrape")
+    print(f"saved:              {(before - after) * 1e6:8.1f} us "
+          f"({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the REST API of Eaton Network-M2 cards.
+
+Serves the endpoints walked by UPSScraper (oauth2/token, powerDistributions,
+inputs, outputs, backupSystem, powerBank, the subsystems and the alarm log)
+for many virtual UPSs, one per
+port of a port range, with configurable latency, jitter, failure rate and
+token lifetime.
+
+    python benchmarks/simulator.py [-n DEVICES] [--port PORT] [--latency S]
+"""
+import json
+import random
+import secrets
+import ssl
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from typing import NamedTuple
+
+API_PATH = '/rest/mbdetnrs/1.0'
+LOGIN_PATH = API_PATH + '/oauth2/token'
+POWER_DIST_PATH = API_PATH + '/powerDistributions/1'
+ALARMS_PATH = API_PATH + '/managers/1/alarmService/alarms'
+# ids of the outlets of each UPS
+OUTLETS = ('1', '2')
+
+USERNAME = 'admin'
+PASSWORD = 'password'
+
+
+class SimulatorSettings(NamedTuple):
+    """Behaviour of the simulated UPSs.
+
+    :param latency: Seconds before each response
+    :param jitter: Maximum seconds added randomly to the latency
+    :param failure_rate: Probability of a request to fail
+    :param failure_mode: 'error' answers failing requests with HTTP 503,
+        'drop' closes the connection without a response
+    :param token_lifetime: Seconds until access tokens expire,
+        None issues tokens without expires_in that never expire
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    failure_mode: str = 'error'
+    token_lifetime: float | None = 900
+
+
+def measures_pages(ups_id: int) -> dict:
+    """Pages of the measurement endpoints, with slightly varying values."""
+    load = random.randint(5, 80)
+    return {
+        POWER_DIST_PATH + '/inputs/1': {
+            '@id': POWER_DIST_PATH + '/inputs/1',
+            'measures': {'realtime': {
+                'voltage': round(random.uniform(225, 235), 1),
+                'frequency': round(random.uniform(49.9, 50.1), 2),
+                'current': round(random.uniform(0, 10), 1),
+            }},
+        },
+        POWER_DIST_PATH + '/outputs/1': {
+            '@id': POWER_DIST_PATH + '/outputs/1',
+            'measures': {'realtime': {
+                'voltage': 230.0,
+                'frequency': 50.0,
+                'current': round(load / 10, 1),
+                'apparentPower': load * 30,
+                'activePower': load * 27,
+                'powerFactor': 0.9,
+                'percentLoad': load,
+            }},
+        },
+        POWER_DIST_PATH + '/backupSystem/powerBank': {
+            '@id': POWER_DIST_PATH + '/backupSystem/powerBank',
+            'measures': {
+                'voltage': round(random.uniform(54, 55), 1),
+                'remainingChargeCapacity': 100,
+                'remainingTime': 36000 // load,
+            },
+            'status': {'health': ups_id % 7},
+        },
+        **{
+            POWER_DIST_PATH + f'/{subsystem}/1': {
+                '@id': POWER_DIST_PATH + f'/{subsystem}/1',
+                'measures': {'realtime': {
+                    'voltage': 230.0,
+                    'frequency': 50.0,
+                    'current': round(load / 10, 1),
+                }},
+            }
+            for subsystem in ('bypass', 'chargers', 'inverters', 'rectifiers')
+        },
+        POWER_DIST_PATH + '/avr': {
+            '@id': POWER_DIST_PATH + '/avr',
+            'status': {'operating': 16, 'health': 5},
+        },
+        **{
+            POWER_DIST_PATH + f'/outlets/{outlet}': {
+                '@id': POWER_DIST_PATH + f'/outlets/{outlet}',
+                'measures': {'realtime': {
+                    'current': round(load / 20, 1),
+                    'apparentPower': load * 15,
+                    'activePower': load * 13,
+                    'powerFactor': 0.9,
+                }},
+                'status': {'switchedOn': True},
+            }
+            for outlet in OUTLETS
+        },
+    }
+
+
+def static_pages(ups_id: int) -> dict:
+    """Pages used to discover the measurement endpoints."""
+    return {
+        POWER_DIST_PATH: {
+            '@id': POWER_DIST_PATH,
+            'id': str(ups_id),
+            'inputs': {'@id': POWER_DIST_PATH + '/inputs'},
+            'outputs': {'@id': POWER_DIST_PATH + '/outputs'},
+            'backupSystem': {'@id': POWER_DIST_PATH + '/backupSystem'},
+            'bypass': {'@id': POWER_DIST_PATH + '/bypass'},
+            'chargers': {'@id': POWER_DIST_PATH + '/chargers'},
+            'inverters': {'@id': POWER_DIST_PATH + '/inverters'},
+            'rectifiers': {'@id': POWER_DIST_PATH + '/rectifiers'},
+            'avr': {'@id': POWER_DIST_PATH + '/avr'},
+            'outlets': {
+                'members@count': len(OUTLETS),
+                'members': [
+                    {'@id': POWER_DIST_PATH + f'/outlets/{outlet}'}
+                    for outlet in OUTLETS
+                ],
+            },
+        },
+        POWER_DIST_PATH + '/backupSystem': {
+            '@id': POWER_DIST_PATH + '/backupSystem',
+            'powerBank': {'@id': POWER_DIST_PATH + '/backupSystem/powerBank'},
+        },
+    }
+
+
+class VirtualUPS(ThreadingHTTPServer):
+    """A simulated UPS listening on its own port.
+
+    :param port: Port to listen on, 0 picks a free one
+    :param ups_id: Id of the power distribution
+    :param settings: SimulatorSettings
+    :param ssl_context: Serve HTTPS with this server side context
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 port: int,
+                 ups_id: int,
+                 settings: SimulatorSettings,
+                 ssl_context: ssl.SSLContext | None = None) -> None:
+        super().__init__(('127.0.0.1', port), UPSRequestHandler)
+        self.scheme = 'http'
+        if ssl_context is not None:
+            self.scheme = 'https'
+            # handshake in the thread of the request, not in accept()
+            self.socket = ssl_context.wrap_socket(
+                self.socket, server_side=True, do_handshake_on_connect=False
+            )
+        self.ups_id = ups_id
+        self.settings = settings
+        # access token -> time.monotonic() of its expiry, None for never
+        self.tokens: dict[str, float | None] = {}
+        self.counts = {'logins': 0, 'requests': 0, 'failures': 0}
+        # events of the alarm log, see log_alarm
+        self.alarms: list[dict] = []
+        # False answers the alarm log with 404, like cards without one
+        self.alarm_log = True
+        self._lock = threading.Lock()
+
+    @property
+    def address(self) -> str:
+        """Address of the UPS, as given in the exporter's configuration."""
+        return f"{self.scheme}://127.0.0.1:{self.server_address[1]}"
+
+    def count(self,
+              key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def issue_token(self) -> dict:
+        """Create an access token, as answered by oauth2/token."""
+        token = secrets.token_hex(16)
+        lifetime = self.settings.token_lifetime
+        self.tokens[token] = (
+            None if lifetime is None else time.monotonic() + lifetime
+        )
+        self.count('logins')
+        response: dict = {'token_type': 'Bearer', 'access_token': token}
+        if lifetime is not None:
+            response['expires_in'] = lifetime
+        return response
+
+    def valid_token(self,
+                    authorization: str | None) -> bool:
+        """Whether the Authorization header holds an unexpired token."""
+        if not authorization or ' ' not in authorization:
+            return False
+        token = authorization.split(' ', 1)[1]
+        if token not in self.tokens:
+            return False
+        expires = self.tokens[token]
+        if expires is not None and time.monotonic() >= expires:
+            self.tokens.pop(token, None)
+            return False
+        return True
+
+    def log_alarm(self,
+                  code: str,
+                  level: str = 'warning',
+                  active: bool = True) -> None:
+        """Add an event raising, or clearing, an alarm to the alarm log."""
+        with self._lock:
+            self.alarms.append({
+                'id': len(self.alarms) + 1,
+                'code': code,
+                'level': level,
+                'status': {'active': active},
+            })
+
+    def clear_alarms(self) -> None:
+        """Empty the alarm log, like a restart of the card."""
+        with self._lock:
+            self.alarms = []
+
+    def alarm_page(self,
+                   query: str) -> dict:
+        """Page of the alarm log, filtered like the query of AlarmLog.url."""
+        params = parse_qs(query)
+        first = 0
+        for condition in params.get('$filter', []):
+            field, operator, value = condition.split()
+            if (field, operator) == ('id', 'gt'):
+                first = int(value) + 1
+            elif (field, operator) == ('id', 'ge'):
+                first = int(value)
+        with self._lock:
+            members = [alarm for alarm in self.alarms if alarm['id'] >= first]
+        if '$top' in params:
+            members = members[:int(params['$top'][0])]
+        return {'@id': ALARMS_PATH, 'members': members}
+
+    def page(self,
+             path: str) -> dict | None:
+        """Content of an API page, None if there is no such page."""
+        url = urlsplit(path)
+        if url.path == ALARMS_PATH:
+            return self.alarm_page(url.query) if self.alarm_log else None
+        pages = static_pages(self.ups_id)
+        if path in pages:
+            return pages[path]
+        return measures_pages(self.ups_id).get(path)
+
+
+class UPSRequestHandler(BaseHTTPRequestHandler):
+    """Answer requests to a VirtualUPS like a Network-M2 card."""
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+    server: VirtualUPS  # pyre-ignore[13]: set by socketserver
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def send_json(self,
+                  status: int,
+                  document: dict) -> None:
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate_network(self) -> bool:
+        """Delay the response, return False if the request fails."""
+        settings = self.server.settings
+        self.server.count('requests')
+        delay = settings.latency + random.uniform(0, settings.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() >= settings.failure_rate:
+            return True
+
+        self.server.count('failures')
+        if settings.failure_mode == 'drop':
+            self.close_connection = True
+        else:
+            body = b'<html><body>Service Unavailable</body></html>'
+            self.send_response(503)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        return False
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if not self.simulate_network():
+            return
+        if self.path != LOGIN_PATH:
+            self.send_json(404, {'code': 'notFound'})
+            return
+        try:
+            credentials = json.loads(body)
+        except ValueError:
+            credentials = {}
+        if (credentials.get('username'), credentials.get('password')) != \
+                (USERNAME, PASSWORD):
+            self.send_json(400, {
+                'code': 'invalid_grant',
+                'description': 'Invalid username or password',
+            })
+            return
+        self.send_json(200, self.server.issue_token())
+
+    def do_GET(self) -> None:
+        if not self.simulate_network():
+            return
+        if not self.server.valid_token(self.headers.get('Authorization')):
+            self.send_json(401, {
+                'errorCode': 'unauthorized',
+                'description': 'Invalid or expired access token',
+            })
+            return
+        page = self.server.page(self.path)
+        if page is None:
+            self.send_json(404, {'code': 'notFound'})
+            return
+        self.send_json(200, page)
+
+
+class Simulator:
+    """A fleet of VirtualUPSs on consecutive ports, served by threads.
+
+    :param devices: Number of virtual UPSs
+    :param port: First port of the range, 0 picks free ports
+    :param settings: SimulatorSettings shared by all UPSs
+    :param certfile: PEM file with the certificate and key to serve HTTPS,
+        None serves HTTP
+    """
+    def __init__(self,
+                 devices: int,
+                 port: int = 0,
+                 settings: SimulatorSettings = SimulatorSettings(),
+                 certfile: str | None = None) -> None:
+        ssl_context = None
+        if certfile:
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(certfile)
+        self.servers = [
+            VirtualUPS(
+                port + index if port else 0, index + 1, settings, ssl_context
+            )
+            for index in range(devices)
+        ]
+        self._threads: list[threading.Thread] = []
+
+    def config(self) -> dict:
+        """Configuration of the exporter for all virtual UPSs."""
+        return {
+            f"ups{server.ups_id}": {
+                'address': server.address,
+                'user': USERNAME,
+                'password': PASSWORD,
+            }
+            for server in self.servers
+        }
+
+    def counts(self) -> dict:
+        """Logins, requests and failures summed over all virtual UPSs."""
+        totals = {'logins': 0, 'requests': 0, 'failures': 0}
+        for server in self.servers:
+            for key, value in server.counts.items():
+                totals[key] += value
+        return totals
+
+    def start(self) -> None:
+        for server in self.servers:
+            thread = threading.Thread(
+                target=server.serve_forever,
+                name=f"VirtualUPS-{server.ups_id}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self) -> 'Simulator':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def settings_arguments(parser: ArgumentParser) -> None:
+    """Add the options of SimulatorSettings to a parser."""
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds before each response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximum random seconds added to the latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Probability of a request to fail')
+    parser.add_argument('--failure-mode', choices=['error', 'drop'],
+                        default='error',
+                        help='Answer failing requests with HTTP 503 or '
+                             'close the connection')
+    parser.add_argument('--token-lifetime', type=float, default=900,
+                        help='Seconds until access tokens expire, '
+                             '0 for tokens without expiry')
+
+
+def settings_from_args(args) -> SimulatorSettings:
+    return SimulatorSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        failure_mode=args.failure_mode,
+        token_lifetime=args.token_lifetime or None,
+    )
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', '--devices', type=int, default=10)
+    parser.add_argument('--port', type=int, default=18000,
+                        help='First port of the range, 0 picks free ports')
+    parser.add_argument('--config', help='Write the exporter configuration '
+                                         'for the virtual UPSs to this file')
+    parser.add_argument('--certfile', help='PEM file with a certificate and '
+                                           'its key, to serve HTTPS')
+    settings_arguments(parser)
+    args = parser.parse_args()
+
+    simulator = Simulator(args.devices, args.port, settings_from_args(args),
+                          args.certfile)
+    if args.config:
+        with open(args.config, 'w') as config_file:
+            json.dump(simulator.config(), config_file, indent=2)
+    print(f"Serving {args.devices} virtual UPSs on "
+          f"{simulator.servers[0].address} ... "
+          f"{simulator.servers[-1].address}")
+    with simulator:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
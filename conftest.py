@@ -1,5 +1,7 @@
 import os
 import json
+import shutil
+import subprocess
 
 import pytest
 
@@ -25,3 +27,22 @@ def ups_scraper_conf():
         print(err)
 
     return config
+
+
+@pytest.fixture(scope='session')
+def certfile(tmp_path_factory):
+    """Self-signed certificate and key of 127.0.0.1 in one PEM file."""
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is required to create a certificate')
+    path = tmp_path_factory.mktemp('tls')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+         '-keyout', str(path / 'key.pem'), '-out', str(path / 'cert.pem'),
+         '-days', '1', '-subj', '/CN=127.0.0.1'],
+        check=True, capture_output=True
+    )
+    certfile = path / 'certfile.pem'
+    certfile.write_text(
+        (path / 'key.pem').read_text() + (path / 'cert.pem').read_text()
+    )
+    return str(certfile)
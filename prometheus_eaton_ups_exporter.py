@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 """Prometheus exporter for single or multiple Eaton UPSs."""
+import signal
 import sys
 import time
 import traceback
@@ -7,6 +8,7 @@ from typing import Tuple
 from argparse import (
     Action,
     ArgumentParser,
+    ArgumentTypeError,
     HelpFormatter,
     Namespace,
     OPTIONAL,
@@ -14,9 +16,25 @@ from argparse import (
     ZERO_OR_MORE
     )
 
-from prometheus_client import start_http_server, REGISTRY
-from prometheus_eaton_ups_exporter.scraper_globals import REQUEST_TIMEOUT
-from prometheus_eaton_ups_exporter.exporter import UPSMultiExporter
+from prometheus_client import REGISTRY
+from prometheus_eaton_ups_exporter.scraper_globals import (
+    BREAKER_MAX_BACKOFF,
+    BREAKER_THRESHOLD,
+    ENDPOINTS,
+    REQUEST_TIMEOUT
+    )
+from prometheus_eaton_ups_exporter.exporter import (
+    AsyncUPSMultiExporter,
+    ProcessUPSMultiExporter,
+    UPSMultiExporter
+    )
+from prometheus_eaton_ups_exporter.instrumentation import ExporterCollector
+from prometheus_eaton_ups_exporter.server import (
+    IDLE_TIMEOUT,
+    PrerenderedExposition,
+    start_http_server
+    )
+from prometheus_eaton_ups_exporter.subsystems import SUBSYSTEMS
 
 DEFAULT_PORT = 9795
 DEFAULT_HOST = "0.0.0.0"
@@ -74,6 +92,13 @@ def create_parser() -> ArgumentParser:
              'If the IP is omitted, the exporter listens on all interfaces.',
         default=f"{DEFAULT_HOST}:{DEFAULT_PORT}"
     )
+    parser.add_argument(
+        '--web.idle-timeout',
+        type=float,
+        help='Close HTTP connections idle for N seconds, '
+             'keep it above the scrape interval of Prometheus',
+        default=IDLE_TIMEOUT
+    )
     parser.add_argument(
         "-c", "--config",
         help="Configuration JSON file containing "
@@ -93,6 +118,34 @@ def create_parser() -> ArgumentParser:
         help='Whether to use multi-threading for scraping (faster)',
         default=False
     )
+    parser.add_argument(
+        '--scrape-workers',
+        type=int,
+        help='Number of threads scraping the UPSs with --threading, '
+             'or per process with --processes.\n'
+             'By default, one thread per UPS',
+        default=None
+    )
+    parser.add_argument(
+        '-a', '--asyncio',
+        action='store_true',
+        help='Scrape all UPSs from a single asyncio event loop '
+             '(requires aiohttp, for large numbers of UPSs)',
+        default=False
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        help='Maximum number of UPSs scraped at the same time with --asyncio',
+        default=100
+    )
+    parser.add_argument(
+        '-p', '--processes',
+        type=int,
+        help='Split the UPSs across N worker processes, each scraping its '
+             'UPSs with threads, to use N cores',
+        default=None
+    )
     parser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -106,9 +159,222 @@ def create_parser() -> ArgumentParser:
         choices=[Range(REQUEST_TIMEOUT, 10)],
         default=3
     )
+    parser.add_argument(
+        '--polling-interval',
+        type=float,
+        help='Poll the UPSs in the background every N seconds and serve '
+             'scrapes from the latest measures.\n'
+             'By default, the UPSs are scraped on every request',
+        default=None
+    )
+    parser.add_argument(
+        '--discovery-ttl',
+        type=float,
+        help='Seconds to cache the discovered API links of the UPSs for.\n'
+             'By default, they are cached until the UPS API changes',
+        default=None
+    )
+    parser.add_argument(
+        '--device-concurrency',
+        type=int,
+        help='Maximum number of parallel requests per UPS, '
+             'once its API links are known',
+        default=1
+    )
+    parser.add_argument(
+        '--scrape-timeout',
+        type=float,
+        help='Deadline per UPS for a whole scrape, including login and '
+             'requests, in seconds.\n'
+             'UPSs missing it are reported by eaton_ups_scrape_success',
+        default=None
+    )
+    parser.add_argument(
+        '--token-refresh-margin',
+        type=float,
+        help='Renew the access tokens of the UPSs in the background, '
+             'N seconds before they expire.\n'
+             'By default, tokens are renewed during scrapes',
+        default=None
+    )
+    parser.add_argument(
+        '--state-file',
+        help='File to keep the access tokens and API links of the UPSs in, '
+             'so that a restarted exporter does not need to login again.\n'
+             'It is only readable by its owner',
+        default=None
+    )
+    parser.add_argument(
+        '--breaker-threshold',
+        type=int,
+        help='Skip the scrapes of a UPS after N consecutive connection '
+             'errors or timeouts,\n'
+             'retrying with an exponential backoff. 0 disables it',
+        default=BREAKER_THRESHOLD
+    )
+    parser.add_argument(
+        '--breaker-max-backoff',
+        type=float,
+        help='Maximum seconds to skip the scrapes of an unreachable UPS',
+        default=BREAKER_MAX_BACKOFF
+    )
+    parser.add_argument(
+        '--pool-size',
+        type=int,
+        help='Maximum number of connections kept open per UPS.\n'
+             'By default, 10 or --device-concurrency if higher',
+        default=None
+    )
+    parser.add_argument(
+        '--keepalive-idle',
+        type=float,
+        help='Close connections to a UPS idle for N seconds, '
+             'before the UPS drops them.\n'
+             'By default, connections are kept open until the UPS closes them',
+        default=None
+    )
+    parser.add_argument(
+        '--tls-session-resumption',
+        action='store_true',
+        help='Resume the TLS sessions of earlier connections to a UPS, '
+             'instead of full handshakes',
+        default=False
+    )
+    parser.add_argument(
+        '--prewarm',
+        action='store_true',
+        help='Login to all UPSs and discover their API links at startup, '
+             'one after the other unless --threading, --asyncio or '
+             '--processes.\n'
+             '/ready answers 503 until this finished',
+        default=False
+    )
+    parser.add_argument(
+        '--prewarm-timeout',
+        type=float,
+        help='Wait up to N seconds for the pre-warm before starting the '
+             'HTTP server (implies --prewarm)',
+        default=None
+    )
+    parser.add_argument(
+        '--shard-index',
+        type=int,
+        help='Index of this exporter among --shard-count exporters sharing '
+             'the config, it only scrapes the UPSs of its shard',
+        default=0
+    )
+    parser.add_argument(
+        '--shard-count',
+        type=int,
+        help='Number of exporters sharing the config.\n'
+             'The UPSs are spread by rendezvous hashing of their names, '
+             'changing the count only moves few of them',
+        default=1
+    )
+    parser.add_argument(
+        '--config-watch-interval',
+        type=float,
+        help='Check the config file every N seconds and reload it when it '
+             'changed, keeping the sessions of unchanged UPSs.\n'
+             'The config is also reloaded on SIGHUP',
+        default=None
+    )
+    parser.add_argument(
+        '--scrape-cache-ttl',
+        type=float,
+        help='Serve requests for N seconds from the last scrape of the UPSs.\n'
+             'Concurrent requests always share a single scrape',
+        default=None
+    )
+    parser.add_argument(
+        '--refresh-interval',
+        type=endpoint_interval,
+        action='append',
+        metavar='ENDPOINT=SECONDS',
+        help='Load a measurement endpoint of the UPSs only every N seconds, '
+             'e.g. powerbank=3600,\n'
+             'scrapes in between reuse its last response. '
+             f'Endpoints: {", ".join(ENDPOINTS)}.\n'
+             'May be repeated, by default all are loaded on every scrape',
+        default=None
+    )
+    parser.add_argument(
+        '--prerender',
+        action='store_true',
+        help='Render the metrics once per poll (requires --polling-interval) '
+             'and serve the cached text, or its gzip variant, to all '
+             'requests',
+        default=False
+    )
+    parser.add_argument(
+        '--alarms',
+        action='store_true',
+        help='Also read the new events of the alarm log of the UPSs on '
+             'each scrape,\n'
+             'exported as active alarms and event counters by severity '
+             'and code',
+        default=False
+    )
+    parser.add_argument(
+        '--collector',
+        action='append',
+        choices=list(SUBSYSTEMS),
+        metavar='NAME',
+        help='Also export a subsystem of the UPSs, may be repeated. '
+             f'Subsystems: {", ".join(SUBSYSTEMS)}.\n'
+             'Enabled per UPS by a "collectors" list in its config entry, '
+             'disabled ones cost no request',
+        default=None
+    )
+    parser.add_argument(
+        '--sampling-interval',
+        type=float,
+        help='Sample the inputs and outputs of the UPSs every N seconds, '
+             'e.g. 0.5,\n'
+             'and export the min, max, mean and last value of the samples '
+             'of the last --sampling-window seconds',
+        default=None
+    )
+    parser.add_argument(
+        '--sampling-window',
+        type=float,
+        help='Seconds of samples aggregated per request',
+        default=30.
+    )
+    parser.add_argument(
+        '--sampled-ups',
+        action='append',
+        metavar='NAME',
+        help='Name of a UPS of the config to sample, may be repeated.\n'
+             'By default all UPSs are sampled',
+        default=None
+    )
+    parser.add_argument(
+        '--probe-only',
+        action='store_true',
+        help='Scrape the UPSs only on /probe?target=<UPS name>, '
+             'one UPS per request.\n'
+             '/metrics then only serves the metrics of the exporter itself, '
+             'the UPSs are not polled or sampled in the background',
+        default=False
+    )
     return parser
 
 
+def endpoint_interval(value: str) -> Tuple[str, float]:
+    """Parse ENDPOINT=SECONDS of --refresh-interval."""
+    endpoint, _, seconds = value.partition('=')
+    if endpoint not in ENDPOINTS:
+        raise ArgumentTypeError(
+            f"unknown endpoint {endpoint!r}, "
+            f"choose from {', '.join(ENDPOINTS)}"
+        )
+    try:
+        return endpoint, float(seconds)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid seconds {seconds!r}")
+
+
 def split_listen_address(listen_address: str) -> Tuple[str, int]:
     """Split listen address into host and port."""
     if ':' in listen_address:
@@ -130,29 +396,111 @@ def run(args: Namespace) -> None:
     parser = create_parser()
     args = parser.parse_args(args)
 
+    if args.probe_only:
+        # each probe scrapes its UPS, nothing runs in the background
+        for option in ('polling_interval', 'sampling_interval'):
+            if getattr(args, option):
+                parser.error(
+                    f"--{option.replace('_', '-')} is not supported with "
+                    "--probe-only"
+                )
+    if args.prerender and not args.polling_interval:
+        parser.error("--prerender requires --polling-interval")
+    if args.processes and args.sampling_interval:
+        parser.error("--sampling-interval is not supported with --processes")
+    if args.token_refresh_margin is not None \
+            and args.token_refresh_margin <= 0:
+        parser.error("--token-refresh-margin must be positive")
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+
     listen_address = args.__getattribute__('web.listen_address')
+    idle_timeout = args.__getattribute__('web.idle_timeout')
     host_address, port = split_listen_address(listen_address)
 
-    REGISTRY.register(
-        UPSMultiExporter(
+    # options of all scraping modes
+    options = dict(
+        insecure=args.insecure,
+        verbose=args.verbose,
+        login_timeout=args.login_timeout,
+        polling_interval=args.polling_interval,
+        discovery_ttl=args.discovery_ttl,
+        device_concurrency=args.device_concurrency,
+        scrape_timeout=args.scrape_timeout,
+        token_refresh_margin=args.token_refresh_margin,
+        state_file=args.state_file,
+        breaker_threshold=args.breaker_threshold,
+        breaker_max_backoff=args.breaker_max_backoff,
+        pool_size=args.pool_size,
+        keepalive_idle=args.keepalive_idle,
+        tls_session_resumption=args.tls_session_resumption,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        config_watch_interval=args.config_watch_interval,
+        scrape_cache_ttl=args.scrape_cache_ttl,
+        refresh_intervals=dict(args.refresh_interval or ()),
+        alarms=args.alarms,
+        collectors=args.collector,
+        sampling_interval=args.sampling_interval,
+        sampling_window=args.sampling_window,
+        sampled_devices=args.sampled_ups
+    )
+    if args.processes:
+        exporter = ProcessUPSMultiExporter(
+            args.config,
+            processes=args.processes,
+            scrape_workers=args.scrape_workers,
+            **options
+        )
+    elif args.asyncio:
+        exporter = AsyncUPSMultiExporter(
+            args.config,
+            concurrency=args.concurrency,
+            **options
+        )
+    else:
+        exporter = UPSMultiExporter(
             args.config,
-            insecure=args.insecure,
-            verbose=args.verbose,
             threading=args.threading,
-            login_timeout=args.login_timeout
+            scrape_workers=args.scrape_workers,
+            **options
         )
-    )
+    if not args.probe_only:
+        REGISTRY.register(exporter)
+    # after the exporter, to report the duration of its collect()
+    REGISTRY.register(ExporterCollector(exporter))
+
+    prerendered = None
+    if args.prerender:
+        prerendered = PrerenderedExposition(REGISTRY)
+        exporter.poller.subscribe(prerendered.render)
+        # in case the first poll already finished
+        prerendered.render()
+
+    if args.prewarm or args.prewarm_timeout is not None:
+        print(f"Pre-warming {len(exporter.ups_devices)} UPSs")
+        if not exporter.start_prewarm(args.prewarm_timeout) \
+                and args.prewarm_timeout is not None:
+            print(f"Pre-warm not finished after {args.prewarm_timeout} "
+                  "seconds, continuing in the background")
+
     # Start up the server to expose the metrics.
     print(f"Starting Prometheus Eaton UPS Exporter on {host_address}:{port}")
     try:
-        start_http_server(port=int(port), addr=host_address)
+        start_http_server(int(port), host_address, exporter,
+                          prerendered=prerendered, idle_timeout=idle_timeout)
     except OSError as err:
         if args.verbose:
             print(traceback.format_exc())
         else:
             print(err)
+        exporter.close()
         sys.exit(1)
 
+    # Handle termination like a Keyboard Interrupt
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    signal.signal(signal.SIGHUP, lambda signum, frame: exporter.reload())
+
     # Run forever until an Error Event or Keyboard Interrupt
     try:
         while True:
@@ -161,6 +509,8 @@ def run(args: Namespace) -> None:
     except KeyboardInterrupt:
         print("Prometheus Eaton UPS Exporter shut down")
         sys.exit(0)
+    finally:
+        exporter.close()
 
 
 def main() -> None:
@@ -0,0 +1,144 @@
+"""Incremental collection of the alarm log of a UPS."""
+import threading
+
+from urllib.parse import urlencode
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from typing import Iterable, Tuple
+
+# Alarm log of the Network-M2 card, members ordered by increasing id.
+# Assumed from the layout of the other mbdetnrs resources, it is not part
+# of the links discovered from the powerDistributions document. UPSs
+# answering 404 are exported without alarms.
+ALARMS_PATH = '/rest/mbdetnrs/1.0/managers/1/alarmService/alarms'
+# Maximum number of alarm events per request
+ALARM_PAGE_SIZE = 100
+
+# Key of the alarms in the measures of a UPS, see AlarmLog.snapshot
+ALARMS = 'ups_alarms'
+
+
+class AlarmLog:
+    """Cursor and state of the alarm log of a single UPS.
+
+    Each cycle only requests the events from the last one seen on, so the
+    cost per scrape does not grow with the log. Every event raises or
+    clears the alarm of its code, the latest event of a code decides
+    whether it is active.
+
+    If the last event seen is gone, the log was reset, e.g. by a restart
+    of the card, and is read again from its start. The event counts are
+    kept, the active alarms are those of the new log.
+
+    A card ignoring the filter of the query answers the oldest events of
+    the log. Once the log outgrows a page, the later events cannot be
+    read, the log is then marked unfiltered and no longer collected.
+
+    :param page_size: int
+        Maximum number of events per request
+    """
+    def __init__(self,
+                 page_size: int = ALARM_PAGE_SIZE) -> None:
+        self.page_size = page_size
+        # id of the last event seen, 0 before the first cycle
+        self.cursor = 0
+        # code -> severity of the active alarms
+        self.active: dict[str, str] = {}
+        # (severity, code) -> number of events seen
+        self.events: dict[Tuple[str, str], int] = {}
+        # whether the card ignores the filter of url(), see apply
+        self.unfiltered = False
+        # held by the cycle in progress, see UPSScraper.load_alarms
+        self.lock = threading.Lock()
+
+    def url(self,
+            ups_address: str) -> str:
+        """URL of the next events of the log, and of the last one seen."""
+        query = urlencode({
+            '$filter': f'id ge {self.cursor}',
+            '$orderby': 'id',
+            '$top': self.page_size,
+        })
+        return f"{ups_address}{ALARMS_PATH}?{query}"
+
+    def apply(self,
+              page: dict) -> bool:
+        """Account the new events of a page of the log.
+
+        Events up to the cursor are ignored, a card ignoring the filter
+        of the query answers them too.
+
+        :param page: Page of the alarm log, as loaded from url()
+        :return: whether more events may follow
+        :raises ValueError: if the card ignores the filter and the new
+            events are beyond the page, see unfiltered
+        """
+        members = page['members']
+        if len(members) >= self.page_size and any(
+                member['id'] < self.cursor for member in members):
+            # no filtered page holds older events than the cursor
+            self.unfiltered = True
+            raise ValueError(
+                "The alarm log ignores the filter of the query, "
+                "its events beyond the first page cannot be read"
+            )
+        if self.cursor and not any(
+                member['id'] == self.cursor for member in members):
+            # the last event seen is gone, read the new log from its start
+            self.cursor = 0
+            self.active.clear()
+            return True
+        new = sorted(
+            (member for member in members if member['id'] > self.cursor),
+            key=lambda member: member['id']
+        )
+        for member in new:
+            code = str(member['code'])
+            severity = str(member.get('level', 'unknown'))
+            key = (severity, code)
+            self.events[key] = self.events.get(key, 0) + 1
+            if member['status']['active']:
+                self.active[code] = severity
+            else:
+                self.active.pop(code, None)
+            self.cursor = member['id']
+        return bool(new) and len(members) >= self.page_size
+
+    def snapshot(self) -> dict:
+        """Active alarms and event counts, to add to the measures."""
+        return {
+            'active': dict(self.active),
+            'events': dict(self.events),
+        }
+
+
+def alarm_families(
+        ups_data: Iterable[dict]
+) -> list[GaugeMetricFamily | CounterMetricFamily]:
+    """Create the alarm metrics of the UPSs with alarm collection.
+
+    :param ups_data: Measures as returned by UPSScraper.get_measures
+    :return: no families if no UPS has alarms in its measures
+    """
+    alarms = [
+        (measures['ups_id'], measures[ALARMS])
+        for measures in ups_data if measures and ALARMS in measures
+    ]
+    if not alarms:
+        return []
+    active = GaugeMetricFamily(
+        "eaton_ups_alarm_active",
+        'Alarms of the UPS that are currently active',
+        labels=['ups_id', 'severity', 'code']
+    )
+    events = CounterMetricFamily(
+        "eaton_ups_alarm_events",
+        'Events read from the alarm log of the UPS, by severity and code',
+        labels=['ups_id', 'severity', 'code']
+    )
+    for ups_id, snapshot in alarms:
+        for code, severity in sorted(snapshot['active'].items()):
+            active.add_metric([ups_id, severity, code], 1)
+        for (severity, code), count in sorted(snapshot['events'].items()):
+            events.add_metric([ups_id, severity, code], count)
+    return [active, events]
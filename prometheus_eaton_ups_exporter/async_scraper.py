@@ -0,0 +1,640 @@
+"""asyncio based REST API web scraper for Eaton UPS measure data.
+
+Requires the optional aiohttp dependency (pip install .[async]).
+"""
+import asyncio
+import json
+import time
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from prometheus_eaton_ups_exporter import create_logger
+from prometheus_eaton_ups_exporter.alarms import ALARMS, AlarmLog
+from prometheus_eaton_ups_exporter.breaker import CLOSED, CircuitBreaker
+from prometheus_eaton_ups_exporter.instrumentation import (
+        ScrapeStats,
+        endpoint_phase,
+        )
+from prometheus_eaton_ups_exporter.schedule import EndpointSchedule
+from prometheus_eaton_ups_exporter.scraper import (
+        is_endpoint_page,
+        is_measures_page,
+        json_loads,
+        resolve_links,
+        token_expiry,
+        )
+from prometheus_eaton_ups_exporter.scraper_globals import (
+        AUTHENTICATION_FAILED,
+        BREAKER_MAX_BACKOFF,
+        BREAKER_THRESHOLD,
+        CERTIFICATE_VERIFY_FAILED,
+        CONNECTION_ERROR,
+        INVALID_URL_ERROR,
+        LOGIN_AUTH_PATH,
+        LOGIN_DATA,
+        LoginFailedException,
+        MISSING_SCHEMA_ERROR,
+        REALTIME_LINKS,
+        REQUEST_TIMEOUT,
+        REST_API_PATH,
+        SSL_ERROR,
+        TIMEOUT_ERROR,
+        )
+from prometheus_eaton_ups_exporter.subsystems import (
+        enabled_collectors,
+        subsystem_links,
+        )
+from prometheus_eaton_ups_exporter.transport import (
+        ResumingSSLContext,
+        create_ssl_context,
+        default_pool_size,
+        )
+from typing import Iterable, Tuple
+
+
+class AsyncUPSScraper:
+    """
+    Create an asyncio UPS Scraper based on the Eaton UPS's API.
+
+    Behaves like UPSScraper, but all requests are coroutines, so that a
+    single event loop can scrape many UPSs at the same time.
+
+    :param ups_address: str
+        Address to a UPS, either an IP address or a DNS hostname
+    :param authentication: (username: str, password: str)
+        Username and password for the web UI of the UPS
+    :param name: str
+        Name of the UPS.
+        Used as identifier to differentiate between multiple UPSs.
+    :param insecure: bool
+        Whether to connect to UPSs with self-signed SSL certificates
+    :param verbose: bool
+        Allow logging output for development
+    :param login_timeout: float
+        Login timeout for authentication
+    :param discovery_ttl: float | None
+        Seconds to cache the discovered API links for,
+        None caches them until they become invalid
+    :param device_concurrency: int
+        Maximum number of parallel requests to the UPS once the API links
+        are known, 1 loads the measurement endpoints sequentially
+    :param session: aiohttp.ClientSession | None
+        Session to share with other scrapers, created on first use if None
+    :param breaker_threshold: int
+        Consecutive connection errors or timeouts after which scrapes are
+        skipped for an exponential backoff, 0 disables the circuit breaker
+    :param breaker_max_backoff: float
+        Maximum seconds to skip scrapes while the UPS is unreachable
+    :param pool_size: int | None
+        Maximum number of connections kept open to the UPS,
+        None keeps up to max(10, device_concurrency) connections
+    :param keepalive_idle: float | None
+        Seconds after which idle connections to the UPS are closed,
+        None keeps them open until the UPS closes them
+    :param tls_session_resumption: bool
+        Whether new connections resume the TLS session of earlier ones
+    :param refresh_intervals: dict[str, float] | None
+        Seconds between two loads of a measurement endpoint, by endpoint
+        (inputs, outputs, powerbank), others are loaded on every scrape
+    :param alarms: bool
+        Whether each scrape also reads the new events of the alarm log
+    :param collectors: Iterable[str]
+        Subsystems to load on each scrape besides the measurement
+        endpoints, see SUBSYSTEMS
+    """
+    def __init__(self,
+                 ups_address: str,
+                 authentication: Tuple[str, str],
+                 name: str | None = None,
+                 insecure: bool = False,
+                 verbose: bool = False,
+                 login_timeout: int = 3,
+                 discovery_ttl: float | None = None,
+                 device_concurrency: int = 1,
+                 session=None,
+                 breaker_threshold: int = BREAKER_THRESHOLD,
+                 breaker_max_backoff: float = BREAKER_MAX_BACKOFF,
+                 pool_size: int | None = None,
+                 keepalive_idle: float | None = None,
+                 tls_session_resumption: bool = False,
+                 refresh_intervals: dict[str, float] | None = None,
+                 alarms: bool = False,
+                 collectors: Iterable[str] = ()) -> None:
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncUPSScraper requires aiohttp, "
+                "install it with: pip install aiohttp"
+            )
+        self.ups_address = ups_address
+        self.username, self.password = authentication
+        self.name = name
+        self.insecure = insecure
+        self.login_timeout = login_timeout
+        self.session = session
+        self.logger = create_logger(__name__, not verbose)
+
+        self.token_type, self.access_token = None, None
+        # time.monotonic() at which the access token expires, if known
+        self.token_expires: float | None = None
+        self._login_lock: asyncio.Lock | None = None
+
+        self.discovery_ttl = discovery_ttl
+        self.links: dict | None = None
+        self.links_expire: float | None = None
+        self.schedule = EndpointSchedule(refresh_intervals)
+        self.collectors = enabled_collectors(collectors)
+        self.alarm_log = AlarmLog() if alarms else None
+
+        self.device_concurrency = device_concurrency
+
+        self.stats = ScrapeStats()
+        self.pool_size = pool_size or default_pool_size(device_concurrency)
+        self.keepalive_idle = keepalive_idle
+        self.ssl_context = create_ssl_context(
+            insecure, self.stats
+        ) if tls_session_resumption else None
+        # the TLS settings of aiohttp without session resumption
+        self.ssl: ResumingSSLContext | bool = \
+            self.ssl_context or not insecure
+        self.breaker = CircuitBreaker(
+            breaker_threshold, max_backoff=breaker_max_backoff
+        )
+
+    def get_session(self):
+        """Return the aiohttp session, create it if necessary.
+
+        Must be called from within the event loop.
+        """
+        if self.session is None:
+            stats = self.stats
+            # handshakes are counted by the ssl_context if there is one
+            count_handshakes = self.ssl_context is None \
+                and self.ups_address.startswith('https://')
+
+            async def connection_created(session, context, params) -> None:
+                stats.count_request(new_connections=1)
+                if count_handshakes:
+                    stats.count_tls_handshake(resumed=False)
+
+            async def connection_reused(session, context, params) -> None:
+                stats.count_request()
+
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(connection_created)
+            trace_config.on_connection_reuseconn.append(connection_reused)
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.pool_size,
+                    keepalive_timeout=self.keepalive_idle,
+                    ssl=self.ssl
+                ),
+                trace_configs=[trace_config]
+            )
+        return self.session
+
+    async def close(self) -> None:
+        """Close the aiohttp session."""
+        if self.session is not None:
+            await self.session.close()
+
+    async def login(self) -> Tuple[str, str]:
+        """
+        Login to the UPS Web UI.
+
+        See UPSScraper.login.
+
+        :return: two for the authentication necessary string values
+        """
+        data = dict(LOGIN_DATA)
+        data["username"] = self.username
+        data["password"] = self.password
+
+        self.stats.count_login(relogin=self.access_token is not None)
+        start = time.perf_counter()
+        try:
+            async with self.get_session().post(
+                self.ups_address + LOGIN_AUTH_PATH,
+                data=json.dumps(data),  # needs to be JSON encoded
+                ssl=self.ssl,
+                timeout=aiohttp.ClientTimeout(total=self.login_timeout)
+            ) as login_request:
+                login_response = json_loads(await login_request.read())
+
+            token_type = login_response['token_type']
+            access_token = login_response['access_token']
+            self.token_expires = token_expiry(login_response)
+
+            self.logger.debug(
+                "Authentication successful on (%s)",
+                self.ups_address
+            )
+
+            return token_type, access_token
+        except (KeyError, json.decoder.JSONDecodeError):
+            raise LoginFailedException(
+                AUTHENTICATION_FAILED,
+                "Authentication failed"
+            ) from None
+        except Exception as err:
+            raise self.translate_exception(
+                err, f"Login Timeout > {self.login_timeout} seconds"
+            ) from None
+        finally:
+            self.stats.observe_phase('login', time.perf_counter() - start)
+
+    def translate_exception(self,
+                            err: Exception,
+                            timeout_message: str) -> Exception:
+        """Map aiohttp errors to the LoginFailedException of UPSScraper."""
+        if isinstance(err, aiohttp.ClientConnectorCertificateError):
+            return LoginFailedException(
+                CERTIFICATE_VERIFY_FAILED,
+                "Invalid certificate, connection to host failed"
+            )
+        if isinstance(err, aiohttp.ClientSSLError):
+            return LoginFailedException(
+                SSL_ERROR,
+                "Connection refused due to an SSL Error"
+            )
+        if isinstance(err, aiohttp.ClientConnectionError):
+            return LoginFailedException(
+                CONNECTION_ERROR,
+                "Connection refused, host might be out of reach."
+            )
+        if isinstance(err, asyncio.TimeoutError):
+            return LoginFailedException(TIMEOUT_ERROR, timeout_message)
+        if isinstance(err, (aiohttp.InvalidURL, ValueError)):
+            if not self.ups_address.startswith(("http://", "https://")):
+                return LoginFailedException(
+                    MISSING_SCHEMA_ERROR,
+                    "Invalid URL, no schema supplied"
+                )
+            return LoginFailedException(
+                INVALID_URL_ERROR,
+                "Invalid URL, no host supplied"
+            )
+        return err
+
+    async def relogin(self,
+                      token: Tuple[str | None, str | None]) -> None:
+        """
+        Login again, after the given token was rejected.
+
+        See UPSScraper.relogin.
+
+        :param token: (token_type, access_token) the request was sent with
+        """
+        login_lock = self._login_lock
+        if login_lock is None:
+            login_lock = self._login_lock = asyncio.Lock()
+        async with login_lock:
+            if (self.token_type, self.access_token) == token:
+                self.token_type, self.access_token = await self.login()
+
+    def token_expires_within(self,
+                             seconds: float) -> bool:
+        """Whether the current access token expires within seconds."""
+        expires = self.token_expires
+        return (
+            self.access_token is not None
+            and expires is not None
+            and time.monotonic() + seconds >= expires
+        )
+
+    async def refresh_token(self,
+                            margin: float) -> bool:
+        """
+        Login again if the access token expires within margin seconds.
+
+        See UPSScraper.refresh_token.
+
+        :param margin: seconds before the expiry to renew the token
+        :return: whether the token was renewed
+        """
+        token = (self.token_type, self.access_token)
+        if not self.token_expires_within(margin):
+            return False
+        self.logger.debug('Token expires soon, login again')
+        await self.relogin(token)
+        return True
+
+    async def load_page(self,
+                        url: str,
+                        relogin: bool = True) -> dict | None:
+        """
+        Load a page of the UPS API and decode its JSON content.
+
+        If authentication is needed first, the login function gets executed
+        before loading the specified page once more.
+
+        :param url: ups web url
+        :param relogin: whether to login and retry on an expired session
+        :return: dict, or None if the page does not exist
+        """
+        # avoid a request bound to fail with an expired token
+        await self.refresh_token(0)
+
+        token = (self.token_type, self.access_token)
+        headers = {
+            "Connection": "keep-alive",
+            "Authorization": f"{token[0]} {token[1]}",
+        }
+
+        try:
+            async with self.get_session().get(
+                url,
+                headers=headers,
+                ssl=self.ssl,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            ) as request:
+                status = request.status
+                content = await request.read()
+        except Exception as err:
+            if not relogin or not isinstance(
+                    err, aiohttp.ClientConnectionError):
+                raise self.translate_exception(
+                    err, f"Request Timeout > {REQUEST_TIMEOUT} seconds"
+                ) from None
+            self.logger.debug('Connection Error try to login again')
+            await self.relogin(token)
+            return await self.load_page(url, relogin=False)
+
+        if status == 404:
+            return None
+
+        page, decode_error = None, None
+        try:
+            page = json_loads(content)
+        except json.decoder.JSONDecodeError as err:
+            decode_error = err
+
+        # Session might be expired or not yet authorized, connect again
+        expired = isinstance(page, dict) and (
+            "errorCode" in page or "code" in page
+        )
+        unauthorized = page is None and b"Unauthorized" in content
+        if relogin and (expired or unauthorized):
+            self.logger.debug('Unauthorized, try to login')
+            try:
+                await self.relogin(token)
+            except LoginFailedException as err:
+                if err.error_code == TIMEOUT_ERROR:
+                    raise LoginFailedException(
+                        AUTHENTICATION_FAILED,
+                        "Authentication failed"
+                    ) from err
+                raise
+            return await self.load_page(url, relogin=False)
+
+        self.logger.debug('GET %s', url)
+        if decode_error is not None:
+            raise decode_error
+        return page
+
+    async def load_existing_page(self,
+                                 url: str) -> dict:
+        """Like load_page, but fail like UPSScraper on missing pages."""
+        page = await self.load_page(url)
+        if page is None:
+            raise json.decoder.JSONDecodeError(
+                f"No API page at {url}", "", 0
+            )
+        return page
+
+    async def get_links(self) -> dict:
+        """
+        Get the API links of the measurement endpoints.
+
+        See UPSScraper.get_links.
+        """
+        links, expire = self.links, self.links_expire
+        if links is None or (
+                expire is not None and time.monotonic() >= expire):
+            with self.stats.timed('discovery'):
+                links = await self.discover_links()
+            self.links, self.links_expire = links, None
+            discovery_ttl = self.discovery_ttl
+            if discovery_ttl is not None:
+                self.links_expire = time.monotonic() + discovery_ttl
+        return links
+
+    async def discover_links(self) -> dict:
+        """
+        Walk the power distribution API to find the measurement endpoints.
+
+        :return: see get_links
+        """
+        power_dist_overview = await self.load_existing_page(
+            self.ups_address + REST_API_PATH
+        )
+
+        if not self.name:
+            self.name = f"ups_{power_dist_overview['id']}"
+
+        ups_backup_sys_api = power_dist_overview['backupSystem']['@id']
+        backup = await self.load_existing_page(
+            self.ups_address + ups_backup_sys_api
+        )
+
+        links = resolve_links(self.ups_address, power_dist_overview, backup)
+        links.update(subsystem_links(
+            self.ups_address, power_dist_overview, self.collectors,
+            self.logger
+        ))
+        return links
+
+    def invalidate_links(self) -> None:
+        """Discard the cached links, the next scrape discovers them again."""
+        self.links, self.links_expire = None, None
+        self.schedule.clear()
+
+    async def load_endpoint(self,
+                            link: str,
+                            url: str) -> dict | None:
+        """Load the page of a measurement endpoint, see get_links."""
+        with self.stats.timed(endpoint_phase(link)):
+            return await self.load_page(url)
+
+    async def load_measures(self,
+                            links: dict) -> dict | None:
+        """
+        Load the measurement endpoints.
+
+        Endpoints that are not due per the schedule are served from their
+        last page.
+
+        :param links: see get_links
+        :return: measures, or None if the links are outdated
+        """
+        measurements: dict = {"ups_id": self.name}
+        links, cached = self.schedule.plan(links)
+        if self.device_concurrency > 1:
+            semaphore = asyncio.Semaphore(self.device_concurrency)
+
+            async def load_endpoint(link: str, url: str) -> dict | None:
+                async with semaphore:
+                    return await self.load_endpoint(link, url)
+
+            pages = await asyncio.gather(
+                *map(load_endpoint, links, links.values())
+            )
+        else:
+            pages = [
+                await self.load_endpoint(link, url)
+                for link, url in links.items()
+            ]
+        for key, page in zip(links, pages):
+            if not is_endpoint_page(key, page):
+                return None
+            measurements[key] = page
+        self.schedule.store(measurements)
+        measurements.update(cached)
+        return measurements
+
+    def is_warm(self) -> bool:
+        """Whether the UPS is logged in, with its API links discovered."""
+        return self.access_token is not None and self.links is not None
+
+    async def prewarm(self) -> bool:
+        """
+        Login and discover the API links ahead of the first scrape.
+
+        See UPSScraper.prewarm.
+
+        :return: whether the UPS is warm
+        """
+        try:
+            if self.access_token is None:
+                await self.relogin((self.token_type, self.access_token))
+            await self.get_links()
+        except LoginFailedException as err:
+            self.logger.error(err)
+            print(f"{err.__class__.__name__} - ({self.ups_address}): "
+                  f"{err.message}")
+        except (json.decoder.JSONDecodeError, KeyError, TypeError) as err:
+            self.logger.error(
+                "Unexpected API response from (%s): %s",
+                self.ups_address, err
+            )
+        return self.is_warm()
+
+    async def load_realtime(self) -> dict | None:
+        """
+        Load the realtime endpoints only, for high frequency sampling.
+
+        See UPSScraper.load_realtime.
+
+        :return: {"ups_inputs": inputs, "ups_outputs": outputs},
+            None if the sample is skipped or failed
+        """
+        links = self.links
+        if links is None or self.breaker.state != CLOSED:
+            return None
+        pages = dict()
+        try:
+            for link in REALTIME_LINKS:
+                page = await self.load_page(links[link])
+                if not is_measures_page(page):
+                    return None
+                pages[link] = page
+        except (LoginFailedException, ValueError) as err:
+            self.logger.debug('Sample of %s failed: %s', self.name, err)
+            return None
+        return pages
+
+    async def load_alarms(self) -> dict | None:
+        """
+        Read the events of the alarm log added since the last call.
+
+        See UPSScraper.load_alarms.
+
+        :return: see AlarmLog.snapshot, None if the UPS has no readable
+            alarm log or reading it failed
+        """
+        alarm_log = self.alarm_log
+        if alarm_log is None or alarm_log.unfiltered:
+            return None
+        if not alarm_log.lock.acquire(blocking=False):
+            return alarm_log.snapshot()
+        try:
+            with self.stats.timed('alarms'):
+                more = True
+                while more:
+                    page = await self.load_page(
+                        alarm_log.url(self.ups_address)
+                    )
+                    if page is None:
+                        return None
+                    more = alarm_log.apply(page)
+        except (LoginFailedException, KeyError, TypeError, ValueError) as err:
+            self.logger.error(
+                "Reading the alarms of (%s) failed: %r", self.ups_address, err
+            )
+            return None
+        finally:
+            alarm_log.lock.release()
+        return alarm_log.snapshot()
+
+    async def get_measures(self) -> dict:
+        """
+        Get most relevant UPS metrics.
+
+        :return: {
+            "ups_id": self.name,
+            "ups_inputs": inputs,
+            "ups_outputs": outputs,
+            "ups_powerbank": powerbank
+            }
+            empty while the circuit breaker skips the unreachable UPS
+        """
+        if not self.breaker.allow():
+            self.logger.debug('%s unreachable, skip scrape', self.ups_address)
+            self.stats.count_skipped()
+            return dict()
+
+        measurements = dict()
+        error_code = None
+        start = time.perf_counter()
+        try:
+            cached = self.links is not None
+            measurements = await self.load_measures(await self.get_links())
+            if measurements is None and cached:
+                self.logger.debug('API links changed, discover them again')
+                self.invalidate_links()
+                measurements = await self.load_measures(
+                    await self.get_links()
+                )
+            if measurements is None:
+                self.invalidate_links()
+                self.logger.error(
+                    "Unexpected API response from (%s)", self.ups_address
+                )
+                measurements = dict()
+            if measurements and self.alarm_log is not None:
+                alarms = await self.load_alarms()
+                if alarms is not None:
+                    measurements[ALARMS] = alarms
+
+        except LoginFailedException as err:
+            error_code = err.error_code
+            self.stats.count_error(err.error_code)
+            self.logger.error(err)
+            print(f"{err.__class__.__name__} - ({self.ups_address}): "
+                  f"{err.message}")
+        except json.decoder.JSONDecodeError as err:
+            self.logger.debug("This needs to be solved by a developer")
+            self.logger.error(err)
+        except asyncio.CancelledError:
+            # cancelled by the deadline of the scrape
+            error_code = TIMEOUT_ERROR
+            raise
+        finally:
+            self.breaker.record(error_code)
+            self.stats.observe_scrape(
+                time.perf_counter() - start, bool(measurements)
+            )
+
+        return measurements
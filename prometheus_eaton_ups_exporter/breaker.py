@@ -0,0 +1,99 @@
+"""Circuit breaker for UPSs that cannot be reached."""
+import threading
+import time
+
+from prometheus_eaton_ups_exporter.scraper_globals import (
+        BREAKER_BACKOFF,
+        BREAKER_MAX_BACKOFF,
+        BREAKER_THRESHOLD,
+        CONNECTION_ERROR,
+        TIMEOUT_ERROR,
+        )
+
+from typing import Callable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+# error codes of LoginFailedException telling that a UPS is unreachable
+NETWORK_ERRORS = (CONNECTION_ERROR, TIMEOUT_ERROR)
+
+
+class CircuitBreaker:
+    """Skip the scrapes of a UPS after repeated network failures.
+
+    After threshold consecutive failures the breaker opens: scrapes are
+    skipped until the backoff passed. Then a single scrape probes the UPS
+    (half open). If it fails, the breaker opens again with a doubled
+    backoff, up to max_backoff, otherwise it closes.
+
+    :param threshold: int
+        Consecutive failures opening the breaker, 0 never opens it
+    :param backoff: float
+        Seconds to skip scrapes after the breaker opened the first time
+    :param max_backoff: float
+        Maximum seconds to skip scrapes
+    :param clock: Callable[[], float]
+        Monotonic clock, replaceable for tests
+    """
+    def __init__(self,
+                 threshold: int = BREAKER_THRESHOLD,
+                 backoff: float = BREAKER_BACKOFF,
+                 max_backoff: float = BREAKER_MAX_BACKOFF,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.retry_at: float | None = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether to scrape the UPS now, switches open to half open."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            retry_at = self.retry_at
+            if self.state == OPEN and retry_at is not None \
+                    and self.clock() >= retry_at:
+                self.state = HALF_OPEN
+                return True
+            # open, or a probe is still running
+            return False
+
+    def record_success(self) -> None:
+        """The UPS answered, close the breaker."""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened = 0
+            self.retry_at = None
+
+    def record_failure(self) -> None:
+        """The UPS could not be reached, open the breaker if necessary."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                    self.threshold and self.failures >= self.threshold):
+                backoff = min(
+                    self.backoff * 2 ** self.opened, self.max_backoff
+                )
+                self.opened += 1
+                self.state = OPEN
+                self.retry_at = self.clock() + backoff
+
+    def record(self,
+               error_code: int | None) -> None:
+        """Record the result of a scrape.
+
+        :param error_code: of the LoginFailedException, None on success
+        """
+        if error_code in NETWORK_ERRORS:
+            self.record_failure()
+        else:
+            self.record_success()
@@ -0,0 +1,81 @@
+"""Sharing of scrapes between concurrent collects."""
+import threading
+import time
+
+from concurrent.futures import Future
+
+from typing import Any, Callable, Hashable
+
+
+class ScrapeCoalescer:
+    """Run at most one scrape per key at a time, shared by all callers.
+
+    Callers arriving while a scrape of the same key is in flight wait for
+    it and get its result, instead of scraping the UPSs again. With a ttl,
+    results are also reused for ttl seconds after the scrape finished.
+    The load on the UPSs is then independent of the number of Prometheus
+    servers scraping the exporter.
+
+    :param ttl: float | None
+        Seconds to reuse the result of a scrape, None only shares scrapes
+        in flight
+    :param clock: Callable[[], float]
+        Monotonic clock, replaceable for tests
+    """
+    def __init__(self,
+                 ttl: float | None = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, Future] = {}
+        # key -> (expiry, result)
+        self._cache: dict[Hashable, tuple[float, Any]] = {}
+        # callers served by another caller's scrape, or from the cache
+        self.shared = 0
+        self.cached = 0
+
+    def run(self,
+            key: Hashable,
+            scrape: Callable[[], Any]) -> Any:
+        """Scrape, or wait for the scrape of key in flight.
+
+        :param key: Hashable
+            What is scraped, e.g. the name of a UPS
+        :param scrape: Callable[[], Any]
+            Function scraping, called if no scrape of key is in flight
+        :return: the result of the scrape
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and self.clock() < cached[0]:
+                self.cached += 1
+                return cached[1]
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                future = self._in_flight[key] = Future()
+            else:
+                self.shared += 1
+
+        if in_flight is not None:
+            return in_flight.result()
+
+        try:
+            result = scrape()
+        except BaseException as err:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(err)
+            raise
+        ttl = self.ttl
+        with self._lock:
+            del self._in_flight[key]
+            if ttl:
+                self._cache[key] = (self.clock() + ttl, result)
+        future.set_result(result)
+        return result
+
+    def clear(self) -> None:
+        """Forget the cached results, e.g. after a config reload."""
+        with self._lock:
+            self._cache.clear()
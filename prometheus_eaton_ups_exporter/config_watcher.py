@@ -0,0 +1,87 @@
+"""Reload of the config file of the exporter when it changes."""
+import os
+import threading
+
+from prometheus_eaton_ups_exporter import create_logger
+
+from typing import Callable, Tuple
+
+
+class ConfigWatcher:
+    """Watch a config file in a background thread and reload it on change.
+
+    The file is considered changed when its modification time, size or
+    inode change, which also catches editors replacing the file.
+
+    :param reload: Callable[[], object]
+        Function applying the config file, e.g. UPSMultiExporter.reload
+    :param path: str
+        Path of the config file
+    :param interval: float
+        Seconds between two checks of the file
+    :param verbose: bool
+        Allow logging output for development
+    """
+    def __init__(self,
+                 reload: Callable[[], object],
+                 path: str,
+                 interval: float,
+                 verbose: bool = False) -> None:
+        self.logger = create_logger(
+            f"{__name__}.{self.__class__.__name__}", not verbose
+        )
+        self.reload = reload
+        self.path = path
+        self.interval = interval
+        self._signature = self.signature()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def signature(self) -> Tuple[int, int, int] | None:
+        """Modification time, size and inode of the file, None if missing."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def check(self) -> bool:
+        """Reload the config if the file changed since the last check.
+
+        :return: whether the file changed
+        """
+        signature = self.signature()
+        if signature is None or signature == self._signature:
+            # a missing file is kept, it may be replaced in a moment
+            return False
+        self._signature = signature
+        self.logger.debug("%s changed, reloading it", self.path)
+        self.reload()
+        return True
+
+    def start(self) -> None:
+        """Start watching the file in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=self.__class__.__name__,
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self,
+             timeout: float | None = None) -> None:
+        """Stop watching the file."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as err:
+                self.logger.exception(err)
@@ -1,14 +1,54 @@
 """Create and run a Prometheus Exporter for an Eaton UPS."""
+import asyncio
 import json
+import math
+import threading
+import time
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from concurrent.futures._base import TimeoutError
-from prometheus_client.core import GaugeMetricFamily
+from threading import RLock
+from prometheus_client.core import GaugeMetricFamily, Metric
 
 from prometheus_eaton_ups_exporter import create_logger
+from prometheus_eaton_ups_exporter.alarms import alarm_families
+from prometheus_eaton_ups_exporter.async_scraper import AsyncUPSScraper
+from prometheus_eaton_ups_exporter.breaker import CLOSED
+from prometheus_eaton_ups_exporter.coalescing import ScrapeCoalescer
+from prometheus_eaton_ups_exporter.config_watcher import ConfigWatcher
+from prometheus_eaton_ups_exporter.instrumentation import Durations
+from prometheus_eaton_ups_exporter.metrics import gauges_from_measures
+from prometheus_eaton_ups_exporter.poller import UPSPoller
+from prometheus_eaton_ups_exporter.sampler import UPSSampler
 from prometheus_eaton_ups_exporter.scraper import UPSScraper
+from prometheus_eaton_ups_exporter.scraper_globals import (
+        BREAKER_MAX_BACKOFF,
+        BREAKER_THRESHOLD,
+        LoginFailedException,
+        REQUEST_TIMEOUT,
+        TIMEOUT_ERROR,
+        )
+from prometheus_eaton_ups_exporter.sharding import shard_devices
+from prometheus_eaton_ups_exporter.state import (
+        StateStore,
+        export_scraper_state,
+        restore_scraper_state,
+        )
+from prometheus_eaton_ups_exporter.subsystems import (
+        enabled_collectors,
+        subsystem_families,
+        )
+from prometheus_eaton_ups_exporter.tokens import (
+        TokenRefresher,
+        check_interval,
+        )
+from prometheus_eaton_ups_exporter.workers import (
+        REPLY_MARGIN,
+        ScrapeWorker,
+        WorkerDevice,
+        )
 
-from typing import Generator, Tuple
+from typing import Callable, Generator, Tuple
 
 NORMAL_EXECUTION = 0
 
@@ -26,6 +66,13 @@ class UPSExporter:
         Allow logging output for development.
     :param login_timeout: int
         Login timeout for authentication
+    :param discovery_ttl: float | None
+        Seconds to cache the discovered API links for,
+        None caches them until they become invalid
+    :param device_concurrency: int
+        Maximum number of parallel requests per UPS
+    :param scrape_timeout: float | None
+        Deadline per UPS for a whole scrape, including login and requests
     """
     def __init__(
             self,
@@ -34,7 +81,10 @@ class UPSExporter:
             name: str | None = None,
             insecure: bool = False,
             verbose: bool = False,
-            login_timeout: int = 3
+            login_timeout: int = 3,
+            discovery_ttl: float | None = None,
+            device_concurrency: int = 1,
+            scrape_timeout: float | None = None
     ) -> None:
         self.logger = create_logger(
             f"{__name__}.{self.__class__.__name__}", not verbose
@@ -45,152 +95,21 @@ class UPSExporter:
             name,
             insecure=insecure,
             verbose=verbose,
-            login_timeout=login_timeout
+            login_timeout=login_timeout,
+            discovery_ttl=discovery_ttl,
+            device_concurrency=device_concurrency,
+            scrape_timeout=scrape_timeout
         )
 
-    def collect(self) -> Generator[GaugeMetricFamily, None, None]:
-        """Export UPS metrics on request."""
-        ups_data = self.scrape_data()
-        for measures in ups_data:
-            if not measures:
-                continue
-
-            ups_id = measures.get('ups_id')
-            inputs = measures.get('ups_inputs')
-            outputs = measures.get('ups_outputs')
-            powerbank_details = measures.get('ups_powerbank')
-
-            inputs_rm = inputs['measures']
-            if 'realtime' in inputs['measures']:
-                inputs_rm = inputs['measures']['realtime']
-
-            outputs_rm = outputs['measures']
-            if 'realtime' in outputs['measures']:
-                outputs_rm = outputs['measures']['realtime']
-
-            powerbank_m = powerbank_details['measures']
-            powerbank_s = powerbank_details['status']
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_input_volts",
-                'UPS input voltage (V)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], inputs_rm['voltage'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_input_hertz",
-                'UPS input frequency (Hz)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], inputs_rm['frequency'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_input_amperes",
-                'UPS input current (A)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], inputs_rm.get('current', 0))
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_volts",
-                'UPS output voltage (V)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], outputs_rm['voltage'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_hertz",
-                'UPS output frequency (Hz)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], outputs_rm['frequency'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_amperes",
-                'UPS output current (A)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], outputs_rm['current'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_voltamperes",
-                'UPS output apparent power (VA)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], outputs_rm['apparentPower'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_watts",
-                'UPS output active power (W)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], outputs_rm['activePower'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_power_factor",
-                'UPS output power factor',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], outputs_rm['powerFactor'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_output_load_ratio",
-                "Ratio of the output apparent power vs. "
-                "the UPS's capacity in VA.",
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], int(outputs_rm['percentLoad']) / 100)
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_battery_volts",
-                'UPS battery voltage (V)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], powerbank_m['voltage'])
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_battery_capacity_ratio",
-                'Ratio of the remaining charge vs the total battery capacity',
-                labels=['ups_id']
-            )
-            gauge.add_metric(
-                [ups_id],
-                int(powerbank_m.get('remainingChargeCapacity', 0)) / 100
-            )
-            yield gauge
-
-            gauge = GaugeMetricFamily(
-                "eaton_ups_battery_remaining_seconds",
-                'UPS remaining battery time (s)',
-                labels=['ups_id']
-            )
-            gauge.add_metric([ups_id], powerbank_m['remainingTime'])
-            yield gauge
+    def collect(self) -> Generator[Metric, None, None]:
+        """Export UPS metrics on request.
 
-            gauge = GaugeMetricFamily(
-                "eaton_ups_battery_health",
-                'UPS health status given as the '
-                'remaining lifetime (years) [uncertain]',
-                labels=['ups_id']
-            )
-            health_val = powerbank_s['health']
-            health = 0
-            if isinstance(health_val, int):
-                health = health_val
-            gauge.add_metric([ups_id], health)
-            yield gauge
+        Yields one gauge per metric of METRICS, with a sample for each UPS.
+        """
+        ups_data = list(self.scrape_data())
+        yield from gauges_from_measures(ups_data)
+        yield from alarm_families(ups_data)
+        yield from subsystem_families(ups_data)
 
     def scrape_data(self):
         """Scrape measure data.
@@ -199,6 +118,10 @@ class UPSExporter:
         """
         yield self.ups_scraper.get_measures()
 
+    def close(self) -> None:
+        """Close the session of the UPS."""
+        self.ups_scraper.close()
+
 
 class UPSMultiExporter(UPSExporter):
     """Prometheus exporter for multiple UPSs.
@@ -207,9 +130,10 @@ class UPSMultiExporter(UPSExporter):
     enabled, multiple threads will be used to collect sensor readings which is
     considerably faster.
 
-    :param config: str
-        Path to the configuration file, containing UPS ip/hostname, username,
-        and password combinations for all UPSs to be monitored
+    :param config: str | dict
+        Path to the configuration file, or its content, containing UPS
+        ip/hostname, username, and password combinations for all UPSs to be
+        monitored
     :param insecure: bool
         Whether to connect to UPSs with self-signed SSL certificates
     :param threading: bool
@@ -219,15 +143,100 @@ class UPSMultiExporter(UPSExporter):
         Allow logging output for development
     :param login_timeout: int
         Login timeout for authentication
+    :param polling_interval: float | None
+        If given, poll the UPSs in the background every polling_interval
+        seconds and serve collect() from the latest snapshot
+    :param discovery_ttl: float | None
+        Seconds to cache the discovered API links for,
+        None caches them until they become invalid
+    :param device_concurrency: int
+        Maximum number of parallel requests per UPS
+    :param scrape_timeout: float | None
+        Deadline per UPS for a whole scrape, including login and requests
+    :param scrape_workers: int | None
+        Number of threads in the worker pool used if threading is enabled,
+        None uses one thread per UPS, resized when a reload changes the
+        number of UPSs
+    :param token_refresh_margin: float | None
+        If given, renew access tokens in the background
+        token_refresh_margin seconds before they expire
+    :param state_file: str | None
+        If given, persist the access tokens and API links of the UPSs in
+        this file and restore them on start
+    :param breaker_threshold: int
+        Consecutive connection errors or timeouts after which scrapes of a
+        UPS are skipped for an exponential backoff, 0 disables it
+    :param breaker_max_backoff: float
+        Maximum seconds to skip the scrapes of an unreachable UPS
+    :param pool_size: int | None
+        Maximum number of connections kept open per UPS,
+        None keeps up to max(10, device_concurrency) connections
+    :param keepalive_idle: float | None
+        Seconds after which idle connections to a UPS are closed,
+        None keeps them open until the UPS closes them
+    :param tls_session_resumption: bool
+        Whether new connections resume the TLS session of earlier ones
+    :param shard_index: int
+        Index of this exporter among shard_count exporters sharing the
+        config, it only scrapes the UPSs of its shard
+    :param shard_count: int
+        Number of exporters sharing the config
+    :param config_watch_interval: float | None
+        If given and config is a path, check the file every
+        config_watch_interval seconds and reload it when it changed
+    :param scrape_cache_ttl: float | None
+        Seconds to serve collects from the result of the last scrape,
+        None only shares the scrape in flight among concurrent collects
+    :param refresh_intervals: dict[str, float] | None
+        Seconds between two loads of a measurement endpoint of a UPS, by
+        endpoint (inputs, outputs, powerbank), others are loaded on every
+        scrape
+    :param alarms: bool
+        Whether each scrape also reads the new events of the alarm logs of
+        the UPSs, exported as active alarms and event counters
+    :param collectors: list[str] | None
+        Subsystems of all UPSs to export besides the inputs, outputs and
+        battery, see SUBSYSTEMS. Further ones are enabled per UPS by the
+        "collectors" list of its config entry
+    :param sampling_interval: float | None
+        If given, sample the inputs and outputs of the UPSs every
+        sampling_interval seconds in the background and export the min,
+        max, mean and last value of the samples
+    :param sampling_window: float
+        Seconds of samples aggregated per collect
+    :param sampled_devices: list[str] | None
+        Names of the sampled UPSs, None samples all
     """
 
     def __init__(
             self,
-            config: str,
+            config: str | dict,
             insecure: bool = False,
             threading: bool = False,
             verbose: bool = False,
-            login_timeout: int = 3
+            login_timeout: int = 3,
+            polling_interval: float | None = None,
+            discovery_ttl: float | None = None,
+            device_concurrency: int = 1,
+            scrape_timeout: float | None = None,
+            scrape_workers: int | None = None,
+            token_refresh_margin: float | None = None,
+            state_file: str | None = None,
+            breaker_threshold: int = BREAKER_THRESHOLD,
+            breaker_max_backoff: float = BREAKER_MAX_BACKOFF,
+            pool_size: int | None = None,
+            keepalive_idle: float | None = None,
+            tls_session_resumption: bool = False,
+            shard_index: int = 0,
+            shard_count: int = 1,
+            config_watch_interval: float | None = None,
+            scrape_cache_ttl: float | None = None,
+            refresh_intervals: dict[str, float] | None = None,
+            alarms: bool = False,
+            collectors: list[str] | None = None,
+            sampling_interval: float | None = None,
+            sampling_window: float = 30.,
+            sampled_devices: list[str] | None = None
     ) -> None:
         self.logger = create_logger(
             f"{__name__}.{self.__class__.__name__}", not verbose
@@ -236,8 +245,111 @@ class UPSMultiExporter(UPSExporter):
         self.threading = threading
         self.verbose = verbose
         self.login_timeout = login_timeout
+        self.discovery_ttl = discovery_ttl
+        self.device_concurrency = device_concurrency
+        self.scrape_timeout = scrape_timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_max_backoff = breaker_max_backoff
+        self.pool_size = pool_size
+        self.keepalive_idle = keepalive_idle
+        self.tls_session_resumption = tls_session_resumption
+        self.refresh_intervals = refresh_intervals
+        self.alarms = alarms
+        self.collectors = enabled_collectors(collectors or ())
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.config = config
+        # threading is shadowed by the parameter
+        self._reload_lock = RLock()
+        self.device_configs: dict = {}
         self.ups_devices = self.get_ups_devices(config)
 
+        self.state_store = None
+        self._saved_state = None
+        if state_file:
+            self.state_store = StateStore(state_file, verbose=verbose)
+            self.restore_state()
+
+        # result of the last scrape of each UPS
+        self.scrape_success: dict[str, bool] = {}
+        # time spent in collect(), see ExporterCollector
+        self.collect_durations = Durations()
+        # concurrent collects and probes share one scrape
+        self.coalescer = ScrapeCoalescer(scrape_cache_ttl)
+
+        # long-lived, so that threads are reused across scrapes
+        self.scrape_workers = scrape_workers
+        self.executor = None
+        self._executor_workers = 0
+        self._running: dict[str, Future] = {}
+        if threading:
+            self.executor = self.create_executor()
+
+        self.poller = None
+        if polling_interval:
+            self.poller = UPSPoller(
+                self.scrape_live,
+                polling_interval,
+                verbose=verbose
+            )
+            self.poller.start()
+
+        self.sampled_devices = sampled_devices
+        self.sampler = None
+        if sampling_interval:
+            self.sampler = UPSSampler(
+                self.sample_realtime,
+                sampling_interval,
+                sampling_window,
+                verbose=verbose
+            )
+            self.sampler.start()
+
+        self.token_refresh_margin = token_refresh_margin
+        self.token_refresher = None
+        if token_refresh_margin is not None:
+            self.token_refresher = TokenRefresher(
+                self.refresh_tokens,
+                check_interval(token_refresh_margin),
+                verbose=verbose
+            )
+            self.token_refresher.start()
+
+        self.config_watcher = None
+        if config_watch_interval and isinstance(config, str):
+            self.config_watcher = ConfigWatcher(
+                self.reload,
+                config,
+                config_watch_interval,
+                verbose=verbose
+            )
+            self.config_watcher.start()
+
+        # set once the pre-warm finished, see start_prewarm
+        self._prewarmed = None
+
+    def collect(self) -> Generator[Metric, None, None]:
+        """Export UPS metrics on request."""
+        start = time.perf_counter()
+        try:
+            yield from super().collect()
+
+            gauge = GaugeMetricFamily(
+                "eaton_ups_scrape_success",
+                'Whether the last scrape of the UPS succeeded',
+                labels=['ups_id']
+            )
+            for ups_id, success in list(self.scrape_success.items()):
+                gauge.add_metric([ups_id], int(success))
+            yield gauge
+
+            if self.poller:
+                yield from self.poller.collect()
+            if self.sampler:
+                yield from self.sampler.collect()
+        finally:
+            self.collect_durations.observe(time.perf_counter() - start)
+
     @staticmethod
     def get_devices(config: str | dict) -> dict:
         """Take a config file path or config dict of UPSs."""
@@ -250,6 +362,13 @@ class UPSMultiExporter(UPSExporter):
             raise AttributeError("Only config path (str) or dict accepted")
         return devices
 
+    def owned_devices(self,
+                      config: str | dict) -> dict:
+        """The config of the UPSs of this exporter's shard."""
+        return shard_devices(
+            self.get_devices(config), self.shard_index, self.shard_count
+        )
+
     def get_ups_devices(self,
                         config: str | dict) -> list:
         """Creates multiple UPSScraper.
@@ -259,38 +378,959 @@ class UPSMultiExporter(UPSExporter):
         :return: list
             List of UPSScrapers
         """
-        devices = self.get_devices(config)
-
+        self.device_configs = self.owned_devices(config)
         return [
-            UPSScraper(
-                value['address'],
-                (value['user'], value['password']),
-                key,
-                insecure=self.insecure,
-                verbose=self.verbose,
-                login_timeout=self.login_timeout
-            )
-            for key, value in devices.items()
+            self.create_scraper(key, value)
+            for key, value in self.device_configs.items()
         ]
 
+    def create_scraper(self,
+                       name: str,
+                       device: dict):
+        """Create the UPSScraper of a UPS of the config."""
+        return UPSScraper(
+            device['address'],
+            (device['user'], device['password']),
+            name,
+            insecure=self.insecure,
+            verbose=self.verbose,
+            login_timeout=self.login_timeout,
+            discovery_ttl=self.discovery_ttl,
+            device_concurrency=self.device_concurrency,
+            scrape_timeout=self.scrape_timeout,
+            breaker_threshold=self.breaker_threshold,
+            breaker_max_backoff=self.breaker_max_backoff,
+            pool_size=self.pool_size,
+            keepalive_idle=self.keepalive_idle,
+            tls_session_resumption=self.tls_session_resumption,
+            refresh_intervals=self.refresh_intervals,
+            alarms=self.alarms,
+            collectors=[*self.collectors, *device.get('collectors', ())]
+        )
+
+    def close_scraper(self,
+                      ups) -> None:
+        """Close a UPSScraper removed from the config."""
+        ups.close()
+
+    def create_executor(self) -> ThreadPoolExecutor:
+        """Create the worker pool, see scrape_workers."""
+        self._executor_workers = \
+            self.scrape_workers or max(len(self.ups_devices), 1)
+        return ThreadPoolExecutor(
+            max_workers=self._executor_workers,
+            thread_name_prefix=self.__class__.__name__
+        )
+
+    def resize_executor(self) -> None:
+        """Replace the worker pool if the number of UPSs changed its size.
+
+        Without scrape_workers the pool has one thread per UPS. The old
+        pool finishes the scrapes in progress before its threads exit.
+        """
+        executor = self.executor
+        if executor is None or self.scrape_workers:
+            return
+        if self._executor_workers == max(len(self.ups_devices), 1):
+            return
+        self.executor = self.create_executor()
+        executor.shutdown(wait=False)
+
+    def submit(self,
+               function: Callable,
+               *args) -> Future:
+        """Run a function in the worker pool, replaced by resize_executor."""
+        while True:
+            executor = self.executor
+            if executor is None:
+                raise RuntimeError("Threading is disabled")
+            try:
+                return executor.submit(function, *args)
+            except RuntimeError:
+                if self.executor is executor:
+                    raise
+
+    def reload(self,
+               config: str | dict | None = None) -> bool:
+        """Apply a changed config, e.g. on SIGHUP.
+
+        Only UPSs that were added or whose entry changed get a new scraper,
+        the scrapers of removed ones are closed. Unchanged UPSs keep their
+        sessions, tokens and API links. An invalid config is logged and
+        ignored.
+
+        :param config: str | dict | None
+            New config, None reads self.config again
+        :return: whether the UPSs changed
+        """
+        with self._reload_lock:
+            if config is not None:
+                self.config = config
+            try:
+                devices = self.owned_devices(self.config)
+                current = {ups.name: ups for ups in self.ups_devices}
+                unchanged = {
+                    name for name, device in devices.items()
+                    if name in current
+                    and self.device_configs.get(name) == device
+                }
+                added = [
+                    self.create_scraper(name, device)
+                    for name, device in devices.items()
+                    if name not in unchanged
+                ]
+            except (OSError, ValueError, KeyError, TypeError,
+                    AttributeError) as err:
+                self.logger.error("Reloading the config failed: %r", err)
+                return False
+            if len(unchanged) == len(current) and not added:
+                return False
+
+            new = {ups.name: ups for ups in added}
+            self.ups_devices = [
+                current[name] if name in unchanged else new[name]
+                for name in devices
+            ]
+            self.device_configs = devices
+            self.resize_executor()
+            self.coalescer.clear()
+            self.logger.debug(
+                "Reloaded the config: %d UPSs added or changed, %d removed",
+                len(added), len(current) - len(unchanged)
+            )
+            self.restore_state(added)
+
+            removed = [
+                ups for name, ups in current.items() if name not in unchanged
+            ]
+            for ups in removed:
+                self.scrape_success.pop(ups.name, None)
+                self._running.pop(ups.name, None)
+                self.close_scraper(ups)
+            if self.poller:
+                self.poller.discard(
+                    name for name in current if name not in devices
+                )
+            if self.sampler:
+                self.sampler.discard(
+                    name for name in current if name not in devices
+                )
+            self.save_state()
+            return True
+
     def scrape_data(self):
         """Scrape measure data.
 
+        Served from the background poller's snapshot if polling is enabled,
+        otherwise concurrent collects share a single scrape of the UPSs.
+
+        :return: measures
+        """
+        if self.poller:
+            for snapshot in self.poller.snapshot():
+                yield snapshot.measures
+        else:
+            yield from self.coalescer.run(
+                None, lambda: list(self.scrape_live())
+            )
+
+    def scrape_live(self):
+        """Scrape measure data from the UPSs.
+
         :return: measures
         """
-        if self.threading:
-            with ThreadPoolExecutor() as executor:
-                futures = [
-                    executor.submit(ups.get_measures)
-                    for ups in self.ups_devices
+        if self.executor is not None:
+            futures = {}
+            for ups in self.ups_devices:
+                running = self._running.get(ups.name)
+                if running is not None and not running.done():
+                    # still busy with a previous, timed out scrape
+                    self.scrape_success[ups.name] = False
+                    continue
+                future = self.submit(self.measure, ups)
+                futures[future] = ups
+                self._running[ups.name] = future
+
+            try:
+                for future in as_completed(futures, self.wait_timeout()):
+                    ups = futures.pop(future)
+                    measures = future.result()
+                    self.scrape_success[ups.name] = bool(measures)
+                    yield measures
+            except TimeoutError:
+                for ups in futures.values():
+                    self.logger.error(
+                        "Scrape of %s exceeded its deadline", ups.name
+                    )
+                    self.scrape_success[ups.name] = False
+
+        else:
+            for ups in self.ups_devices:
+                measures = self.measure(ups)
+                self.scrape_success[ups.name] = bool(measures)
+                yield measures
+
+        self.save_state()
+
+    def measure(self,
+                ups) -> dict:
+        """Get the measures of a UPS, a failure only affects this UPS.
+
+        :param ups: UPSScraper
+            One of self.ups_devices
+        :return: measures, empty if the scrape failed
+        """
+        try:
+            return ups.get_measures()
+        except Exception as err:
+            self.logger.error(
+                "Scrape of %s failed: %r", ups.name, err
+            )
+            return dict()
+
+    def sampled(self) -> list:
+        """The UPSs to sample, see sampled_devices."""
+        sampled_devices = self.sampled_devices
+        if sampled_devices is None:
+            return list(self.ups_devices)
+        return [
+            ups for ups in self.ups_devices if ups.name in sampled_devices
+        ]
+
+    def sample_realtime(self):
+        """Load the realtime pages of the sampled UPSs, see UPSSampler.
+
+        :return: (name, pages) of each UPS sampled successfully
+        """
+        devices = self.sampled()
+        if self.executor is not None:
+            samples = [
+                future.result() for future in [
+                    self.submit(ups.load_realtime) for ups in devices
                 ]
-                try:
-                    for future in as_completed(futures, self.login_timeout+1):
-                        yield future.result()
-                except TimeoutError as err:
-                    self.logger.exception(err)
-                    yield None
+            ]
+        else:
+            samples = (ups.load_realtime() for ups in devices)
+        for ups, pages in zip(devices, samples):
+            if pages is not None:
+                yield ups.name, pages
+
+    def device(self,
+               name: str):
+        """The UPS configured under name, None if there is none."""
+        for ups in self.ups_devices:
+            if ups.name == name:
+                return ups
+        return None
+
+    def probe(self,
+              ups) -> Generator[Metric, None, None]:
+        """Export the metrics of a single UPS, scraped on request.
+
+        Serves /probe?target=<name>, so that Prometheus can scrape each UPS
+        on its own, with its own interval.
+
+        :param ups: UPSScraper | AsyncUPSScraper
+            One of self.ups_devices
+        """
+        measures = self.coalescer.run(
+            ups.name, lambda: self.scrape_device(ups)
+        )
+        yield from gauges_from_measures([measures])
+        yield from alarm_families([measures])
+        yield from subsystem_families([measures])
+
+        gauge = GaugeMetricFamily(
+            "eaton_ups_scrape_success",
+            'Whether the last scrape of the UPS succeeded',
+            labels=['ups_id']
+        )
+        gauge.add_metric([ups.name], int(bool(measures)))
+        yield gauge
+
+    def scrape_device(self,
+                      ups) -> dict:
+        """Scrape measure data from a single UPS.
 
+        :param ups: UPSScraper
+            One of self.ups_devices
+        :return: measures, empty if the scrape failed
+        """
+        measures = self.measure(ups)
+        self.scrape_success[ups.name] = bool(measures)
+        self.save_state()
+        return measures
+
+    def prewarm(self) -> int:
+        """Login to all UPSs and discover their API links.
+
+        Concurrently in the worker pool if threading is enabled, otherwise
+        one UPS after the other.
+
+        :return: number of warm UPSs
+        """
+        if self.executor is not None:
+            warm = [
+                future.result() for future in [
+                    self.submit(ups.prewarm) for ups in self.ups_devices
+                ]
+            ]
         else:
+            warm = [ups.prewarm() for ups in self.ups_devices]
+        self.save_state()
+        return sum(warm)
+
+    def start_prewarm(self,
+                      timeout: float | None = None) -> bool:
+        """Pre-warm the UPSs in the background, see prewarm.
+
+        The exporter is not ready() until the pre-warm finished.
+
+        :param timeout: seconds to wait for the pre-warm, None does not wait
+        :return: whether the pre-warm finished
+        """
+        prewarmed = self._prewarmed = threading.Event()
+
+        def run() -> None:
+            try:
+                warm = self.prewarm()
+                self.logger.debug(
+                    "%d of %d UPSs warm", warm, len(self.ups_devices)
+                )
+            except Exception as err:
+                self.logger.exception(err)
+            finally:
+                prewarmed.set()
+
+        threading.Thread(
+            target=run,
+            name=f"{self.__class__.__name__}-prewarm",
+            daemon=True
+        ).start()
+        if timeout is None:
+            return prewarmed.is_set()
+        return prewarmed.wait(timeout)
+
+    def ready(self) -> bool:
+        """Whether the pre-warm finished, if one was started."""
+        prewarmed = self._prewarmed
+        return prewarmed is None or prewarmed.is_set()
+
+    def warm_devices(self) -> int:
+        """Number of UPSs logged in, with their API links discovered."""
+        return sum(ups.is_warm() for ups in self.ups_devices)
+
+    def wait_timeout(self) -> float:
+        """Seconds to wait for the threads scraping the UPSs."""
+        if self.scrape_timeout is not None:
+            return self.scrape_timeout + 1
+        return self.login_timeout + 1
+
+    def refresh_tokens(self) -> None:
+        """Renew the access tokens which expire within the refresh margin."""
+        for ups in self.ups_devices:
+            if ups.breaker.state != CLOSED:
+                # unreachable, left to the probes of the circuit breaker
+                continue
+            try:
+                ups.refresh_token(self.token_refresh_margin)
+            except LoginFailedException as err:
+                self.logger.error(
+                    "Token renewal of %s failed: %s", ups.name, err.message
+                )
+        self.save_state()
+
+    def restore_state(self,
+                      devices: list | None = None) -> None:
+        """Restore the persisted access tokens and API links of the UPSs.
+
+        :param devices: UPSs to restore, by default all
+        """
+        if self.state_store is None:
+            return
+        state = self.state_store.load()
+        for ups in self.ups_devices if devices is None else devices:
+            if ups.name in state and \
+                    restore_scraper_state(ups, state[ups.name]):
+                self.logger.debug("Restored state of %s", ups.name)
+
+    def save_state(self) -> None:
+        """Persist the access tokens and API links of the UPSs if changed."""
+        if self.state_store is None:
+            return
+        state = {
+            ups.name: export_scraper_state(ups) for ups in self.ups_devices
+        }
+        if state == self._saved_state:
+            return
+        try:
+            self.state_store.save(state)
+            self._saved_state = state
+        except OSError as err:
+            self.logger.error("Saving the state failed: %s", err)
+
+    def close(self) -> None:
+        """Stop polling, shut down the worker pool and close all sessions."""
+        if self.config_watcher:
+            self.config_watcher.stop()
+        if self.token_refresher:
+            self.token_refresher.stop()
+        if self.poller:
+            self.poller.stop()
+        if self.sampler:
+            self.sampler.stop()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        self.save_state()
+        for ups in self.ups_devices:
+            ups.close()
+
+
+class AsyncUPSMultiExporter(UPSMultiExporter):
+    """Prometheus exporter for multiple UPSs, scraped by one event loop.
+
+    Instead of a thread per UPS, all UPSs are scraped by AsyncUPSScrapers
+    running in a single asyncio event loop, which scales to large numbers
+    of UPSs. Requires the optional aiohttp dependency.
+
+    :param config: str | dict
+        Path to the configuration file, or its content, containing UPS
+        ip/hostname, username, and password combinations for all UPSs to be
+        monitored
+    :param insecure: bool
+        Whether to connect to UPSs with self-signed SSL certificates
+    :param verbose: bool
+        Allow logging output for development
+    :param login_timeout: int
+        Login timeout for authentication
+    :param polling_interval: float | None
+        If given, poll the UPSs in the background every polling_interval
+        seconds and serve collect() from the latest snapshot
+    :param discovery_ttl: float | None
+        Seconds to cache the discovered API links for,
+        None caches them until they become invalid
+    :param device_concurrency: int
+        Maximum number of parallel requests per UPS
+    :param scrape_timeout: float | None
+        Deadline per UPS for a whole scrape, including login and requests
+    :param token_refresh_margin: float | None
+        If given, renew access tokens in the background
+        token_refresh_margin seconds before they expire
+    :param state_file: str | None
+        If given, persist the access tokens and API links of the UPSs in
+        this file and restore them on start
+    :param breaker_threshold: int
+        Consecutive connection errors or timeouts after which scrapes of a
+        UPS are skipped for an exponential backoff, 0 disables it
+    :param breaker_max_backoff: float
+        Maximum seconds to skip the scrapes of an unreachable UPS
+    :param pool_size: int | None
+        Maximum number of connections kept open per UPS,
+        None keeps up to max(10, device_concurrency) connections
+    :param keepalive_idle: float | None
+        Seconds after which idle connections to a UPS are closed,
+        None keeps them open until the UPS closes them
+    :param tls_session_resumption: bool
+        Whether new connections resume the TLS session of earlier ones
+    :param shard_index: int
+        Index of this exporter among shard_count exporters sharing the
+        config, it only scrapes the UPSs of its shard
+    :param shard_count: int
+        Number of exporters sharing the config
+    :param config_watch_interval: float | None
+        If given and config is a path, check the file every
+        config_watch_interval seconds and reload it when it changed
+    :param scrape_cache_ttl: float | None
+        Seconds to serve collects from the result of the last scrape,
+        None only shares the scrape in flight among concurrent collects
+    :param refresh_intervals: dict[str, float] | None
+        Seconds between two loads of a measurement endpoint of a UPS, by
+        endpoint (inputs, outputs, powerbank), others are loaded on every
+        scrape
+    :param alarms: bool
+        Whether each scrape also reads the new events of the alarm logs of
+        the UPSs, exported as active alarms and event counters
+    :param collectors: list[str] | None
+        Subsystems of all UPSs to export besides the inputs, outputs and
+        battery, see SUBSYSTEMS. Further ones are enabled per UPS by the
+        "collectors" list of its config entry
+    :param sampling_interval: float | None
+        If given, sample the inputs and outputs of the UPSs every
+        sampling_interval seconds in the background and export the min,
+        max, mean and last value of the samples
+    :param sampling_window: float
+        Seconds of samples aggregated per collect
+    :param sampled_devices: list[str] | None
+        Names of the sampled UPSs, None samples all
+    :param concurrency: int
+        Maximum number of UPSs scraped at the same time
+    """
+
+    def __init__(
+            self,
+            config: str | dict,
+            insecure: bool = False,
+            verbose: bool = False,
+            login_timeout: int = 3,
+            polling_interval: float | None = None,
+            discovery_ttl: float | None = None,
+            device_concurrency: int = 1,
+            scrape_timeout: float | None = None,
+            token_refresh_margin: float | None = None,
+            state_file: str | None = None,
+            breaker_threshold: int = BREAKER_THRESHOLD,
+            breaker_max_backoff: float = BREAKER_MAX_BACKOFF,
+            pool_size: int | None = None,
+            keepalive_idle: float | None = None,
+            tls_session_resumption: bool = False,
+            shard_index: int = 0,
+            shard_count: int = 1,
+            config_watch_interval: float | None = None,
+            scrape_cache_ttl: float | None = None,
+            refresh_intervals: dict[str, float] | None = None,
+            alarms: bool = False,
+            collectors: list[str] | None = None,
+            sampling_interval: float | None = None,
+            sampling_window: float = 30.,
+            sampled_devices: list[str] | None = None,
+            concurrency: int = 100
+    ) -> None:
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self.loop.run_forever,
+            name=self.__class__.__name__,
+            daemon=True
+        )
+        self._loop_thread.start()
+        self._semaphore = None
+        super().__init__(
+            config,
+            insecure=insecure,
+            verbose=verbose,
+            login_timeout=login_timeout,
+            polling_interval=polling_interval,
+            discovery_ttl=discovery_ttl,
+            device_concurrency=device_concurrency,
+            scrape_timeout=scrape_timeout,
+            token_refresh_margin=token_refresh_margin,
+            state_file=state_file,
+            breaker_threshold=breaker_threshold,
+            breaker_max_backoff=breaker_max_backoff,
+            pool_size=pool_size,
+            keepalive_idle=keepalive_idle,
+            tls_session_resumption=tls_session_resumption,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            config_watch_interval=config_watch_interval,
+            scrape_cache_ttl=scrape_cache_ttl,
+            refresh_intervals=refresh_intervals,
+            alarms=alarms,
+            collectors=collectors,
+            sampling_interval=sampling_interval,
+            sampling_window=sampling_window,
+            sampled_devices=sampled_devices
+        )
+
+    def create_scraper(self,
+                       name: str,
+                       device: dict):
+        """Create the AsyncUPSScraper of a UPS of the config."""
+        return AsyncUPSScraper(
+            device['address'],
+            (device['user'], device['password']),
+            name,
+            insecure=self.insecure,
+            verbose=self.verbose,
+            login_timeout=self.login_timeout,
+            discovery_ttl=self.discovery_ttl,
+            device_concurrency=self.device_concurrency,
+            breaker_threshold=self.breaker_threshold,
+            breaker_max_backoff=self.breaker_max_backoff,
+            pool_size=self.pool_size,
+            keepalive_idle=self.keepalive_idle,
+            tls_session_resumption=self.tls_session_resumption,
+            refresh_intervals=self.refresh_intervals,
+            alarms=self.alarms,
+            collectors=[*self.collectors, *device.get('collectors', ())]
+        )
+
+    def close_scraper(self,
+                      ups) -> None:
+        """Close an AsyncUPSScraper removed from the config."""
+        asyncio.run_coroutine_threadsafe(ups.close(), self.loop).result()
+
+    def scrape_live(self):
+        """Scrape measure data from the UPSs.
+
+        :return: measures
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.scrape_all(), self.loop
+        )
+        yield from future.result()
+        self.save_state()
+
+    def scrape_device(self,
+                      ups) -> dict:
+        """Scrape measure data from a single UPS.
+
+        :param ups: AsyncUPSScraper
+            One of self.ups_devices
+        :return: measures, empty if the scrape failed
+        """
+        measures, = asyncio.run_coroutine_threadsafe(
+            self.scrape_all([ups]), self.loop
+        ).result()
+        self.save_state()
+        return measures
+
+    def sample_realtime(self):
+        """Load the realtime pages of the sampled UPSs, see UPSSampler.
+
+        :return: (name, pages) of each UPS sampled successfully
+        """
+        devices = self.sampled()
+
+        async def sample_all() -> list:
+            return list(await asyncio.gather(
+                *(ups.load_realtime() for ups in devices)
+            ))
+
+        samples = asyncio.run_coroutine_threadsafe(
+            sample_all(), self.loop
+        ).result()
+        for ups, pages in zip(devices, samples):
+            if pages is not None:
+                yield ups.name, pages
+
+    async def scrape_all(self,
+                         devices: list | None = None) -> list:
+        """Scrape the UPSs, at most self.concurrency at the same time.
+
+        :param devices: UPSs to scrape, by default all
+        """
+        if devices is None:
+            devices = self.ups_devices
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def scrape(ups: AsyncUPSScraper) -> dict:
+            async with self._semaphore:
+                return await asyncio.wait_for(
+                    ups.get_measures(), self.scrape_timeout
+                )
+
+        results = await asyncio.gather(
+            *(scrape(ups) for ups in devices),
+            return_exceptions=True
+        )
+        measures = []
+        for ups, result in zip(devices, results):
+            if isinstance(result, asyncio.TimeoutError):
+                self.logger.error(
+                    "Scrape of %s exceeded its deadline", ups.name
+                )
+                ups.stats.count_error(TIMEOUT_ERROR)
+                result = dict()
+            elif isinstance(result, BaseException):
+                self.logger.error(result)
+                result = dict()
+            self.scrape_success[ups.name] = bool(result)
+            measures.append(result)
+        return measures
+
+    def prewarm(self) -> int:
+        """Login to all UPSs and discover their API links concurrently.
+
+        :return: number of warm UPSs
+        """
+        warm = asyncio.run_coroutine_threadsafe(
+            self.prewarm_all(), self.loop
+        ).result()
+        self.save_state()
+        return warm
+
+    async def prewarm_all(self) -> int:
+        """Pre-warm all UPSs, at most self.concurrency at the same time."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def prewarm(ups: AsyncUPSScraper) -> bool:
+            async with self._semaphore:
+                return await ups.prewarm()
+
+        return sum(await asyncio.gather(*map(prewarm, self.ups_devices)))
+
+    def refresh_tokens(self) -> None:
+        """Renew the access tokens which expire within the refresh margin."""
+        asyncio.run_coroutine_threadsafe(
+            self.refresh_all_tokens(), self.loop
+        ).result()
+
+    async def refresh_all_tokens(self) -> None:
+        """Renew the access tokens of all UPSs at the same time."""
+        # unreachable UPSs are left to the probes of the circuit breaker
+        devices = [
+            ups for ups in self.ups_devices if ups.breaker.state == CLOSED
+        ]
+        results = await asyncio.gather(
+            *(ups.refresh_token(self.token_refresh_margin) for ups in devices),
+            return_exceptions=True
+        )
+        for ups, result in zip(devices, results):
+            if isinstance(result, LoginFailedException):
+                self.logger.error(
+                    "Token renewal of %s failed: %s", ups.name, result.message
+                )
+        self.save_state()
+
+    def close(self) -> None:
+        """Stop polling, close all sessions and the event loop."""
+        if self.config_watcher:
+            self.config_watcher.stop()
+        if self.token_refresher:
+            self.token_refresher.stop()
+        if self.poller:
+            self.poller.stop()
+        if self.sampler:
+            self.sampler.stop()
+        self.save_state()
+
+        async def close_sessions() -> None:
             for ups in self.ups_devices:
-                yield ups.get_measures()
+                await ups.close()
+
+        asyncio.run_coroutine_threadsafe(
+            close_sessions(), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+        self.loop.close()
+
+
+class ProcessUPSMultiExporter(UPSMultiExporter):
+    """Prometheus exporter for multiple UPSs, scraped by worker processes.
+
+    The UPSs are split across processes, so that TLS and JSON decoding use
+    all cores instead of a single interpreter. Each worker scrapes its UPSs
+    with threads, keeping their sessions and tokens, and only sends the
+    values of the metrics and the ScrapeStats back. The parent only keeps
+    a WorkerDevice per UPS. A worker that dies, or does not reply within
+    the deadline of its UPSs, is restarted.
+
+    :param config: str | dict
+        Path to the configuration file, or its content, containing UPS
+        ip/hostname, username, and password combinations for all UPSs to be
+        monitored
+    :param processes: int
+        Number of worker processes
+    :param options:
+        Keyword arguments of UPSMultiExporter. Polling, sharding, config
+        watching and the scrape cache (PARENT_OPTIONS) apply to the parent,
+        the others to the threaded UPSMultiExporter of each worker, with
+        scrape_workers threads per worker and the state_file of each worker
+        in <state_file>.<worker index>. Sampling is not supported
+    """
+    # options of UPSMultiExporter applied by the parent only
+    PARENT_OPTIONS = (
+        'polling_interval',
+        'shard_index',
+        'shard_count',
+        'config_watch_interval',
+        'scrape_cache_ttl',
+    )
+    # options the parent needs besides, to bound the replies of the workers
+    SHARED_OPTIONS = (
+        'verbose',
+        'login_timeout',
+        'scrape_timeout',
+        'scrape_workers',
+    )
+
+    def __init__(
+            self,
+            config: str | dict,
+            processes: int = 2,
+            **options
+    ) -> None:
+        if options.get('sampling_interval'):
+            raise ValueError("Sampling is not supported with processes")
+        worker_options = {
+            name: value for name, value in options.items()
+            if name not in self.PARENT_OPTIONS
+        }
+        worker_options['threading'] = True
+        state_file = worker_options.pop('state_file', None)
+        devices = list(shard_devices(
+            self.get_devices(config),
+            options.get('shard_index', 0),
+            options.get('shard_count', 1)
+        ).items())
+        # round robin, started before the poller of super().__init__
+        self.workers = []
+        for index in range(processes):
+            self.workers.append(ScrapeWorker(
+                UPSMultiExporter,
+                dict(devices[index::processes]),
+                dict(worker_options, state_file=state_file and
+                     f"{state_file}.{index}"),
+                f"{self.__class__.__name__}-{index}"
+            ))
+        self._worker_of = {
+            name: worker for worker in self.workers for name in worker.devices
+        }
+        self._devices: dict = {}
+        self._dispatch = ThreadPoolExecutor(
+            max_workers=max(len(self.workers), 1),
+            thread_name_prefix=self.__class__.__name__
+        )
+        super().__init__(config, **{
+            name: value for name, value in options.items()
+            if name in self.PARENT_OPTIONS or name in self.SHARED_OPTIONS
+        })
+
+    def get_ups_devices(self,
+                        config: str | dict) -> list:
+        """Creates the WorkerDevices of the UPSs.
+
+        :param config: str | dict
+            Path to a JSON-based config file or a config dict
+        :return: list
+            List of WorkerDevices
+        """
+        ups_devices = super().get_ups_devices(config)
+        self._devices = {ups.name: ups for ups in ups_devices}
+        return ups_devices
+
+    def create_scraper(self,
+                       name: str,
+                       device: dict) -> WorkerDevice:
+        """Create the WorkerDevice of a UPS, its worker scrapes it."""
+        return WorkerDevice(name, device['address'])
+
+    def reload(self,
+               config: str | dict | None = None) -> bool:
+        """Apply a changed config, e.g. on SIGHUP.
+
+        UPSs stay on their worker, which keeps their sessions and tokens,
+        added UPSs go to the workers with the fewest UPSs.
+
+        :param config: str | dict | None
+            New config, None reads self.config again
+        :return: whether the UPSs changed
+        """
+        with self._reload_lock:
+            if not super().reload(config):
+                return False
+            self._devices = {ups.name: ups for ups in self.ups_devices}
+            assignment: dict[ScrapeWorker, dict] = {
+                worker: {} for worker in self.workers
+            }
+            added = {}
+            for name, device in self.device_configs.items():
+                worker = self._worker_of.get(name)
+                if worker is None:
+                    added[name] = device
+                else:
+                    assignment[worker][name] = device
+            for name, device in added.items():
+                worker = min(
+                    self.workers, key=lambda worker: len(assignment[worker])
+                )
+                assignment[worker][name] = device
+            for worker, devices in assignment.items():
+                worker.config = devices
+                self.request(worker, 'reload', devices)
+            self._worker_of = {
+                name: worker
+                for worker in self.workers for name in worker.devices
+            }
+            return True
+
+    def reply_timeout(self,
+                      worker: ScrapeWorker,
+                      command: str) -> float:
+        """Seconds to wait for the reply of a worker to a command."""
+        if command == 'prewarm':
+            # a login and the discovery per UPS, scrape_workers at a time
+            scrape_workers = self.scrape_workers
+            rounds = math.ceil(
+                len(worker.devices) / scrape_workers
+            ) if scrape_workers else 1
+            return rounds * (self.login_timeout + 2 * REQUEST_TIMEOUT) \
+                + REPLY_MARGIN
+        return self.wait_timeout() + REPLY_MARGIN
+
+    def request(self,
+                worker: ScrapeWorker,
+                command: str,
+                argument=None):
+        """Send a command to a worker and apply the state it reports.
+
+        A worker that died or did not reply in time is restarted, its UPSs
+        count as failed.
+
+        :return: the result of the command, None if the worker failed
+        """
+        try:
+            result, status = worker.request(
+                command, argument, self.reply_timeout(worker, command)
+            )
+        except (EOFError, OSError, TimeoutError) as err:
+            self.logger.error(
+                "Worker %s failed, restarting it: %r", worker.name, err
+            )
+            for name in worker.devices:
+                self.scrape_success[name] = False
+            worker.restart()
+            return None
+        for name, (stats, state, warm, success) in status.items():
+            ups = self._devices[name]
+            ups.stats = stats
+            ups.breaker.state = state
+            ups.warm = warm
+            if success is not None:
+                self.scrape_success[name] = success
+        return result
+
+    def scrape_live(self):
+        """Scrape measure data from the UPSs, all workers in parallel.
+
+        :return: compacted measures
+        """
+        for result in self._dispatch.map(
+                lambda worker: self.request(worker, 'scrape'), self.workers
+        ):
+            yield from result or ()
+
+    def scrape_device(self,
+                      ups) -> dict:
+        """Scrape measure data from a single UPS, by its worker.
+
+        :param ups: WorkerDevice
+            One of self.ups_devices
+        :return: compacted measures, empty if the scrape failed
+        """
+        return self.request(
+            self._worker_of[ups.name], 'probe', ups.name
+        ) or {}
+
+    def prewarm(self) -> int:
+        """Login to all UPSs and discover their API links, in the workers.
+
+        :return: number of warm UPSs
+        """
+        return sum(
+            self._dispatch.map(
+                lambda worker: self.request(worker, 'prewarm') or 0,
+                self.workers
+            )
+        )
+
+    def close(self) -> None:
+        """Stop polling and all workers."""
+        super().close()
+        for worker in self.workers:
+            worker.close()
+        self._dispatch.shutdown()
@@ -0,0 +1,268 @@
+"""Metrics of the exporter about itself."""
+import threading
+import time
+
+from contextlib import contextmanager
+from prometheus_client.core import (
+        CounterMetricFamily,
+        GaugeMetricFamily,
+        InfoMetricFamily,
+        Metric,
+        SummaryMetricFamily,
+        )
+
+from prometheus_eaton_ups_exporter.breaker import STATES
+
+from typing import Generator
+
+
+class Durations:
+    """Number, sum and last value of observed durations."""
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.last: float | None = None
+
+    def observe(self,
+                seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.last = seconds
+
+
+class ScrapeStats:
+    """Counters and durations of the scrapes of a single UPS.
+
+    Kept by UPSScraper and AsyncUPSScraper, exported by ExporterCollector.
+    Phases may nest: the discovery includes the first login of a UPS.
+    Picklable, to send them from scrape worker processes.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.scrape = Durations()
+        self.failures = 0
+        self.skipped = 0
+        self.phases: dict[str, Durations] = {}
+        self.logins = 0
+        self.relogins = 0
+        self.errors: dict[int, int] = {}
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.tls_resumed = 0
+
+    def __getstate__(self) -> dict:
+        with self._lock:
+            state = self.__dict__.copy()
+            state['phases'] = dict(self.phases)
+            state['errors'] = dict(self.errors)
+        del state['_lock']
+        return state
+
+    def __setstate__(self,
+                     state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def observe_phase(self,
+                      phase: str,
+                      seconds: float) -> None:
+        with self._lock:
+            durations = self.phases.get(phase)
+            if durations is None:
+                durations = self.phases[phase] = Durations()
+            durations.observe(seconds)
+
+    @contextmanager
+    def timed(self,
+              phase: str) -> Generator[None, None, None]:
+        """Measure the duration of a phase of the scrape."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(phase, time.perf_counter() - start)
+
+    def observe_scrape(self,
+                       seconds: float,
+                       success: bool) -> None:
+        with self._lock:
+            self.scrape.observe(seconds)
+            if not success:
+                self.failures += 1
+
+    def count_skipped(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def count_login(self,
+                    relogin: bool = False) -> None:
+        with self._lock:
+            self.logins += 1
+            if relogin:
+                self.relogins += 1
+
+    def count_request(self,
+                      new_connections: int = 0) -> None:
+        """Count a request, and the connections opened for it."""
+        with self._lock:
+            self.requests += 1
+            self.new_connections += new_connections
+
+    def count_tls_handshake(self,
+                            resumed: bool) -> None:
+        with self._lock:
+            self.tls_handshakes += 1
+            if resumed:
+                self.tls_resumed += 1
+
+    def count_error(self,
+                    error_code: int) -> None:
+        with self._lock:
+            self.errors[error_code] = self.errors.get(error_code, 0) + 1
+
+
+def endpoint_phase(link: str) -> str:
+    """Phase name of loading a measurement endpoint, e.g. inputs.
+
+    Links to the members of a subsystem share its phase, e.g. outlets.
+    """
+    return link.removeprefix("ups_").split("/")[0]
+
+
+class ExporterCollector:
+    """Prometheus collector of the exporter's own metrics.
+
+    Registered beside a UPSMultiExporter, it reports the ScrapeStats of
+    its scrapers and the time spent in its collect().
+
+    :param exporter: UPSMultiExporter
+        Exporter to report on
+    """
+    def __init__(self,
+                 exporter) -> None:
+        self.exporter = exporter
+
+    def collect(self) -> Generator[Metric, None, None]:
+        """Export the exporter's metrics on request."""
+        duration = GaugeMetricFamily(
+            "eaton_ups_exporter_scrape_duration_seconds",
+            'Duration of the last scrape of the UPS',
+            labels=['ups_id']
+        )
+        scrapes = CounterMetricFamily(
+            "eaton_ups_exporter_scrapes",
+            'Scrapes of the UPS, by result (skipped by the circuit breaker)',
+            labels=['ups_id', 'result']
+        )
+        phases = SummaryMetricFamily(
+            "eaton_ups_exporter_phase_duration_seconds",
+            'Time spent in a phase of the scrapes of the UPS '
+            '(discovery, login, alarms, or loading an endpoint)',
+            labels=['ups_id', 'phase']
+        )
+        logins = CounterMetricFamily(
+            "eaton_ups_exporter_logins",
+            'Logins to the UPS',
+            labels=['ups_id']
+        )
+        relogins = CounterMetricFamily(
+            "eaton_ups_exporter_relogins",
+            'Logins to the UPS replacing a rejected or expiring token',
+            labels=['ups_id']
+        )
+        errors = CounterMetricFamily(
+            "eaton_ups_exporter_errors",
+            'Failed scrapes of the UPS, by LoginFailedException error code',
+            labels=['ups_id', 'error_code']
+        )
+        connections = CounterMetricFamily(
+            "eaton_ups_exporter_connections",
+            'Requests to the UPS by connection, new or reused (keep-alive)',
+            labels=['ups_id', 'connection']
+        )
+        handshakes = CounterMetricFamily(
+            "eaton_ups_exporter_tls_handshakes",
+            'TLS handshakes with the UPS, full or resuming a session',
+            labels=['ups_id', 'handshake']
+        )
+        breaker = GaugeMetricFamily(
+            "eaton_ups_exporter_circuit_breaker_state",
+            'State of the circuit breaker of the UPS, 1 for the current one',
+            labels=['ups_id', 'state']
+        )
+        shard = InfoMetricFamily(
+            "eaton_ups_exporter_shard",
+            'Shard of the exporter owning the UPS',
+            labels=['ups_id']
+        )
+        shard_info = {
+            'shard_index': str(self.exporter.shard_index),
+            'shard_count': str(self.exporter.shard_count),
+        }
+
+        for ups in self.exporter.ups_devices:
+            ups_id = ups.name or ups.ups_address
+            shard.add_metric([ups_id], shard_info)
+            stats = ups.stats
+            with stats._lock:
+                if stats.scrape.last is not None:
+                    duration.add_metric([ups_id], stats.scrape.last)
+                scrapes.add_metric(
+                    [ups_id, 'success'], stats.scrape.count - stats.failures
+                )
+                scrapes.add_metric([ups_id, 'failure'], stats.failures)
+                scrapes.add_metric([ups_id, 'skipped'], stats.skipped)
+                connections.add_metric(
+                    [ups_id, 'new'], stats.new_connections
+                )
+                connections.add_metric(
+                    [ups_id, 'reused'],
+                    max(stats.requests - stats.new_connections, 0)
+                )
+                handshakes.add_metric(
+                    [ups_id, 'full'], stats.tls_handshakes - stats.tls_resumed
+                )
+                handshakes.add_metric([ups_id, 'resumed'], stats.tls_resumed)
+                for state in STATES:
+                    breaker.add_metric(
+                        [ups_id, state], int(ups.breaker.state == state)
+                    )
+                for phase, durations in sorted(stats.phases.items()):
+                    phases.add_metric(
+                        [ups_id, phase], durations.count, durations.sum
+                    )
+                logins.add_metric([ups_id], stats.logins)
+                relogins.add_metric([ups_id], stats.relogins)
+                for error_code, count in sorted(stats.errors.items()):
+                    errors.add_metric([ups_id, str(error_code)], count)
+
+        yield duration
+        yield scrapes
+        yield phases
+        yield logins
+        yield relogins
+        yield errors
+        yield connections
+        yield handshakes
+        yield breaker
+        yield shard
+
+        coalescer = self.exporter.coalescer
+        coalesced = CounterMetricFamily(
+            "eaton_ups_exporter_coalesced_scrapes",
+            'Collects and probes served by the scrape of a concurrent one '
+            '(shared) or by a recent scrape (cached)',
+            labels=['reason']
+        )
+        coalesced.add_metric(['shared'], coalescer.shared)
+        coalesced.add_metric(['cached'], coalescer.cached)
+        yield coalesced
+
+        collect = self.exporter.collect_durations
+        yield SummaryMetricFamily(
+            "eaton_ups_exporter_collect_duration_seconds",
+            'Time spent collecting the UPS metrics',
+            count_value=collect.count,
+            sum_value=collect.sum
+        )
@@ -0,0 +1,215 @@
+"""
+Declarative table of the exported UPS metrics.
+
+Each metric names the source document of the UPS measures it is read from,
+the key within that document and an optional transformation. The table is
+compiled once at import, collecting only evaluates the compiled getters.
+"""
+from prometheus_client.core import GaugeMetricFamily
+
+from prometheus_eaton_ups_exporter.alarms import ALARMS
+
+from typing import Any, Callable, Iterable, NamedTuple
+
+
+def realtime_measures(document: dict) -> dict:
+    """Measures of an input or output, realtime ones if available."""
+    measures = document['measures']
+    return measures.get('realtime', measures)
+
+
+# Documents of the measures returned by UPSScraper.get_measures
+SOURCES: dict[str, Callable[[dict], dict]] = {
+    'inputs': lambda measures: realtime_measures(measures['ups_inputs']),
+    'outputs': lambda measures: realtime_measures(measures['ups_outputs']),
+    'battery': lambda measures: measures['ups_powerbank']['measures'],
+    'battery_status': lambda measures: measures['ups_powerbank']['status'],
+}
+
+
+def percent_to_ratio(value: Any) -> float:
+    """Convert a percentage into a ratio."""
+    return int(value) / 100
+
+
+def integer_or_zero(value: Any) -> int:
+    """Keep integer values, replace others (e.g. text) by zero."""
+    return value if isinstance(value, int) else 0
+
+
+class MetricSpec(NamedTuple):
+    """A gauge exported per UPS.
+
+    :param name: Name of the metric
+    :param documentation: Help text of the metric
+    :param source: Key of the document in SOURCES
+    :param key: Key of the value within the document
+    :param transform: Conversion of the value into the metric's unit
+    :param default: Value if the key is missing, None skips the sample
+    """
+    name: str
+    documentation: str
+    source: str
+    key: str
+    transform: Callable[[Any], float] | None = None
+    default: float | None = None
+
+
+METRICS = (
+    MetricSpec(
+        "eaton_ups_input_volts",
+        'UPS input voltage (V)',
+        'inputs', 'voltage'
+    ),
+    MetricSpec(
+        "eaton_ups_input_hertz",
+        'UPS input frequency (Hz)',
+        'inputs', 'frequency'
+    ),
+    MetricSpec(
+        "eaton_ups_input_amperes",
+        'UPS input current (A)',
+        'inputs', 'current', default=0
+    ),
+    MetricSpec(
+        "eaton_ups_output_volts",
+        'UPS output voltage (V)',
+        'outputs', 'voltage'
+    ),
+    MetricSpec(
+        "eaton_ups_output_hertz",
+        'UPS output frequency (Hz)',
+        'outputs', 'frequency'
+    ),
+    MetricSpec(
+        "eaton_ups_output_amperes",
+        'UPS output current (A)',
+        'outputs', 'current'
+    ),
+    MetricSpec(
+        "eaton_ups_output_voltamperes",
+        'UPS output apparent power (VA)',
+        'outputs', 'apparentPower'
+    ),
+    MetricSpec(
+        "eaton_ups_output_watts",
+        'UPS output active power (W)',
+        'outputs', 'activePower'
+    ),
+    MetricSpec(
+        "eaton_ups_output_power_factor",
+        'UPS output power factor',
+        'outputs', 'powerFactor'
+    ),
+    MetricSpec(
+        "eaton_ups_output_load_ratio",
+        "Ratio of the output apparent power vs. "
+        "the UPS's capacity in VA.",
+        'outputs', 'percentLoad', percent_to_ratio
+    ),
+    MetricSpec(
+        "eaton_ups_battery_volts",
+        'UPS battery voltage (V)',
+        'battery', 'voltage'
+    ),
+    MetricSpec(
+        "eaton_ups_battery_capacity_ratio",
+        'Ratio of the remaining charge vs the total battery capacity',
+        'battery', 'remainingChargeCapacity', percent_to_ratio, default=0
+    ),
+    MetricSpec(
+        "eaton_ups_battery_remaining_seconds",
+        'UPS remaining battery time (s)',
+        'battery', 'remainingTime'
+    ),
+    MetricSpec(
+        "eaton_ups_battery_health",
+        'UPS health status given as the '
+        'remaining lifetime (years) [uncertain]',
+        'battery_status', 'health', integer_or_zero
+    ),
+)
+
+
+def compile_metric(spec: MetricSpec) -> Callable[[dict], float | None]:
+    """Build the getter of a metric's value from the resolved sources."""
+    source, key, default = spec.source, spec.key, spec.default
+    transform = spec.transform
+
+    def get_value(sources: dict) -> float | None:
+        value = sources[source].get(key)
+        if value is None:
+            return default
+        if transform is not None:
+            return transform(value)
+        return value
+
+    return get_value
+
+
+COMPILED_METRICS = tuple(
+    (spec, compile_metric(spec)) for spec in METRICS
+)
+
+
+def resolve_sources(measures: dict) -> dict:
+    """Look up all source documents of the measures of a UPS."""
+    return {
+        source: extract(measures) for source, extract in SOURCES.items()
+    }
+
+
+# Key of the metric values in compacted measures, see compact_measures
+METRIC_VALUES = 'metric_values'
+
+
+def metric_values(measures: dict) -> tuple:
+    """Values of all metrics of a UPS, in the order of METRICS."""
+    sources = resolve_sources(measures)
+    return tuple(get_value(sources) for _, get_value in COMPILED_METRICS)
+
+
+def compact_measures(measures: dict) -> dict:
+    """Reduce the measures of a UPS to the values of the exported metrics.
+
+    Much smaller than the full measures, e.g. to send them to another
+    process, and accepted by gauges_from_measures all the same.
+
+    :param measures: Measures as returned by UPSScraper.get_measures
+    :return: dict with the ups_id, METRIC_VALUES and alarms if any,
+        empty if measures is
+    """
+    if not measures:
+        return {}
+    compacted = {
+        'ups_id': measures['ups_id'],
+        METRIC_VALUES: metric_values(measures),
+    }
+    if ALARMS in measures:
+        compacted[ALARMS] = measures[ALARMS]
+    return compacted
+
+
+def gauges_from_measures(
+        ups_data: Iterable[dict]) -> list[GaugeMetricFamily]:
+    """Create one gauge per metric, with one sample per UPS.
+
+    :param ups_data: Measures as returned by UPSScraper.get_measures,
+        or compacted by compact_measures
+    :return: list of gauges in the order of METRICS
+    """
+    gauges = [
+        GaugeMetricFamily(spec.name, spec.documentation, labels=['ups_id'])
+        for spec, _ in COMPILED_METRICS
+    ]
+    for measures in ups_data:
+        if not measures:
+            continue
+        ups_id = [measures['ups_id']]
+        values = measures.get(METRIC_VALUES)
+        if values is None:
+            values = metric_values(measures)
+        for gauge, value in zip(gauges, values):
+            if value is not None:
+                gauge.add_metric(ups_id, value)
+    return gauges
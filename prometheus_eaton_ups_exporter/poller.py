@@ -0,0 +1,139 @@
+"""Background polling of UPS measures, decoupled from Prometheus scrapes."""
+import threading
+import time
+
+from prometheus_client.core import GaugeMetricFamily
+
+from prometheus_eaton_ups_exporter import create_logger
+
+from typing import Callable, Generator, Iterable, NamedTuple
+
+
+class DeviceSnapshot(NamedTuple):
+    """Latest successful measures of a single UPS.
+
+    :param ups_id: str
+        Name of the UPS
+    :param measures: dict
+        Measures as returned by UPSScraper.get_measures
+    :param last_success: float
+        Unix timestamp of the poll that produced the measures
+    """
+    ups_id: str
+    measures: dict
+    last_success: float
+
+
+class UPSPoller:
+    """Refresh the measures of multiple UPSs in a background thread.
+
+    Prometheus scrapes are then served from the latest snapshot instead of
+    waiting for the UPSs. Measures of a UPS that fails to respond are kept
+    until the next successful poll, their age is exported alongside.
+
+    :param scrape: Callable[[], Iterable[dict]]
+        Function returning the measures of all UPSs, e.g.
+        UPSMultiExporter.scrape_live
+    :param interval: float
+        Seconds between the start of two polls
+    :param verbose: bool
+        Allow logging output for development
+    """
+    def __init__(self,
+                 scrape: Callable[[], Iterable[dict]],
+                 interval: float,
+                 verbose: bool = False) -> None:
+        self.logger = create_logger(
+            f"{__name__}.{self.__class__.__name__}", not verbose
+        )
+        self.scrape = scrape
+        self.interval = interval
+        self.snapshots: dict[str, DeviceSnapshot] = {}
+        # called after each poll, see subscribe
+        self.listeners: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start polling in a daemon thread, the first poll runs at once."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=self.__class__.__name__,
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self,
+             timeout: float | None = None) -> None:
+        """Stop polling and wait for a running poll to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def poll(self) -> None:
+        """Scrape all UPSs once and update their snapshots."""
+        for measures in self.scrape():
+            if not measures:
+                continue
+            snapshot = DeviceSnapshot(
+                measures['ups_id'], measures, time.time()
+            )
+            with self._lock:
+                self.snapshots[snapshot.ups_id] = snapshot
+        for listener in self.listeners:
+            listener()
+
+    def subscribe(self,
+                  listener: Callable[[], None]) -> None:
+        """Call listener after each poll, e.g. to render the metrics."""
+        self.listeners.append(listener)
+
+    def discard(self,
+                ups_ids: Iterable[str]) -> None:
+        """Drop the snapshots of UPSs, e.g. removed from the config."""
+        with self._lock:
+            for ups_id in ups_ids:
+                self.snapshots.pop(ups_id, None)
+
+    def snapshot(self) -> list[DeviceSnapshot]:
+        """Return the latest snapshots of all UPSs."""
+        with self._lock:
+            return list(self.snapshots.values())
+
+    def collect(self) -> Generator[GaugeMetricFamily, None, None]:
+        """Export the last-success timestamp and age of each snapshot."""
+        snapshots = self.snapshot()
+        now = time.time()
+
+        gauge = GaugeMetricFamily(
+            "eaton_ups_last_success_timestamp_seconds",
+            'Unix timestamp of the last successful poll of the UPS',
+            labels=['ups_id']
+        )
+        for snapshot in snapshots:
+            gauge.add_metric([snapshot.ups_id], snapshot.last_success)
+        yield gauge
+
+        gauge = GaugeMetricFamily(
+            "eaton_ups_data_age_seconds",
+            'Seconds since the last successful poll of the UPS',
+            labels=['ups_id']
+        )
+        for snapshot in snapshots:
+            gauge.add_metric([snapshot.ups_id], now - snapshot.last_success)
+        yield gauge
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception as err:
+                self.logger.exception(err)
+            elapsed = time.monotonic() - start
+            self._stop_event.wait(max(0., self.interval - elapsed))
@@ -0,0 +1,204 @@
+"""High frequency sampling of the realtime measures of UPSs."""
+import math
+import threading
+import time
+
+from array import array
+from prometheus_client.core import GaugeMetricFamily
+
+from prometheus_eaton_ups_exporter import create_logger
+from prometheus_eaton_ups_exporter.metrics import COMPILED_METRICS, SOURCES
+
+from typing import Callable, Generator, Iterable, Tuple
+
+# Sources of the sampled metrics, loaded by UPSScraper.load_realtime
+SAMPLED_SOURCES = ('inputs', 'outputs')
+SAMPLED_METRICS = tuple(
+    (spec, get_value) for spec, get_value in COMPILED_METRICS
+    if spec.source in SAMPLED_SOURCES
+)
+AGGREGATES = ('min', 'max', 'mean', 'last')
+
+
+def sampled_values(pages: dict) -> list[float]:
+    """Values of the SAMPLED_METRICS in realtime pages, NaN if missing.
+
+    :param pages: see UPSScraper.load_realtime
+    """
+    sources = {source: SOURCES[source](pages) for source in SAMPLED_SOURCES}
+    values = []
+    for _, get_value in SAMPLED_METRICS:
+        value = get_value(sources)
+        values.append(math.nan if value is None else float(value))
+    return values
+
+
+class SampleWindow:
+    """Ring buffer of the latest samples of a UPS, in a single array.
+
+    Each row holds the time of a sample and the value of each metric, the
+    memory is fixed to capacity rows.
+
+    :param metrics: int
+        Number of values per sample
+    :param capacity: int
+        Number of samples kept
+    """
+    def __init__(self,
+                 metrics: int,
+                 capacity: int) -> None:
+        self.width = metrics + 1
+        self.capacity = capacity
+        self.rows = array('d', [math.nan]) * (capacity * self.width)
+        self.next = 0
+
+    def append(self,
+               timestamp: float,
+               values: list[float]) -> None:
+        """Add a sample, replacing the oldest one once full."""
+        offset = self.next * self.width
+        self.rows[offset] = timestamp
+        self.rows[offset + 1:offset + self.width] = array('d', values)
+        self.next = (self.next + 1) % self.capacity
+
+    def aggregate(self,
+                  since: float) -> list[Tuple[float, float, float, float]
+                                        | None]:
+        """Min, max, mean and last value of each metric since a time.
+
+        :return: per metric, None if there is no sample of it
+        """
+        width, rows = self.width, self.rows
+        # oldest first, so that the last sample comes last
+        order = [
+            (self.next + index) % self.capacity
+            for index in range(self.capacity)
+        ]
+        aggregates: list = []
+        for metric in range(1, width):
+            values = [
+                rows[row * width + metric] for row in order
+                if rows[row * width] >= since
+                and not math.isnan(rows[row * width + metric])
+            ]
+            if values:
+                aggregates.append((
+                    min(values), max(values),
+                    math.fsum(values) / len(values), values[-1]
+                ))
+            else:
+                aggregates.append(None)
+        return aggregates
+
+
+class UPSSampler:
+    """Sample the realtime measures of UPSs in a background thread.
+
+    Short voltage sags or load spikes between two Prometheus scrapes are
+    then reported by the min, max and mean of the samples of the last
+    window seconds, e.g. eaton_ups_input_volts_min.
+
+    :param sample: Callable[[], Iterable[Tuple[str, dict]]]
+        Function returning the realtime pages of the sampled UPSs by name,
+        e.g. UPSMultiExporter.sample_realtime
+    :param interval: float
+        Seconds between the start of two samples
+    :param window: float
+        Seconds of samples aggregated per scrape
+    :param verbose: bool
+        Allow logging output for development
+    """
+    def __init__(self,
+                 sample: Callable[[], Iterable[Tuple[str, dict]]],
+                 interval: float,
+                 window: float,
+                 verbose: bool = False) -> None:
+        self.logger = create_logger(
+            f"{__name__}.{self.__class__.__name__}", not verbose
+        )
+        self.sample = sample
+        self.interval = interval
+        self.window = window
+        self.capacity = max(math.ceil(window / interval), 1) + 1
+        self.windows: dict[str, SampleWindow] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start sampling in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=self.__class__.__name__,
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self,
+             timeout: float | None = None) -> None:
+        """Stop sampling and wait for a running sample to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def sample_once(self) -> None:
+        """Sample all UPSs once."""
+        for ups_id, pages in self.sample():
+            try:
+                values = sampled_values(pages)
+            except (KeyError, TypeError, ValueError) as err:
+                self.logger.error(
+                    "Unexpected realtime measures of %s: %r", ups_id, err
+                )
+                continue
+            now = time.monotonic()
+            with self._lock:
+                window = self.windows.get(ups_id)
+                if window is None:
+                    window = self.windows[ups_id] = SampleWindow(
+                        len(SAMPLED_METRICS), self.capacity
+                    )
+                window.append(now, values)
+
+    def discard(self,
+                ups_ids: Iterable[str]) -> None:
+        """Drop the samples of UPSs, e.g. removed from the config."""
+        with self._lock:
+            for ups_id in ups_ids:
+                self.windows.pop(ups_id, None)
+
+    def collect(self) -> Generator[GaugeMetricFamily, None, None]:
+        """Export the aggregates of the samples of the last window."""
+        since = time.monotonic() - self.window
+        with self._lock:
+            aggregates = {
+                ups_id: window.aggregate(since)
+                for ups_id, window in self.windows.items()
+            }
+        for index, (spec, _) in enumerate(SAMPLED_METRICS):
+            for position, aggregate in enumerate(AGGREGATES):
+                gauge = GaugeMetricFamily(
+                    f"{spec.name}_{aggregate}",
+                    f"{spec.documentation}, {aggregate} of the samples "
+                    f"of the last {self.window:g} s",
+                    labels=['ups_id']
+                )
+                for ups_id, metrics in aggregates.items():
+                    values = metrics[index]
+                    if values is not None:
+                        gauge.add_metric([ups_id], values[position])
+                yield gauge
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            try:
+                self.sample_once()
+            except Exception as err:
+                self.logger.exception(err)
+            elapsed = time.monotonic() - start
+            self._stop_event.wait(max(0., self.interval - elapsed))
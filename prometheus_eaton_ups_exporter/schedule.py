@@ -0,0 +1,63 @@
+"""Refresh intervals of the measurement endpoints of a UPS."""
+import threading
+import time
+
+from prometheus_eaton_ups_exporter.instrumentation import endpoint_phase
+
+from typing import Callable, Tuple
+
+
+class EndpointSchedule:
+    """Load slowly changing endpoints less often than realtime ones.
+
+    Endpoints without an interval are loaded on every scrape. The others
+    are only loaded again once their interval passed, scrapes in between
+    reuse their last page.
+
+    :param intervals: dict[str, float] | None
+        Seconds between two loads of an endpoint, by endpoint name without
+        the ups_ prefix, e.g. {'powerbank': 3600}
+    :param clock: Callable[[], float]
+        Monotonic clock, replaceable for tests
+    """
+    def __init__(self,
+                 intervals: dict[str, float] | None = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.intervals = intervals or {}
+        self.clock = clock
+        self._lock = threading.Lock()
+        # link -> (time.monotonic() at which to load it again, page)
+        self._pages: dict[str, Tuple[float, dict]] = {}
+
+    def plan(self,
+             links: dict) -> Tuple[dict, dict]:
+        """Split the links of a scrape into due ones and cached pages.
+
+        :param links: see UPSScraper.get_links
+        :return: the links to load, and the pages of the others by link
+        """
+        now = self.clock()
+        due, cached = {}, {}
+        with self._lock:
+            for link, url in links.items():
+                page = self._pages.get(link)
+                if page is not None and now < page[0]:
+                    cached[link] = page[1]
+                else:
+                    due[link] = url
+        return due, cached
+
+    def store(self,
+              pages: dict) -> None:
+        """Keep the freshly loaded pages of endpoints with an interval."""
+        now = self.clock()
+        with self._lock:
+            for link, page in pages.items():
+                interval = self.intervals.get(endpoint_phase(link))
+                if interval:
+                    self._pages[link] = (now + interval, page)
+
+    def clear(self) -> None:
+        """Forget all pages, e.g. when the API links changed."""
+        with self._lock:
+            self._pages.clear()
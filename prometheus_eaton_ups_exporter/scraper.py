@@ -1,5 +1,9 @@
 """REST API web scraper for Eaton UPS measure data."""
 import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from requests import Session, Response
 from requests.exceptions import (
@@ -12,8 +16,17 @@ from requests.exceptions import (
 # pyre-ignore[21]: pyre thinks urllib3 is not part of requests
 from requests.packages import urllib3
 from prometheus_eaton_ups_exporter import create_logger
+from prometheus_eaton_ups_exporter.alarms import ALARMS, AlarmLog
+from prometheus_eaton_ups_exporter.breaker import CLOSED, CircuitBreaker
+from prometheus_eaton_ups_exporter.instrumentation import (
+        ScrapeStats,
+        endpoint_phase,
+        )
+from prometheus_eaton_ups_exporter.schedule import EndpointSchedule
 from prometheus_eaton_ups_exporter.scraper_globals import (
         AUTHENTICATION_FAILED,
+        BREAKER_MAX_BACKOFF,
+        BREAKER_THRESHOLD,
         CERTIFICATE_VERIFY_FAILED,
         CONNECTION_ERROR,
         INPUT_MEMBER_ID,
@@ -23,12 +36,86 @@ from prometheus_eaton_ups_exporter.scraper_globals import (
         LoginFailedException,
         MISSING_SCHEMA_ERROR,
         OUTPUT_MEMBER_ID,
+        REALTIME_LINKS,
         REQUEST_TIMEOUT,
         REST_API_PATH,
         SSL_ERROR,
         TIMEOUT_ERROR,
         )
-from typing import Tuple
+from prometheus_eaton_ups_exporter.subsystems import (
+        enabled_collectors,
+        is_subsystem_link,
+        subsystem_links,
+        )
+from prometheus_eaton_ups_exporter.transport import (
+        UPSAdapter,
+        create_ssl_context,
+        default_pool_size,
+        )
+from typing import Any, Iterable, Tuple
+
+try:
+    # faster JSON decoding, if installed
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# marker for a UPSResponse that was not decoded yet
+_NOT_DECODED = object()
+
+
+def json_loads(content: bytes | str) -> Any:
+    """Decode JSON content, with orjson if it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class UPSResponse:
+    """
+    Response of the UPS API, whose JSON content is decoded only once.
+
+    :param response: requests.Response
+        Response to a request to the UPS
+    """
+    def __init__(self,
+                 response: Response) -> None:
+        self.response = response
+        self.status_code = response.status_code
+        self._document: Any = _NOT_DECODED
+        self._error: ValueError | None = None
+
+    @property
+    def content(self) -> bytes:
+        """Raw content of the response."""
+        return self.response.content
+
+    @property
+    def text(self) -> str:
+        """Content of the response as text."""
+        return self.response.text
+
+    def json(self) -> Any:
+        """
+        Decode the JSON content on first call, then return it again.
+
+        :raises json.decoder.JSONDecodeError: if the content is no JSON
+        """
+        if self._document is _NOT_DECODED:
+            try:
+                self._document = json_loads(self.response.content)
+            except ValueError as err:
+                self._document, self._error = None, err
+        error = self._error
+        if error is not None:
+            raise error
+        return self._document
+
+
+class ScrapeContext(threading.local):
+    """State of the scrape running in the current thread."""
+    # time.monotonic() by which the scrape must end, None without timeout
+    deadline: float | None = None
 
 
 class UPSScraper:
@@ -48,6 +135,36 @@ class UPSScraper:
         Allow logging output for development
     :param login_timeout: float
         Login timeout for authentication
+    :param discovery_ttl: float | None
+        Seconds to cache the discovered API links for,
+        None caches them until they become invalid
+    :param device_concurrency: int
+        Maximum number of parallel requests to the UPS once the API links
+        are known, 1 loads the measurement endpoints sequentially
+    :param scrape_timeout: float | None
+        Deadline for a whole get_measures call, including the login and all
+        requests, None only applies the login and request timeouts
+    :param breaker_threshold: int
+        Consecutive connection errors or timeouts after which scrapes are
+        skipped for an exponential backoff, 0 disables the circuit breaker
+    :param breaker_max_backoff: float
+        Maximum seconds to skip scrapes while the UPS is unreachable
+    :param pool_size: int | None
+        Maximum number of connections kept open to the UPS,
+        None keeps up to max(10, device_concurrency) connections
+    :param keepalive_idle: float | None
+        Seconds after which idle connections to the UPS are closed,
+        None keeps them open until the UPS closes them
+    :param tls_session_resumption: bool
+        Whether new connections resume the TLS session of earlier ones
+    :param refresh_intervals: dict[str, float] | None
+        Seconds between two loads of a measurement endpoint, by endpoint
+        (inputs, outputs, powerbank), others are loaded on every scrape
+    :param alarms: bool
+        Whether each scrape also reads the new events of the alarm log
+    :param collectors: Iterable[str]
+        Subsystems to load on each scrape besides the measurement
+        endpoints, see SUBSYSTEMS
     """
     def __init__(self,
                  ups_address: str,
@@ -55,14 +172,38 @@ class UPSScraper:
                  name: str | None = None,
                  insecure: bool = False,
                  verbose: bool = False,
-                 login_timeout: int = 3) -> None:
+                 login_timeout: int = 3,
+                 discovery_ttl: float | None = None,
+                 device_concurrency: int = 1,
+                 scrape_timeout: float | None = None,
+                 breaker_threshold: int = BREAKER_THRESHOLD,
+                 breaker_max_backoff: float = BREAKER_MAX_BACKOFF,
+                 pool_size: int | None = None,
+                 keepalive_idle: float | None = None,
+                 tls_session_resumption: bool = False,
+                 refresh_intervals: dict[str, float] | None = None,
+                 alarms: bool = False,
+                 collectors: Iterable[str] = ()) -> None:
         self.ups_address = ups_address
         self.username, self.password = authentication
         self.name = name
         self.login_timeout = login_timeout
-        self.session = Session()
         self.logger = create_logger(__name__, not verbose)
 
+        self.stats = ScrapeStats()
+        self.session = Session()
+        adapter = UPSAdapter(
+            pool_size=pool_size or default_pool_size(device_concurrency),
+            keepalive_idle=keepalive_idle,
+            ssl_context=create_ssl_context(
+                insecure, self.stats
+            ) if tls_session_resumption else None,
+            stats=self.stats,
+            insecure=insecure
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
         # ignore self signed certificate
         self.session.verify = not insecure
         # disable warnings created because of ignoring certificates
@@ -71,6 +212,36 @@ class UPSScraper:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
         self.token_type, self.access_token = None, None
+        # time.monotonic() at which the access token expires, if known
+        self.token_expires: float | None = None
+        self._login_lock = threading.Lock()
+
+        self.discovery_ttl = discovery_ttl
+        self.links: dict | None = None
+        self.links_expire: float | None = None
+        self.schedule = EndpointSchedule(refresh_intervals)
+        self.collectors = enabled_collectors(collectors)
+        self.alarm_log = AlarmLog() if alarms else None
+
+        self.device_concurrency = device_concurrency
+        self._executor: ThreadPoolExecutor | None = None
+
+        self.scrape_timeout = scrape_timeout
+        # deadline of the scrape per thread, as collects, probes, samples
+        # and token renewals use the scraper concurrently
+        self._local = ScrapeContext()
+
+        self.breaker = CircuitBreaker(
+            breaker_threshold, max_backoff=breaker_max_backoff
+        )
+
+    def close(self) -> None:
+        """Release the worker threads and connections of the scraper."""
+        executor = self._executor
+        if executor is not None:
+            executor.shutdown()
+            self._executor = None
+        self.session.close()
 
     def login(self) -> Tuple[str, str]:
         """
@@ -78,24 +249,30 @@ class UPSScraper:
 
         Based on analysing the UPS Web UI, this will create a POST request
         with the authentication details to successfully create a session
-        on the specified UPS.
+        on the specified UPS. The lifetime of the new token is kept in
+        token_expires.
 
         :return: two for the authentication necessary string values
         """
+        self.stats.count_login(relogin=self.access_token is not None)
+        start = time.perf_counter()
+        timeout = self.login_timeout
         try:
-            data = LOGIN_DATA
+            data = dict(LOGIN_DATA)
             data["username"] = self.username
             data["password"] = self.password
 
+            timeout = self.request_timeout(self.login_timeout)
             login_request = self.session.post(
                 self.ups_address + LOGIN_AUTH_PATH,
                 data=json.dumps(data),  # needs to be JSON encoded
-                timeout=self.login_timeout
+                timeout=timeout
             )
-            login_response = login_request.json()
+            login_response = UPSResponse(login_request).json()
 
             token_type = login_response['token_type']
             access_token = login_response['access_token']
+            self.token_expires = token_expiry(login_response)
 
             self.logger.debug(
                 "Authentication successful on (%s)",
@@ -128,7 +305,7 @@ class UPSScraper:
         except ReadTimeout:
             raise LoginFailedException(
                 TIMEOUT_ERROR,
-                f"Login Timeout > {self.login_timeout} seconds"
+                f"Login Timeout > {timeout:g} seconds"
             ) from None
         except MissingSchema:
             raise LoginFailedException(
@@ -140,120 +317,401 @@ class UPSScraper:
                 INVALID_URL_ERROR,
                 "Invalid URL, no host supplied"
             ) from None
+        finally:
+            self.stats.observe_phase('login', time.perf_counter() - start)
+
+    def relogin(self,
+                token: Tuple[str | None, str | None]) -> None:
+        """
+        Login again, after the given token was rejected.
+
+        Concurrent requests of the same UPS share a single login: if another
+        thread already replaced the rejected token, nothing is done.
+
+        :param token: (token_type, access_token) the request was sent with
+        """
+        with self._login_lock:
+            if (self.token_type, self.access_token) == token:
+                self.token_type, self.access_token = self.login()
+
+    def token_expires_within(self,
+                             seconds: float) -> bool:
+        """Whether the current access token expires within seconds."""
+        expires = self.token_expires
+        return (
+            self.access_token is not None
+            and expires is not None
+            and time.monotonic() + seconds >= expires
+        )
+
+    def refresh_token(self,
+                      margin: float) -> bool:
+        """
+        Login again if the access token expires within margin seconds.
+
+        Meant to be called in the background, so that scrapes do not need
+        to login.
+
+        :param margin: seconds before the expiry to renew the token
+        :return: whether the token was renewed
+        """
+        token = (self.token_type, self.access_token)
+        if not self.token_expires_within(margin):
+            return False
+        self.logger.debug('Token expires soon, login again')
+        self.relogin(token)
+        return True
 
     def load_page(self,
-                  url: bytes | str) -> Response:
+                  url: bytes | str,
+                  relogin: bool = True) -> UPSResponse:
         """
         Load a webpage of the UPS Web UI or API.
 
         This will try to load the page by the given URL.
         If authentication is needed first, the login function gets executed
-        before loading the specified page.
+        before loading the specified page once more.
 
         :param url: ups web url
-        :return: request.Response
+        :param relogin: whether to login and retry on an expired session
+        :return: UPSResponse, its JSON content is decoded already. Missing
+            pages are returned with their status code 404
         """
+        # avoid a request bound to fail with an expired token
+        self.refresh_token(0)
+
+        token = (self.token_type, self.access_token)
         headers = {
             "Connection": "keep-alive",
-            "Authorization": f"{self.token_type} {self.access_token}",
+            "Authorization": f"{token[0]} {token[1]}",
         }
 
+        # the time left until the deadline, if shorter
+        timeout = self.request_timeout(REQUEST_TIMEOUT)
         try:
-            request = self.session.get(
+            request = UPSResponse(self.session.get(
                 url,
                 headers=headers,
-                timeout=REQUEST_TIMEOUT
-            )
-
-            # Session might be expired, connect again
-            try:
-                if "errorCode" in request.json() or "code" in request.json():
-                    self.logger.debug('Session expired, reconnect')
-                    self.token_type, self.access_token = self.login()
-                    return self.load_page(url)
-            except ValueError:
-                pass
-
-            # try to login, if not authorized
-            if "Unauthorized" in request.text:
-                self.logger.debug('Unauthorized, try to login')
-                try:
-                    self.token_type, self.access_token = self.login()
-                    return self.load_page(url)
-                except LoginFailedException as err:
-                    if err.error_code == TIMEOUT_ERROR:
-                        raise LoginFailedException(
-                            AUTHENTICATION_FAILED,
-                            "Authentication failed"
-                        ) from err
-                    # else
-                    raise err
-
-            self.logger.debug('GET %s', url)
-            return request
+                timeout=timeout
+            ))
         except ConnectionError:
+            if not relogin:
+                raise LoginFailedException(
+                    CONNECTION_ERROR,
+                    "Connection refused, host might be out of reach."
+                ) from None
             self.logger.debug('Connection Error try to login again')
+            self.relogin(token)
+            return self.load_page(url, relogin=False)
+        except ReadTimeout:
+            raise LoginFailedException(
+                TIMEOUT_ERROR,
+                f"Request Timeout > {timeout:g} seconds"
+            ) from None
+
+        if request.status_code == 404:
+            return request
+
+        try:
+            document = request.json()
+        except ValueError:
+            document = None
+
+        # Session might be expired or not yet authorized, connect again
+        expired = isinstance(document, dict) and (
+            "errorCode" in document or "code" in document
+        )
+        # not authorized, an HTML error page
+        unauthorized = document is None and b"Unauthorized" in request.content
+        if relogin and (expired or unauthorized):
+            self.logger.debug('Unauthorized, try to login')
             try:
-                self.token_type, self.access_token = self.login()
-                return self.load_page(url)
-            except LoginFailedException:
+                self.relogin(token)
+            except LoginFailedException as err:
+                if err.error_code == TIMEOUT_ERROR:
+                    raise LoginFailedException(
+                        AUTHENTICATION_FAILED,
+                        "Authentication failed"
+                    ) from err
                 raise
-        except LoginFailedException:
-            raise
+            return self.load_page(url, relogin=False)
 
-    def get_measures(self) -> dict:
+        self.logger.debug('GET %s', url)
+        return request
+
+    @property
+    def deadline(self) -> float | None:
+        """Deadline (time.monotonic) of the scrape running in this thread."""
+        return self._local.deadline
+
+    @deadline.setter
+    def deadline(self,
+                 deadline: float | None) -> None:
+        self._local.deadline = deadline
+
+    def request_timeout(self,
+                        timeout: float) -> float:
         """
-        Get most relevant UPS metrics.
+        Limit the timeout of a request to the time left until the deadline.
+
+        :param timeout: timeout of the request without a deadline
+        :return: timeout in seconds
+        """
+        deadline = self.deadline
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LoginFailedException(
+                TIMEOUT_ERROR,
+                f"Scrape Timeout > {self.scrape_timeout} seconds"
+            )
+        return min(timeout, remaining)
+
+    def get_links(self) -> dict:
+        """
+        Get the API links of the measurement endpoints.
+
+        The links are discovered once and cached, until discovery_ttl
+        expired or the links were invalidated.
 
         :return: {
-            "ups_id": self.name,
-            "ups_inputs": inputs,
-            "ups_outputs": outputs,
-            "ups_powerbank": powerbank
+            "ups_inputs": inputs_url,
+            "ups_outputs": outputs_url,
+            "ups_powerbank": powerbank_url
             }
+            and the links of the enabled subsystems, see subsystem_links
         """
-        measurements = dict()
-        try:
-            power_dist_request = self.load_page(
-                self.ups_address+REST_API_PATH
-            )
-            power_dist_overview = power_dist_request.json()
+        links, expire = self.links, self.links_expire
+        if links is None or (
+                expire is not None and time.monotonic() >= expire):
+            with self.stats.timed('discovery'):
+                links = self.discover_links()
+            self.links, self.links_expire = links, None
+            discovery_ttl = self.discovery_ttl
+            if discovery_ttl is not None:
+                self.links_expire = time.monotonic() + discovery_ttl
+        return links
+
+    def discover_links(self) -> dict:
+        """
+        Walk the power distribution API to find the measurement endpoints.
 
-            if not self.name:
-                self.name = f"ups_{power_dist_overview['id']}"
+        :return: see get_links
+        """
+        power_dist_request = self.load_page(
+            self.ups_address+REST_API_PATH
+        )
+        power_dist_overview = power_dist_request.json()
 
-            ups_inputs_api = power_dist_overview['inputs']['@id']
-            ups_ouptups_api = power_dist_overview['outputs']['@id']
+        if not self.name:
+            self.name = f"ups_{power_dist_overview['id']}"
 
-            inputs_request = self.load_page(
-                self.ups_address + ups_inputs_api + f'/{INPUT_MEMBER_ID}'
+        ups_backup_sys_api = power_dist_overview['backupSystem']['@id']
+        backup_request = self.load_page(
+            self.ups_address + ups_backup_sys_api
+        )
+        backup = backup_request.json()
+
+        links = resolve_links(self.ups_address, power_dist_overview, backup)
+        links.update(subsystem_links(
+            self.ups_address, power_dist_overview, self.collectors,
+            self.logger
+        ))
+        return links
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Return the thread pool for parallel requests to the UPS."""
+        executor = self._executor
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=self.device_concurrency,
+                thread_name_prefix=f"{self.__class__.__name__}-{self.name}"
             )
-            inputs = inputs_request.json()
+            self._executor = executor
+        return executor
+
+    def invalidate_links(self) -> None:
+        """Discard the cached links, the next scrape discovers them again."""
+        self.links, self.links_expire = None, None
+        self.schedule.clear()
 
-            outputs_request = self.load_page(
-                self.ups_address + ups_ouptups_api + f'/{OUTPUT_MEMBER_ID}'
+    def load_endpoint(self,
+                      link: str,
+                      url: str) -> UPSResponse:
+        """Load the page of a measurement endpoint, see get_links."""
+        with self.stats.timed(endpoint_phase(link)):
+            return self.load_page(url)
+
+    def load_measures(self,
+                      links: dict) -> dict | None:
+        """
+        Load the measurement endpoints.
+
+        Endpoints that are not due per the schedule are served from their
+        last page.
+
+        :param links: see get_links
+        :return: measures, or None if the links are outdated
+        """
+        measurements: dict = {"ups_id": self.name}
+        links, cached = self.schedule.plan(links)
+        if self.device_concurrency > 1:
+            deadline = self.deadline
+
+            def load_endpoint(link: str, url: str) -> UPSResponse:
+                # the deadline of this scrape, in the pool's thread
+                self.deadline = deadline
+                try:
+                    return self.load_endpoint(link, url)
+                finally:
+                    self.deadline = None
+
+            responses = self.get_executor().map(
+                load_endpoint, links, links.values()
             )
-            outputs = outputs_request.json()
+        else:
+            responses = map(self.load_endpoint, links, links.values())
+        for key, request in zip(links, responses):
+            if request.status_code == 404:
+                return None
+            page = request.json()
+            if not is_endpoint_page(key, page):
+                return None
+            measurements[key] = page
+        self.schedule.store(measurements)
+        measurements.update(cached)
+        return measurements
+
+    def is_warm(self) -> bool:
+        """Whether the UPS is logged in, with its API links discovered."""
+        return self.access_token is not None and self.links is not None
 
-            ups_backup_sys_api = power_dist_overview['backupSystem']['@id']
-            backup_request = self.load_page(
-                self.ups_address + ups_backup_sys_api
+    def prewarm(self) -> bool:
+        """
+        Login and discover the API links ahead of the first scrape.
+
+        :return: whether the UPS is warm
+        """
+        try:
+            if self.access_token is None:
+                self.relogin((self.token_type, self.access_token))
+            self.get_links()
+        except LoginFailedException as err:
+            self.logger.error(err)
+            print(f"{err.__class__.__name__} - ({self.ups_address}): "
+                  f"{err.message}")
+        except (json.decoder.JSONDecodeError, KeyError, TypeError) as err:
+            self.logger.error(
+                "Unexpected API response from (%s): %s",
+                self.ups_address, err
             )
-            backup = backup_request.json()
-            ups_powerbank_api = backup['powerBank']['@id']
-            powerbank_request = self.load_page(
-                self.ups_address + ups_powerbank_api
+        return self.is_warm()
+
+    def load_realtime(self) -> dict | None:
+        """
+        Load the realtime endpoints only, for high frequency sampling.
+
+        Samples are skipped until the UPS is warm, and while its circuit
+        breaker is not closed, the scrapes alone probe a failing UPS.
+
+        :return: {"ups_inputs": inputs, "ups_outputs": outputs},
+            None if the sample is skipped or failed
+        """
+        links = self.links
+        if links is None or self.breaker.state != CLOSED:
+            return None
+        pages = dict()
+        try:
+            for link in REALTIME_LINKS:
+                page = self.load_page(links[link]).json()
+                if not is_measures_page(page):
+                    return None
+                pages[link] = page
+        except (LoginFailedException, ValueError) as err:
+            self.logger.debug('Sample of %s failed: %s', self.name, err)
+            return None
+        return pages
+
+    def load_alarms(self) -> dict | None:
+        """
+        Read the events of the alarm log added since the last call.
+
+        A call while another one is in progress returns the alarms as of
+        the last finished call. Failures are logged, they do not fail the
+        scrape of the measures.
+
+        :return: see AlarmLog.snapshot, None if the UPS has no readable
+            alarm log or reading it failed
+        """
+        alarm_log = self.alarm_log
+        if alarm_log is None or alarm_log.unfiltered:
+            return None
+        if not alarm_log.lock.acquire(blocking=False):
+            return alarm_log.snapshot()
+        try:
+            with self.stats.timed('alarms'):
+                more = True
+                while more:
+                    request = self.load_page(
+                        alarm_log.url(self.ups_address)
+                    )
+                    if request.status_code == 404:
+                        return None
+                    more = alarm_log.apply(request.json())
+        except (LoginFailedException, KeyError, TypeError, ValueError) as err:
+            self.logger.error(
+                "Reading the alarms of (%s) failed: %r", self.ups_address, err
             )
-            powerbank = powerbank_request.json()
+            return None
+        finally:
+            alarm_log.lock.release()
+        return alarm_log.snapshot()
+
+    def get_measures(self) -> dict:
+        """
+        Get most relevant UPS metrics.
 
-            measurements = {
-                "ups_id": self.name,
-                "ups_inputs": inputs,
-                "ups_outputs": outputs,
-                "ups_powerbank": powerbank
+        :return: {
+            "ups_id": self.name,
+            "ups_inputs": inputs,
+            "ups_outputs": outputs,
+            "ups_powerbank": powerbank
             }
+            empty while the circuit breaker skips the unreachable UPS
+        """
+        if not self.breaker.allow():
+            self.logger.debug('%s unreachable, skip scrape', self.ups_address)
+            self.stats.count_skipped()
+            return dict()
+
+        measurements = dict()
+        error_code = None
+        start = time.perf_counter()
+        scrape_timeout = self.scrape_timeout
+        if scrape_timeout is not None:
+            self.deadline = time.monotonic() + scrape_timeout
+        try:
+            cached = self.links is not None
+            measurements = self.load_measures(self.get_links())
+            if measurements is None and cached:
+                self.logger.debug('API links changed, discover them again')
+                self.invalidate_links()
+                measurements = self.load_measures(self.get_links())
+            if measurements is None:
+                self.invalidate_links()
+                self.logger.error(
+                    "Unexpected API response from (%s)", self.ups_address
+                )
+                measurements = dict()
+            if measurements and self.alarm_log is not None:
+                alarms = self.load_alarms()
+                if alarms is not None:
+                    measurements[ALARMS] = alarms
 
         except LoginFailedException as err:
+            error_code = err.error_code
+            self.stats.count_error(err.error_code)
             self.logger.error(err)
             print(f"{err.__class__.__name__} - ({self.ups_address}): "
                   f"{err.message}")
@@ -262,5 +720,55 @@ class UPSScraper:
             self.logger.error(err)
         except Exception:
             raise
+        finally:
+            self.deadline = None
+            self.breaker.record(error_code)
+            self.stats.observe_scrape(
+                time.perf_counter() - start, bool(measurements)
+            )
 
         return measurements
+
+
+def resolve_links(ups_address: str,
+                  power_dist_overview: dict,
+                  backup: dict) -> dict:
+    """Build the measurement endpoint URLs from the discovered API pages.
+
+    :param ups_address: Address of the UPS
+    :param power_dist_overview: Page at REST_API_PATH
+    :param backup: Page of the backup system
+    :return: see UPSScraper.get_links
+    """
+    ups_inputs_api = power_dist_overview['inputs']['@id']
+    ups_outputs_api = power_dist_overview['outputs']['@id']
+    ups_powerbank_api = backup['powerBank']['@id']
+    return {
+        "ups_inputs": ups_address + ups_inputs_api + f'/{INPUT_MEMBER_ID}',
+        "ups_outputs": ups_address + ups_outputs_api + f'/{OUTPUT_MEMBER_ID}',
+        "ups_powerbank": ups_address + ups_powerbank_api
+    }
+
+
+def token_expiry(login_response: dict) -> float | None:
+    """Time (time.monotonic) at which a token from oauth2/token expires."""
+    try:
+        return time.monotonic() + float(login_response['expires_in'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_measures_page(page) -> bool:
+    """Whether a page of a measurement endpoint has the expected schema."""
+    return isinstance(page, dict) and 'measures' in page
+
+
+def is_endpoint_page(link: str,
+                     page) -> bool:
+    """Whether the page of a link of get_links has the expected schema.
+
+    Subsystem pages only need to be documents, some carry no measures.
+    """
+    if is_subsystem_link(link):
+        return isinstance(page, dict)
+    return is_measures_page(page)
@@ -13,6 +13,12 @@ REST_API_PATH = '/rest/mbdetnrs/1.0/powerDistributions/1'
 INPUT_MEMBER_ID = 1
 OUTPUT_MEMBER_ID = 1
 
+# Measurement endpoints loaded per scrape, see UPSScraper.get_links
+ENDPOINTS = ('inputs', 'outputs', 'powerbank')
+
+# Realtime links loaded per sample, see UPSScraper.load_realtime
+REALTIME_LINKS = ('ups_inputs', 'ups_outputs')
+
 # Data to post to the login form.
 # Must be extended by username and password.
 LOGIN_DATA = {
@@ -23,6 +29,16 @@ LOGIN_DATA = {
 # Timeouts in seconds
 REQUEST_TIMEOUT = 2
 
+# Maximum seconds between two checks for access tokens that need to be
+# renewed, see check_interval
+TOKEN_CHECK_INTERVAL = 10
+
+# Circuit breaker: consecutive connection errors or timeouts after which
+# scrapes of a UPS are skipped, for an exponential backoff in seconds
+BREAKER_THRESHOLD = 3
+BREAKER_BACKOFF = 10
+BREAKER_MAX_BACKOFF = 300
+
 # Exit Codes
 NORMAL_EXECUTION = 0
 AUTHENTICATION_FAILED = 1
@@ -0,0 +1,250 @@
+"""HTTP server of the exporter: metrics and readiness."""
+import gzip
+import json
+import socket
+import threading
+
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import (
+        ServerHandler,
+        WSGIRequestHandler,
+        WSGIServer,
+        make_server,
+        )
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client import make_wsgi_app
+from prometheus_client.registry import CollectorRegistry
+
+from typing import Callable, Generator, Iterable, Tuple
+from urllib.parse import parse_qs
+
+# Seconds a keep-alive connection may stay idle, above the default scrape
+# interval of Prometheus (1 minute) so that its connection is reused
+IDLE_TIMEOUT = 75.
+
+
+class ExporterServer(ThreadingMixIn, WSGIServer):
+    """HTTP server answering each request in its own thread."""
+    daemon_threads = True
+
+
+class SilentHandler(WSGIRequestHandler):
+    """Request handler that does not log requests.
+
+    Speaks HTTP/1.1 and keeps connections open between requests, so that
+    Prometheus does not connect for every scrape. Connections idle for
+    timeout seconds are closed.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = IDLE_TIMEOUT
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def handle(self) -> None:
+        """Handle requests until the client closes the connection."""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self) -> None:
+        """Handle a single HTTP request, see WSGIRequestHandler.handle."""
+        try:
+            # pyre-ignore[16]: attribute of BaseHTTPRequestHandler
+            self.raw_requestline = self.rfile.readline(65537)
+        except TimeoutError:
+            # idle for longer than timeout
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        if self.command not in ('GET', 'HEAD'):
+            # a request body would not be read
+            self.close_connection = True
+
+        handler = ServerHandler(
+            # pyre-ignore[6]: the stubs expect IO[bytes]
+            self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=False,
+        )
+        handler.http_version = '1.1'
+        # pyre-ignore[16]: backpointer for logging, as in wsgiref
+        handler.request_handler = self
+        # pyre-ignore[16]: the server is a WSGIServer
+        handler.run(self.server.get_app())
+        self.wfile.flush()
+
+
+class PrerenderedExposition:
+    """Metrics of a registry, rendered once per snapshot of the UPSs.
+
+    render() is called after each poll, requests for the metrics then only
+    return the cached text, or its gzip variant, however many clients
+    scrape the exporter. The metrics of the exporter itself are rendered
+    with the UPS metrics, so they only change with each snapshot too.
+
+    :param registry: CollectorRegistry
+        Registry of the exported metrics
+    """
+    def __init__(self,
+                 registry: CollectorRegistry = REGISTRY) -> None:
+        self.registry = registry
+        self.metrics_app = make_wsgi_app(registry)
+        # (text, gzip compressed text), replaced as a whole
+        self.rendered: Tuple[bytes, bytes] | None = None
+        self.renders = 0
+
+    def render(self) -> None:
+        """Render the metrics of the registry, e.g. after a poll."""
+        text = generate_latest(self.registry)
+        self.rendered = (text, gzip.compress(text, mtime=0))
+        self.renders += 1
+
+    def __call__(self,
+                 environ: dict,
+                 start_response: Callable) -> Iterable[bytes]:
+        rendered = self.rendered
+        if rendered is None or environ.get('REQUEST_METHOD') != 'GET' \
+                or 'name[]' in parse_qs(environ.get('QUERY_STRING', '')):
+            # not rendered yet, or filtered by metric names
+            return self.metrics_app(environ, start_response)
+        text, compressed = rendered
+        headers = [('Content-Type', CONTENT_TYPE_LATEST)]
+        if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', ''):
+            body = compressed
+            headers.append(('Content-Encoding', 'gzip'))
+        else:
+            body = text
+        headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return [body]
+
+
+def readiness(exporter,
+              start_response: Callable) -> Iterable[bytes]:
+    """Answer /ready: 200 once the exporter finished its pre-warm.
+
+    The JSON body tells how many UPSs are warm, i.e. logged in with their
+    API links discovered.
+    """
+    ready = exporter.ready()
+    body = json.dumps({
+        "ready": ready,
+        "warm": exporter.warm_devices(),
+        "devices": len(exporter.ups_devices),
+    }).encode()
+    start_response(
+        '200 OK' if ready else '503 Service Unavailable',
+        [('Content-Type', 'application/json'),
+         ('Content-Length', str(len(body)))]
+    )
+    return [body]
+
+
+class Probe:
+    """Collector of a single UPS of the exporter, see UPSMultiExporter.probe.
+
+    :param exporter: UPSMultiExporter
+        Exporter of the UPS
+    :param ups: UPSScraper
+        UPS to scrape
+    """
+    def __init__(self,
+                 exporter,
+                 ups) -> None:
+        self.exporter = exporter
+        self.ups = ups
+
+    def collect(self) -> Generator:
+        return self.exporter.probe(self.ups)
+
+
+def probe(exporter,
+          environ: dict,
+          start_response: Callable) -> Iterable[bytes]:
+    """Answer /probe?target=<name> with the metrics of that UPS only."""
+    targets = parse_qs(environ.get('QUERY_STRING', '')).get('target')
+    ups = exporter.device(targets[0]) if targets else None
+    if ups is None:
+        body = (f"Unknown target {targets[0]!r}\n" if targets
+                else "Missing parameter target\n").encode()
+        start_response(
+            '404 Not Found' if targets else '400 Bad Request',
+            [('Content-Type', 'text/plain'),
+             ('Content-Length', str(len(body)))]
+        )
+        return [body]
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(Probe(exporter, ups))
+    return make_wsgi_app(registry)(environ, start_response)
+
+
+def make_app(exporter,
+             registry: CollectorRegistry = REGISTRY,
+             prerendered: PrerenderedExposition | None = None) -> Callable:
+    """WSGI app serving /ready, /probe and the metrics of the registry.
+
+    :param exporter: UPSMultiExporter
+        Exporter whose readiness is reported
+    :param registry: CollectorRegistry
+        Registry of the exported metrics
+    :param prerendered: PrerenderedExposition | None
+        If given, serve the metrics pre-rendered by it instead
+    """
+    metrics_app = prerendered or make_wsgi_app(registry)
+
+    def app(environ: dict,
+            start_response: Callable) -> Iterable[bytes]:
+        path = environ.get('PATH_INFO')
+        if path == '/ready':
+            return readiness(exporter, start_response)
+        if path == '/probe':
+            return probe(exporter, environ, start_response)
+        return metrics_app(environ, start_response)
+
+    return app
+
+
+def start_http_server(
+        port: int,
+        addr: str,
+        exporter,
+        registry: CollectorRegistry = REGISTRY,
+        prerendered: PrerenderedExposition | None = None,
+        idle_timeout: float = IDLE_TIMEOUT
+) -> Tuple[ExporterServer, threading.Thread]:
+    """Serve the exporter from a daemon thread, see make_app.
+
+    :param idle_timeout: Seconds after which idle connections are closed
+    :return: the server and its thread
+    """
+    family, _, _, _, sockaddr = socket.getaddrinfo(addr, port)[0]
+
+    class Server(ExporterServer):
+        address_family = family
+
+    class Handler(SilentHandler):
+        timeout = idle_timeout
+
+    server = make_server(
+        sockaddr[0], port, make_app(exporter, registry, prerendered),
+        Server, handler_class=Handler
+    )
+    thread = threading.Thread(
+        target=server.serve_forever,
+        name=ExporterServer.__name__,
+        daemon=True
+    )
+    thread.start()
+    return server, thread
@@ -0,0 +1,57 @@
+"""Split the UPSs of a config across multiple exporter instances."""
+import hashlib
+
+
+def shard_weight(ups_id: str,
+                 shard: int) -> int:
+    """Stable, pseudo random weight of a UPS for a shard."""
+    digest = hashlib.blake2b(
+        f"{shard}:{ups_id}".encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_of(ups_id: str,
+             shard_count: int) -> int:
+    """Shard owning a UPS, by rendezvous (highest random weight) hashing.
+
+    Each UPS goes to the shard with its highest weight. Adding a shard only
+    moves the UPSs that the new shard now wins, about 1/shard_count of them,
+    removing one only moves the UPSs of the removed shard.
+
+    :param ups_id: str
+        Name of the UPS in the config
+    :param shard_count: int
+        Number of exporter instances sharing the config
+    :return: int
+        Index of the owning shard, 0 <= index < shard_count
+    """
+    return max(
+        range(shard_count), key=lambda shard: shard_weight(ups_id, shard)
+    )
+
+
+def shard_devices(devices: dict,
+                  shard_index: int = 0,
+                  shard_count: int = 1) -> dict:
+    """The devices of a config owned by a shard.
+
+    :param devices: dict
+        Config of all UPSs, by name
+    :param shard_index: int
+        Index of this exporter instance, 0 <= shard_index < shard_count
+    :param shard_count: int
+        Number of exporter instances sharing the config
+    :return: dict
+        Config of the UPSs owned by the shard
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(
+            f"Shard index {shard_index} not in [0, {shard_count})"
+        )
+    if shard_count == 1:
+        return devices
+    return {
+        ups_id: device for ups_id, device in devices.items()
+        if shard_of(ups_id, shard_count) == shard_index
+    }
@@ -0,0 +1,106 @@
+"""Persistent state of UPS scrapers, to warm start the exporter."""
+import json
+import os
+import threading
+import time
+
+from prometheus_eaton_ups_exporter import create_logger
+
+
+class StateStore:
+    """Keep the access tokens and API links of UPSs in a JSON file.
+
+    Restarted exporters restore them instead of logging in to all UPSs and
+    discovering their API links again. Restored values are validated lazily:
+    rejected tokens trigger a login, outdated links a new discovery.
+    The file contains access tokens, so it is only readable by its owner.
+
+    :param path: str
+        Path to the state file
+    :param verbose: bool
+        Allow logging output for development
+    """
+    def __init__(self,
+                 path: str,
+                 verbose: bool = False) -> None:
+        self.logger = create_logger(
+            f"{__name__}.{self.__class__.__name__}", not verbose
+        )
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """Read the state of all UPSs, empty if there is no valid file."""
+        try:
+            with open(self.path) as state_file:
+                state = json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            self.logger.error("Ignoring state file %s: %s", self.path, err)
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def save(self,
+             state: dict) -> None:
+        """Replace the state file atomically, with owner-only permissions."""
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, 'w') as state_file:
+                json.dump(state, state_file)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+
+
+def export_scraper_state(ups) -> dict:
+    """Get the state of a UPSScraper or AsyncUPSScraper to persist.
+
+    Expiry times are converted from time.monotonic to Unix timestamps,
+    rounded to seconds, so that unchanged states compare equal.
+    """
+    offset = time.time() - time.monotonic()
+    token_expires = ups.token_expires
+    return {
+        "address": ups.ups_address,
+        "user": ups.username,
+        "token_type": ups.token_type,
+        "access_token": ups.access_token,
+        "token_expires": (
+            None if token_expires is None
+            else round(token_expires + offset)
+        ),
+        "links": ups.links,
+        "collectors": list(ups.collectors),
+    }
+
+
+def restore_scraper_state(ups,
+                          state: dict) -> bool:
+    """Restore the persisted state of a UPSScraper or AsyncUPSScraper.
+
+    :return: whether the state belonged to the UPS and was restored
+    """
+    if (state.get("address"), state.get("user")) != \
+            (ups.ups_address, ups.username):
+        return False
+
+    offset = time.time() - time.monotonic()
+    token_expires = state.get("token_expires")
+    if state.get("access_token") is not None and (
+            token_expires is None or token_expires > time.time()):
+        ups.token_type = state.get("token_type")
+        ups.access_token = state["access_token"]
+        ups.token_expires = (
+            None if token_expires is None else token_expires - offset
+        )
+
+    links = state.get("links")
+    # links discovered with other collectors lack or have extra subsystems
+    if isinstance(links, dict) and \
+            tuple(state.get("collectors", ())) == ups.collectors:
+        ups.links = links
+        if ups.discovery_ttl is not None:
+            ups.links_expire = time.monotonic() + ups.discovery_ttl
+    return True
@@ -0,0 +1,290 @@
+"""
+Optional collectors of the subsystems of a UPS.
+
+The powerDistributions document advertises more subsystems than the inputs,
+outputs and battery exported by default. Each Subsystem below is enabled
+per exporter (--collector) or per UPS ("collectors" in the config). Only
+the pages of enabled subsystems are discovered and loaded, disabled ones
+cost no request.
+"""
+import logging
+
+from prometheus_client.core import GaugeMetricFamily
+
+from prometheus_eaton_ups_exporter.metrics import (
+        MetricSpec,
+        compact_measures,
+        compile_metric,
+        realtime_measures,
+        )
+
+from typing import Iterable, NamedTuple
+
+# Layouts of the subsystem documents, see Subsystem
+COLLECTION = 'collection'
+DOCUMENT = 'document'
+MEMBERS = 'members'
+
+# As for inputs and outputs, take the first member of collections
+SUBSYSTEM_MEMBER_ID = 1
+
+# Key of the samples in compacted measures, see compact_with_subsystems
+SUBSYSTEM_SAMPLES = 'subsystem_samples'
+
+
+class Subsystem(NamedTuple):
+    """A subsystem of the UPS and its gauges.
+
+    The source of each MetricSpec is 'realtime', the realtime measures of
+    the page, or 'status', its status.
+
+    :param name: Key of the subsystem in the powerDistributions document,
+        also the name of its collector
+    :param layout: COLLECTION loads the member SUBSYSTEM_MEMBER_ID,
+        DOCUMENT the document itself, MEMBERS each of the members listed
+        in the powerDistributions document
+    :param metrics: Gauges read from each loaded page
+    :param label: Label of the member of MEMBERS subsystems
+    """
+    name: str
+    layout: str
+    metrics: tuple[MetricSpec, ...]
+    label: str | None = None
+
+
+def electrical_metrics(prefix: str,
+                       subsystem: str) -> tuple[MetricSpec, ...]:
+    """Voltage, frequency and current of a subsystem."""
+    return (
+        MetricSpec(
+            f"eaton_ups_{prefix}_volts",
+            f'UPS {subsystem} voltage (V)',
+            'realtime', 'voltage'
+        ),
+        MetricSpec(
+            f"eaton_ups_{prefix}_hertz",
+            f'UPS {subsystem} frequency (Hz)',
+            'realtime', 'frequency'
+        ),
+        MetricSpec(
+            f"eaton_ups_{prefix}_amperes",
+            f'UPS {subsystem} current (A)',
+            'realtime', 'current'
+        ),
+    )
+
+
+SUBSYSTEMS = {subsystem.name: subsystem for subsystem in (
+    Subsystem(
+        'outlets', MEMBERS, (
+            MetricSpec(
+                "eaton_ups_outlet_amperes",
+                'UPS outlet current (A)',
+                'realtime', 'current'
+            ),
+            MetricSpec(
+                "eaton_ups_outlet_voltamperes",
+                'UPS outlet apparent power (VA)',
+                'realtime', 'apparentPower'
+            ),
+            MetricSpec(
+                "eaton_ups_outlet_watts",
+                'UPS outlet active power (W)',
+                'realtime', 'activePower'
+            ),
+            MetricSpec(
+                "eaton_ups_outlet_power_factor",
+                'UPS outlet power factor',
+                'realtime', 'powerFactor'
+            ),
+            MetricSpec(
+                "eaton_ups_outlet_switched_on",
+                'Whether the UPS outlet is switched on',
+                'status', 'switchedOn', int
+            ),
+        ),
+        label='outlet'
+    ),
+    Subsystem('bypass', COLLECTION, electrical_metrics('bypass', 'bypass')),
+    Subsystem(
+        'chargers', COLLECTION, (
+            MetricSpec(
+                "eaton_ups_charger_volts",
+                'UPS battery charger voltage (V)',
+                'realtime', 'voltage'
+            ),
+            MetricSpec(
+                "eaton_ups_charger_amperes",
+                'UPS battery charger current (A)',
+                'realtime', 'current'
+            ),
+        )
+    ),
+    Subsystem(
+        'inverters', COLLECTION, electrical_metrics('inverter', 'inverter')
+    ),
+    Subsystem(
+        'rectifiers', COLLECTION,
+        electrical_metrics('rectifier', 'rectifier')
+    ),
+    Subsystem(
+        'avr', DOCUMENT, (
+            MetricSpec(
+                "eaton_ups_avr_operating_status",
+                'UPS automatic voltage regulation operating status code',
+                'status', 'operating'
+            ),
+            MetricSpec(
+                "eaton_ups_avr_health_status",
+                'UPS automatic voltage regulation health status code',
+                'status', 'health'
+            ),
+        )
+    ),
+)}
+
+# (subsystem, spec, getter) of all subsystem gauges, in a fixed order
+COMPILED_SUBSYSTEM_METRICS = tuple(
+    (subsystem, spec, compile_metric(spec))
+    for subsystem in SUBSYSTEMS.values()
+    for spec in subsystem.metrics
+)
+
+
+def enabled_collectors(collectors: Iterable[str]) -> tuple[str, ...]:
+    """Check the names of enabled collectors.
+
+    :return: the names without duplicates, in the order of SUBSYSTEMS
+    :raises ValueError: for names of unknown subsystems
+    """
+    collectors = set(collectors)
+    unknown = collectors - SUBSYSTEMS.keys()
+    if unknown:
+        raise ValueError(f"Unknown collectors: {', '.join(sorted(unknown))}")
+    return tuple(name for name in SUBSYSTEMS if name in collectors)
+
+
+def resource_path(resource) -> str | None:
+    """Path of a resource of the API, None if it has none."""
+    if isinstance(resource, dict) and isinstance(resource.get('@id'), str):
+        return resource['@id']
+    return None
+
+
+def subsystem_links(ups_address: str,
+                    power_dist_overview: dict,
+                    collectors: Iterable[str],
+                    logger: logging.Logger | None = None) -> dict:
+    """Build the URLs of the pages of the enabled subsystems.
+
+    Subsystems the UPS does not advertise are left out, as are malformed
+    entries without a path.
+
+    :param ups_address: Address of the UPS
+    :param power_dist_overview: Page at REST_API_PATH
+    :param collectors: Names of the enabled subsystems
+    :param logger: Where to log the skipped entries
+    :return: URLs by link, ups_<subsystem> or ups_<subsystem>/<member>
+    """
+    def skip(name: str, entry) -> None:
+        if logger is not None:
+            logger.debug("Skipping malformed %s entry: %r", name, entry)
+
+    links = {}
+    for name in collectors:
+        subsystem = SUBSYSTEMS[name]
+        document = power_dist_overview.get(name)
+        if document is None:
+            continue
+        if subsystem.layout == MEMBERS:
+            members = document.get('members') \
+                if isinstance(document, dict) else None
+            if not isinstance(members, list):
+                skip(name, document)
+                continue
+            for member in members:
+                path = resource_path(member)
+                if path is None:
+                    skip(name, member)
+                    continue
+                member_id = path.rsplit('/', 1)[-1]
+                links[f"ups_{name}/{member_id}"] = ups_address + path
+        else:
+            path = resource_path(document)
+            if path is None:
+                skip(name, document)
+                continue
+            if subsystem.layout == COLLECTION:
+                path += f'/{SUBSYSTEM_MEMBER_ID}'
+            links[f"ups_{name}"] = ups_address + path
+    return links
+
+
+def is_subsystem_link(link: str) -> bool:
+    """Whether a link of UPSScraper.get_links belongs to a subsystem."""
+    return link.removeprefix('ups_').split('/')[0] in SUBSYSTEMS
+
+
+def subsystem_samples(measures: dict) -> list[tuple[int, str, float]]:
+    """Values of the subsystem gauges in the measures of a UPS.
+
+    :return: (index in COMPILED_SUBSYSTEM_METRICS, member, value) of each
+        sample, the member is empty unless the subsystem has MEMBERS
+    """
+    samples = []
+    for link, page in measures.items():
+        if not is_subsystem_link(link):
+            continue
+        name, _, member = link.removeprefix('ups_').partition('/')
+        sources = {
+            'realtime': realtime_measures(page) if 'measures' in page else {},
+            'status': page.get('status') or {},
+        }
+        for index, (subsystem, _, get_value) in enumerate(
+                COMPILED_SUBSYSTEM_METRICS):
+            if subsystem.name != name:
+                continue
+            value = get_value(sources)
+            if value is not None:
+                samples.append((index, member, value))
+    return samples
+
+
+def compact_with_subsystems(measures: dict) -> dict:
+    """Like compact_measures, keeping the samples of the subsystems."""
+    compacted = compact_measures(measures)
+    if compacted:
+        samples = subsystem_samples(measures)
+        if samples:
+            compacted[SUBSYSTEM_SAMPLES] = samples
+    return compacted
+
+
+def subsystem_families(ups_data: Iterable[dict]) -> list[GaugeMetricFamily]:
+    """Create the gauges of the subsystems enabled for any of the UPSs.
+
+    :param ups_data: Measures as returned by UPSScraper.get_measures,
+        or compacted by compact_measures
+    :return: one gauge per metric of the subsystems with samples
+    """
+    gauges: dict[int, GaugeMetricFamily] = {}
+    for measures in ups_data:
+        if not measures:
+            continue
+        samples = measures.get(SUBSYSTEM_SAMPLES)
+        if samples is None:
+            samples = subsystem_samples(measures)
+        for index, member, value in samples:
+            subsystem, spec, _ = COMPILED_SUBSYSTEM_METRICS[index]
+            labels = ['ups_id']
+            values = [measures['ups_id']]
+            if subsystem.label is not None:
+                labels.append(subsystem.label)
+                values.append(member)
+            gauge = gauges.get(index)
+            if gauge is None:
+                gauge = gauges[index] = GaugeMetricFamily(
+                    spec.name, spec.documentation, labels=labels
+                )
+            gauge.add_metric(values, value)
+    return [gauges[index] for index in sorted(gauges)]
@@ -0,0 +1,73 @@
+"""Background renewal of the access tokens of UPSs."""
+import threading
+
+from prometheus_eaton_ups_exporter import create_logger
+from prometheus_eaton_ups_exporter.scraper_globals import TOKEN_CHECK_INTERVAL
+
+from typing import Callable
+
+
+def check_interval(margin: float) -> float:
+    """Seconds between two checks for tokens expiring within margin.
+
+    At least two checks fall within the margin of every token, so that it
+    is renewed before it expires, even if a check fails.
+
+    :raises ValueError: if the margin is not positive
+    """
+    if margin <= 0:
+        raise ValueError(f"Token refresh margin must be positive: {margin}")
+    return min(TOKEN_CHECK_INTERVAL, margin / 2)
+
+
+class TokenRefresher:
+    """Renew access tokens in a background thread, before they expire.
+
+    Scrapes then always find a valid token and never need to login.
+
+    :param refresh: Callable[[], None]
+        Function renewing all tokens that expire soon, e.g.
+        UPSMultiExporter.refresh_tokens
+    :param interval: float
+        Seconds between two calls of refresh
+    :param verbose: bool
+        Allow logging output for development
+    """
+    def __init__(self,
+                 refresh: Callable[[], None],
+                 interval: float = TOKEN_CHECK_INTERVAL,
+                 verbose: bool = False) -> None:
+        self.logger = create_logger(
+            f"{__name__}.{self.__class__.__name__}", not verbose
+        )
+        self.refresh = refresh
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start renewing tokens in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=self.__class__.__name__,
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self,
+             timeout: float | None = None) -> None:
+        """Stop renewing tokens."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as err:
+                self.logger.exception(err)
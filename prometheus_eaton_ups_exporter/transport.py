@@ -0,0 +1,244 @@
+"""Connection pooling and TLS session reuse for the requests to a UPS."""
+import ssl
+import threading
+import time
+import weakref
+
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+
+from prometheus_eaton_ups_exporter.instrumentation import ScrapeStats
+
+# Connections kept open per UPS, unless more requests run in parallel
+POOL_SIZE = DEFAULT_POOLSIZE
+
+
+def default_pool_size(device_concurrency: int) -> int:
+    """Connections kept open to a UPS without an explicit pool size.
+
+    Room for the requests of a scrape, and of the probes, samples and token
+    renewals running at the same time.
+    """
+    return max(POOL_SIZE, device_concurrency)
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSLContext resuming the TLS sessions of earlier connections.
+
+    New connections to a host offer the session of the last connection to
+    it, so that the UPS can skip the expensive full handshake. Handshakes
+    are counted in the ScrapeStats of the UPS.
+    Works for both ssl sockets (requests) and ssl objects (asyncio).
+
+    :param protocol: int
+        ssl.PROTOCOL_TLS_CLIENT
+    :param stats: ScrapeStats | None
+        Where to count the handshakes
+    """
+    def __init__(self,
+                 protocol: int,
+                 stats: ScrapeStats | None = None) -> None:
+        super().__init__()
+        self.stats = stats
+        self._lock = threading.Lock()
+        # server_hostname -> last session and last connection
+        self._sessions: dict = {}
+        self._connections: dict = {}
+
+    def session_for(self,
+                    server_hostname: str | None) -> ssl.SSLSession | None:
+        """Latest TLS session of a host, None if there is none to resume."""
+        with self._lock:
+            connection = self._connections.get(server_hostname)
+            connection = connection() if connection is not None else None
+            session = None
+            try:
+                # newer than the stored one, e.g. with a TLS 1.3 ticket
+                session = connection.session if connection else None
+            except (AttributeError, ValueError):
+                pass
+            if session is not None:
+                self._sessions[server_hostname] = session
+            return self._sessions.get(server_hostname)
+
+    def remember_sessions(self) -> None:
+        """Keep the sessions of the open connections, before closing them."""
+        for server_hostname in list(self._connections):
+            self.session_for(server_hostname)
+
+    def handshake_done(self,
+                       server_hostname: str | None,
+                       connection) -> None:
+        with self._lock:
+            self._connections[server_hostname] = weakref.ref(connection)
+            session = connection.session
+            if session is not None:
+                self._sessions[server_hostname] = session
+        stats = self.stats
+        if stats is not None:
+            stats.count_tls_handshake(resumed=connection.session_reused)
+
+    def wrap_socket(self, sock, server_side=False,
+                    do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if session is None:
+            session = self.session_for(server_hostname)
+        connection = super().wrap_socket(
+            sock,
+            server_side=server_side,
+            do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs,
+            server_hostname=server_hostname,
+            session=session
+        )
+        if do_handshake_on_connect:
+            self.handshake_done(server_hostname, connection)
+        return connection
+
+    def wrap_bio(self, incoming, outgoing, server_side=False,
+                 server_hostname=None, session=None):
+        if session is None:
+            session = self.session_for(server_hostname)
+        return ResumingSSLObject.wrap(
+            super().wrap_bio(
+                incoming,
+                outgoing,
+                server_side=server_side,
+                server_hostname=server_hostname,
+                session=session
+            ),
+            self,
+            server_hostname
+        )
+
+
+class ResumingSSLObject:
+    """Report the handshake of an ssl object (asyncio) to its context."""
+
+    @staticmethod
+    def wrap(ssl_object: ssl.SSLObject,
+             context: ResumingSSLContext,
+             server_hostname: str | None) -> ssl.SSLObject:
+        do_handshake = ssl_object.do_handshake
+
+        def handshake() -> None:
+            do_handshake()
+            context.handshake_done(server_hostname, ssl_object)
+
+        # pyre-ignore[8]: instance attribute shadowing the method
+        ssl_object.do_handshake = handshake
+        return ssl_object
+
+
+def create_ssl_context(insecure: bool = False,
+                       stats: ScrapeStats | None = None) -> ResumingSSLContext:
+    """Create the TLS settings of the connections to a UPS, resuming the
+    TLS sessions of earlier connections.
+
+    Only used with TLS session resumption, otherwise the connections use
+    the default TLS settings of requests or aiohttp.
+
+    :param insecure: bool
+        Whether to accept self-signed certificates
+    :param stats: ScrapeStats | None
+        Where to count the handshakes
+    :return: ResumingSSLContext
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT, stats)
+    if insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        # the CA bundle requests verifies with
+        context.load_verify_locations(DEFAULT_CA_BUNDLE_PATH)
+    return context
+
+
+class UPSAdapter(HTTPAdapter):
+    """Transport adapter of the requests session of a single UPS.
+
+    Sizes the connection pool, closes connections idle for longer than the
+    keep-alive timeout (before the UPS drops them) and counts new and
+    reused connections in the ScrapeStats of the UPS. Without ssl_context,
+    each new HTTPS connection is counted as a full TLS handshake.
+
+    :param pool_size: int
+        Maximum number of connections kept open to the UPS
+    :param keepalive_idle: float | None
+        Seconds after which idle connections are closed,
+        None keeps them open until the UPS closes them
+    :param ssl_context: ResumingSSLContext | None
+        TLS settings of the connections resuming TLS sessions,
+        None uses the defaults of requests
+    :param stats: ScrapeStats | None
+        Where to count the connections
+    :param insecure: bool
+        Never verify certificates, even if REQUESTS_CA_BUNDLE is set
+    """
+    def __init__(self,
+                 pool_size: int = POOL_SIZE,
+                 keepalive_idle: float | None = None,
+                 ssl_context: ResumingSSLContext | None = None,
+                 stats: ScrapeStats | None = None,
+                 insecure: bool = False) -> None:
+        self.keepalive_idle = keepalive_idle
+        self.insecure = insecure
+        self.ssl_context = ssl_context
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._last_used: float | None = None
+        # connections opened by pools that were closed, and counted ones
+        self._retired_connections = 0
+        self._counted_connections = 0
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs) -> None:
+        if self.ssl_context is not None:
+            pool_kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+    def opened_connections(self) -> int:
+        """Number of connections opened to the UPS so far."""
+        pools = self.poolmanager.pools
+        opened = self._retired_connections
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return opened
+
+    def close_idle(self) -> None:
+        """Close all connections, if they were idle for too long."""
+        keepalive_idle = self.keepalive_idle
+        now = time.monotonic()
+        with self._lock:
+            last_used, self._last_used = self._last_used, now
+            if keepalive_idle is None or last_used is None \
+                    or now - last_used < keepalive_idle:
+                return
+            self._retired_connections = self.opened_connections()
+            if self.ssl_context is not None:
+                self.ssl_context.remember_sessions()
+            self.poolmanager.clear()
+
+    def send(self, request, **kwargs):
+        if self.insecure:
+            # requests prefers REQUESTS_CA_BUNDLE to session.verify = False
+            kwargs['verify'] = False
+        self.close_idle()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            stats = self.stats
+            if stats is not None:
+                with self._lock:
+                    opened = self.opened_connections()
+                    new = opened - self._counted_connections
+                    self._counted_connections = opened
+                stats.count_request(new_connections=new)
+                if self.ssl_context is None \
+                        and request.url.startswith('https://'):
+                    for _ in range(new):
+                        stats.count_tls_handshake(resumed=False)
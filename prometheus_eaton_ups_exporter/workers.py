@@ -0,0 +1,193 @@
+"""Processes scraping a part of the UPSs, see ProcessUPSMultiExporter."""
+import multiprocessing
+import threading
+
+from prometheus_eaton_ups_exporter.breaker import CircuitBreaker
+from prometheus_eaton_ups_exporter.instrumentation import ScrapeStats
+from prometheus_eaton_ups_exporter.subsystems import compact_with_subsystems
+
+from typing import Any, Tuple
+
+# not fork: the exporter already runs threads when it starts workers
+CONTEXT = multiprocessing.get_context('spawn')
+
+# Seconds a worker may answer later than the deadline of its UPSs, e.g.
+# while it starts
+REPLY_MARGIN = 10
+
+
+class WorkerDevice:
+    """A UPS scraped by a worker process, as seen by the parent.
+
+    Only holds the state the worker reports with each reply, see
+    device_status, without the session and TLS settings of a scraper.
+
+    :param name: str
+        Name of the UPS in the config
+    :param ups_address: str
+        Address of the UPS
+    """
+    def __init__(self,
+                 name: str,
+                 ups_address: str) -> None:
+        self.name = name
+        self.ups_address = ups_address
+        self.stats = ScrapeStats()
+        # only its state is used, as reported by the worker
+        self.breaker = CircuitBreaker()
+        self.warm = False
+
+    def is_warm(self) -> bool:
+        """Whether the worker logged in and discovered the API links."""
+        return self.warm
+
+    def close(self) -> None:
+        """Nothing to close, the worker owns the session of the UPS."""
+
+
+def device_status(exporter) -> dict:
+    """State of the UPSs of a worker, reported with each reply.
+
+    :param exporter: UPSMultiExporter
+    :return: dict
+        (ScrapeStats, breaker state, warm, last scrape success) by UPS name
+    """
+    return {
+        ups.name: (
+            ups.stats,
+            ups.breaker.state,
+            ups.is_warm(),
+            exporter.scrape_success.get(ups.name),
+        )
+        for ups in exporter.ups_devices
+    }
+
+
+def run_scrape_worker(connection,
+                      exporter_class: type,
+                      config: dict,
+                      options: dict) -> None:
+    """Main function of a worker process.
+
+    Keeps an exporter of its UPSs, with their sessions and tokens, and
+    answers the commands of the parent until it is closed:
+    'scrape' all UPSs, 'probe' a single one, 'prewarm' all of them or
+    'reload' a changed config of its UPSs.
+    Measures are compacted before they are sent to the parent.
+    """
+    exporter = exporter_class(config, **options)
+    try:
+        while True:
+            try:
+                command, argument = connection.recv()
+            except EOFError:
+                break
+            if command == 'scrape':
+                result: Any = [
+                    compact_with_subsystems(measures)
+                    for measures in exporter.scrape_live()
+                ]
+            elif command == 'probe':
+                result = compact_with_subsystems(
+                    exporter.scrape_device(exporter.device(argument))
+                )
+            elif command == 'prewarm':
+                result = exporter.prewarm()
+            elif command == 'reload':
+                result = exporter.reload(argument)
+            else:
+                break
+            connection.send((result, device_status(exporter)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exporter.close()
+        connection.close()
+
+
+class ScrapeWorker:
+    """Handle of a worker process in the parent.
+
+    :param exporter_class: type
+        Exporter scraping the UPSs in the worker, e.g. UPSMultiExporter
+    :param config: dict
+        Config of the UPSs of the worker, kept up to date by the parent
+        so that a restarted worker scrapes the same UPSs
+    :param options: dict
+        Keyword arguments of the exporter
+    :param name: str
+        Name of the process
+    """
+    def __init__(self,
+                 exporter_class: type,
+                 config: dict,
+                 options: dict,
+                 name: str) -> None:
+        self.exporter_class = exporter_class
+        self.config = config
+        self.options = options
+        self.name = name
+        self._lock = threading.Lock()
+        self.start()
+
+    @property
+    def devices(self) -> list[str]:
+        """Names of the UPSs of the worker."""
+        return list(self.config)
+
+    def start(self) -> None:
+        """Start the worker process."""
+        self.connection, child_connection = CONTEXT.Pipe()
+        self.process = CONTEXT.Process(
+            target=run_scrape_worker,
+            args=(child_connection, self.exporter_class, self.config,
+                  self.options),
+            name=self.name,
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+
+    def restart(self) -> None:
+        """Replace a hung or dead worker by a new process.
+
+        The new worker restores the tokens and API links of its UPSs from
+        its state file, if there is one.
+        """
+        with self._lock:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+            self.start()
+
+    def request(self,
+                command: str,
+                argument: Any = None,
+                timeout: float | None = None) -> Tuple[Any, dict]:
+        """Send a command to the worker and wait for its reply.
+
+        :param timeout: Seconds to wait for the reply, None waits forever
+        :return: the result and the device_status of the worker
+        :raises EOFError: if the worker died
+        :raises TimeoutError: if the worker did not reply in time
+        """
+        with self._lock:
+            self.connection.send((command, argument))
+            if not self.connection.poll(timeout):
+                raise TimeoutError(
+                    f"No reply to {command} within {timeout} seconds"
+                )
+            return self.connection.recv()
+
+    def close(self,
+              timeout: float = 5) -> None:
+        """Close the exporter of the worker and stop it."""
+        with self._lock:
+            try:
+                self.connection.send(('close', None))
+            except OSError:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.connection.close()
@@ -24,3 +24,80 @@ def scrub_body():
         except AttributeError:
             return request
     return before_record_request
+
+
+def dummy_measures(ups_id):
+    """Minimal measures as returned by UPSScraper.get_measures."""
+    return {
+        'ups_id': ups_id,
+        'ups_inputs': {
+            'measures': {
+                'realtime': {
+                    'frequency': 50, 'voltage': 230, 'current': 1.5
+                }
+            }
+        },
+        'ups_outputs': {
+            'measures': {
+                'realtime': {
+                    'frequency': 50, 'voltage': 230, 'current': 1.2,
+                    'activePower': 250, 'apparentPower': 270,
+                    'powerFactor': 0.92, 'percentLoad': 17
+                }
+            }
+        },
+        'ups_powerbank': {
+            'measures': {
+                'voltage': 54.2, 'remainingChargeCapacity': 100,
+                'remainingTime': 3600
+            },
+            'status': {'health': 5}
+        }
+    }
+
+
+class FakeResponse:
+    """Stand-in for the requests.Response of UPSScraper.load_page."""
+
+    def __init__(self, page, status_code=200):
+        self.page = page
+        self.status_code = status_code
+        self.text = json.dumps(page)
+
+    def json(self):
+        if self.page is None:
+            raise json.decoder.JSONDecodeError("Expecting value", "", 0)
+        return self.page
+
+
+def fake_api_pages(address):
+    """Pages of the UPS API, keyed by URL, as walked by get_measures."""
+    api = '/rest/mbdetnrs/1.0/powerDistributions/1'
+    measures = dummy_measures(None)
+    return {
+        address + api: {
+            '@id': api,
+            'id': '1',
+            'inputs': {'@id': api + '/inputs'},
+            'outputs': {'@id': api + '/outputs'},
+            'backupSystem': {'@id': api + '/backupSystem'},
+        },
+        address + api + '/backupSystem': {
+            'powerBank': {'@id': api + '/backupSystem/powerBank'}
+        },
+        address + api + '/inputs/1': measures['ups_inputs'],
+        address + api + '/outputs/1': measures['ups_outputs'],
+        address + api + '/backupSystem/powerBank':
+            measures['ups_powerbank'],
+    }
+
+
+def fake_load_page(pages, requested):
+    """Create a UPSScraper.load_page serving the given pages."""
+    def load_page(url):
+        requested.append(url)
+        if url not in pages:
+            # as answered by the card and the simulator
+            return FakeResponse({'code': 'notFound'}, status_code=404)
+        return FakeResponse(pages[url])
+    return load_page
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import pytest
+from . import first_ups_details
+from benchmarks.simulator import PASSWORD, USERNAME, Simulator
+from prometheus_eaton_ups_exporter.async_scraper import AsyncUPSScraper
+from prometheus_eaton_ups_exporter.scraper_globals import (
+        CONNECTION_ERROR,
+        LoginFailedException,
+        MISSING_SCHEMA_ERROR,
+        )
+
+CASSETTES = os.path.join(os.path.dirname(__file__), 'cassettes')
+
+
+def async_ups_scraper(address,
+                      auth,
+                      name: str,
+                      insecure: bool = True) -> AsyncUPSScraper:
+    return AsyncUPSScraper(
+        address,
+        auth,
+        name,
+        insecure=insecure,
+        verbose=True
+    )
+
+
+async def login(scraper: AsyncUPSScraper):
+    try:
+        return await scraper.login()
+    finally:
+        await scraper.close()
+
+
+def test_async_get_measures(vcr, ups_scraper_conf) -> None:
+    """Replays the cassette recorded for the synchronous scraper."""
+    address, auth, ups_name = first_ups_details(ups_scraper_conf)
+    scraper = async_ups_scraper(address, auth, ups_name)
+
+    async def get_measures():
+        try:
+            return await scraper.get_measures()
+        finally:
+            await scraper.close()
+
+    with vcr.use_cassette(os.path.join(CASSETTES, 'test_get_measures.yaml')):
+        measures = asyncio.run(get_measures())
+
+    assert list(measures.keys()) == [
+        'ups_id',
+        'ups_inputs',
+        'ups_outputs',
+        'ups_powerbank'
+    ]
+    assert measures['ups_id'] == ups_name
+    assert list(measures['ups_powerbank'].get('measures')) == [
+        'voltage', 'remainingChargeCapacity', 'remainingTime'
+    ]
+
+
+def test_async_missing_schema_exception() -> None:
+    scraper = async_ups_scraper("", ("", ""), "")
+    with pytest.raises(LoginFailedException) as pytest_wrapped_e:
+        asyncio.run(login(scraper))
+    assert pytest_wrapped_e.value.error_code == MISSING_SCHEMA_ERROR
+
+
+def test_async_connection_refused_exception() -> None:
+    scraper = async_ups_scraper("https://127.0.0.1", ("", ""), "")
+    with pytest.raises(LoginFailedException) as pytest_wrapped_e:
+        asyncio.run(login(scraper))
+    assert pytest_wrapped_e.value.error_code == CONNECTION_ERROR
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_async_tls_session_resumption(certfile, resume) -> None:
+    with Simulator(1, certfile=certfile) as simulator:
+        server = simulator.servers[0]
+        scraper = AsyncUPSScraper(server.address, (USERNAME, PASSWORD),
+                                  'ups1', insecure=True, keepalive_idle=0,
+                                  tls_session_resumption=resume)
+        # aiohttp's default TLS settings unless resuming sessions
+        assert (scraper.ssl_context is not None) == resume
+
+        async def get_measures():
+            try:
+                return await scraper.get_measures()
+            finally:
+                await scraper.close()
+
+        assert asyncio.run(get_measures())
+    assert scraper.stats.tls_handshakes == scraper.stats.new_connections
+    assert scraper.stats.tls_handshakes > 0
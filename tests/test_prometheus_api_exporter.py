@@ -1,12 +1,41 @@
 """
 Testing the Exporter using the UPSExporter and UPSMultiExporter.
 """
+import copy
+import gzip
+import http.client
+import json
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
 import pytest
-from . import first_ups_details
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.parser import text_string_to_metric_families
+from . import dummy_measures, first_ups_details
+from benchmarks.simulator import Simulator, SimulatorSettings
+from prometheus_eaton_ups_exporter.alarms import ALARM_PAGE_SIZE, AlarmLog
+from prometheus_eaton_ups_exporter.async_scraper import AsyncUPSScraper
+from prometheus_eaton_ups_exporter.config_watcher import ConfigWatcher
 from prometheus_eaton_ups_exporter.exporter import (
+        AsyncUPSMultiExporter,
+        ProcessUPSMultiExporter,
         UPSExporter,
         UPSMultiExporter,
         )
+from prometheus_eaton_ups_exporter.instrumentation import ExporterCollector
+from prometheus_eaton_ups_exporter.metrics import METRIC_VALUES, METRICS
+from prometheus_eaton_ups_exporter.sampler import SampleWindow
+from prometheus_eaton_ups_exporter.scraper import UPSScraper
+from prometheus_eaton_ups_exporter.server import (
+        PrerenderedExposition,
+        start_http_server,
+        )
+from prometheus_eaton_ups_exporter.sharding import shard_devices, shard_of
+from prometheus_eaton_ups_exporter.subsystems import subsystem_links
 
 
 # Create Multi Exporter
@@ -77,15 +106,13 @@ def test_multi_collect(ups_scraper_conf, multi_exporter) -> None:
         'eaton_ups_battery_remaining_seconds', 'eaton_ups_battery_health'
     ]
     gauges = multi_exporter.collect()
-    for ups_name in ups_scraper_conf.keys():
-        ups_gauges = [next(gauges) for _ in names]
-
-        labels = [{'ups_id': ups_name} for _ in ups_gauges]
-        gauge_names = [gauge.name for gauge in ups_gauges]
-        gauge_labels = [gauge.samples[0].labels for gauge in ups_gauges]
+    ups_gauges = [next(gauges) for _ in names]
+    labels = [{'ups_id': ups_name} for ups_name in ups_scraper_conf.keys()]
+    gauge_names = [gauge.name for gauge in ups_gauges]
 
-        assert gauge_names == names
-        assert gauge_labels == labels
+    assert gauge_names == names
+    for gauge in ups_gauges:
+        assert [sample.labels for sample in gauge.samples] == labels
 
 
 @pytest.mark.vcr()
@@ -105,3 +132,758 @@ def test_collect_threading(ups_scraper_conf, threading_multi_exporter) -> None:
         assert gauge.name in names
         assert gauge.samples[0].labels['ups_id'] in \
             list(ups_scraper_conf.keys())
+
+
+def test_polling_collect(ups_scraper_conf, monkeypatch) -> None:
+    calls = []
+
+    def get_measures(ups):
+        calls.append(ups.name)
+        return dummy_measures(ups.name)
+
+    monkeypatch.setattr(UPSScraper, "get_measures", get_measures)
+    exporter = UPSMultiExporter(
+        ups_scraper_conf,
+        polling_interval=60
+    )
+    exporter.poller.stop()
+    exporter.poller.poll()
+    polls = len(calls)
+
+    samples = {}
+    for gauge in exporter.collect():
+        samples.setdefault(gauge.name, []).extend(gauge.samples)
+    assert len(calls) == polls
+    assert [s.value for s in samples['eaton_ups_input_volts']] == [230, 230]
+    age_labels = [
+        sample.labels['ups_id']
+        for sample in samples['eaton_ups_data_age_seconds']
+    ]
+    assert sorted(age_labels) == sorted(ups_scraper_conf.keys())
+
+
+def test_async_collect(ups_scraper_conf, monkeypatch) -> None:
+    async def get_measures(ups):
+        return dummy_measures(ups.name)
+
+    monkeypatch.setattr(AsyncUPSScraper, "get_measures", get_measures)
+    exporter = AsyncUPSMultiExporter(ups_scraper_conf, concurrency=1)
+    try:
+        ups_ids = [
+            sample.labels['ups_id']
+            for gauge in exporter.collect()
+            if gauge.name == 'eaton_ups_battery_health'
+            for sample in gauge.samples
+        ]
+    finally:
+        exporter.close()
+    assert ups_ids == list(ups_scraper_conf.keys())
+
+
+def test_worker_pool_is_reused(ups_scraper_conf, monkeypatch) -> None:
+    threads = set()
+
+    def get_measures(ups):
+        threads.add(threading.get_ident())
+        return dummy_measures(ups.name)
+
+    monkeypatch.setattr(UPSScraper, "get_measures", get_measures)
+    exporter = UPSMultiExporter(
+        ups_scraper_conf,
+        threading=True,
+        scrape_workers=1
+    )
+    executor = exporter.executor
+    for _ in range(3):
+        assert len(list(exporter.collect())) == 14 + 1
+    assert exporter.executor is executor
+    assert len(threads) == 1
+
+    exporter.close()
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
+
+
+def test_scrape_deadline(ups_scraper_conf, monkeypatch) -> None:
+    slow_ups, fast_ups = ups_scraper_conf.keys()
+    release = threading.Event()
+
+    def get_measures(ups):
+        if ups.name == slow_ups:
+            release.wait(5)
+        return dummy_measures(ups.name)
+
+    monkeypatch.setattr(UPSScraper, "get_measures", get_measures)
+    exporter = UPSMultiExporter(
+        ups_scraper_conf,
+        threading=True,
+        scrape_timeout=0.1
+    )
+    try:
+        gauges = list(exporter.collect())
+        ups_ids = {
+            sample.labels['ups_id']
+            for gauge in gauges
+            if gauge.name == 'eaton_ups_input_volts'
+            for sample in gauge.samples
+        }
+        success = {
+            sample.labels['ups_id']: sample.value
+            for sample in gauges[-1].samples
+        }
+    finally:
+        release.set()
+        exporter.close()
+    assert gauges[-1].name == 'eaton_ups_scrape_success'
+    assert ups_ids == {fast_ups}
+    assert success == {slow_ups: 0, fast_ups: 1}
+
+
+@pytest.mark.parametrize("threads", [True, False])
+def test_failing_device(ups_scraper_conf, monkeypatch, threads) -> None:
+    broken_ups, working_ups = ups_scraper_conf.keys()
+
+    def get_measures(ups):
+        if ups.name == broken_ups:
+            raise KeyError('backupSystem')
+        return dummy_measures(ups.name)
+
+    monkeypatch.setattr(UPSScraper, "get_measures", get_measures)
+    exporter = UPSMultiExporter(ups_scraper_conf, threading=threads)
+    try:
+        families = {family.name: family for family in exporter.collect()}
+    finally:
+        exporter.close()
+    assert {
+        sample.labels['ups_id']
+        for sample in families['eaton_ups_input_volts'].samples
+    } == {working_ups}
+    assert {
+        sample.labels['ups_id']: sample.value
+        for sample in families['eaton_ups_scrape_success'].samples
+    } == {broken_ups: 0, working_ups: 1}
+
+
+def test_one_family_per_metric(ups_scraper_conf, monkeypatch) -> None:
+    monkeypatch.setattr(
+        UPSScraper, "get_measures", lambda ups: dummy_measures(ups.name)
+    )
+    registry = CollectorRegistry()
+    registry.register(UPSMultiExporter(ups_scraper_conf))
+    exposition = generate_latest(registry).decode()
+
+    assert exposition.count('# HELP eaton_ups_input_volts ') == 1
+    assert exposition.count('eaton_ups_input_volts{') == \
+        len(ups_scraper_conf)
+
+
+def test_state_file(ups_scraper_conf, tmp_path) -> None:
+    state_file = str(tmp_path / 'state.json')
+    exporter = UPSMultiExporter(ups_scraper_conf, state_file=state_file)
+    ups = exporter.ups_devices[0]
+    ups.token_type, ups.access_token = "Bearer", "token"
+    ups.token_expires = time.monotonic() + 600
+    ups.links = {'ups_inputs': ups.ups_address + '/inputs/1'}
+    exporter.close()
+    assert os.stat(state_file).st_mode & 0o777 == 0o600
+
+    restarted = UPSMultiExporter(ups_scraper_conf, state_file=state_file)
+    restored_ups = restarted.ups_devices[0]
+    assert restored_ups.access_token == "token"
+    assert restored_ups.links == ups.links
+    assert abs(restored_ups.token_expires - ups.token_expires) < 2
+    assert restarted.ups_devices[1].access_token is None
+
+    # the state of a UPS is dropped if its address changed
+    config = copy.deepcopy(ups_scraper_conf)
+    config[ups.name]['address'] = 'https://address.to.ups3'
+    moved = UPSMultiExporter(config, state_file=state_file)
+    assert moved.ups_devices[0].access_token is None
+
+
+def test_exporter_collector() -> None:
+    with Simulator(2) as simulator:
+        exporter = UPSMultiExporter(simulator.config(), threading=True)
+        registry = CollectorRegistry()
+        registry.register(exporter)
+        registry.register(ExporterCollector(exporter))
+        try:
+            generate_latest(registry)
+            exposition = generate_latest(registry).decode()
+        finally:
+            exporter.close()
+    samples = {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(exposition)
+        for sample in family.samples
+    }
+
+    def sample(name, **labels):
+        return samples.get((name, tuple(sorted(labels.items()))))
+
+    for ups_id in simulator.config():
+        assert sample('eaton_ups_exporter_logins_total', ups_id=ups_id) == 1
+        assert sample('eaton_ups_exporter_relogins_total',
+                      ups_id=ups_id) == 0
+        assert sample('eaton_ups_exporter_scrapes_total',
+                      ups_id=ups_id, result='success') == 2
+        assert sample('eaton_ups_exporter_scrape_duration_seconds',
+                      ups_id=ups_id) > 0
+        for phase, count in [('discovery', 1), ('login', 1), ('inputs', 2),
+                             ('outputs', 2), ('powerbank', 2)]:
+            assert sample('eaton_ups_exporter_phase_duration_seconds_count',
+                          ups_id=ups_id, phase=phase) == count
+    # includes the second collect, as the exporter is collected first
+    assert sample('eaton_ups_exporter_collect_duration_seconds_count') == 2
+
+
+def test_prewarm() -> None:
+    with Simulator(2, settings=SimulatorSettings(latency=0.2)) as simulator:
+        exporter = UPSMultiExporter(simulator.config(), threading=True)
+        server, _ = start_http_server(0, '127.0.0.1', exporter,
+                                      CollectorRegistry())
+        url = f"http://127.0.0.1:{server.server_port}/ready"
+        try:
+            assert not exporter.start_prewarm()
+            with pytest.raises(urllib.error.HTTPError) as not_ready:
+                urllib.request.urlopen(url)
+            assert not_ready.value.code == 503
+            assert json.load(not_ready.value)["ready"] is False
+
+            deadline = time.monotonic() + 5
+            while not exporter.ready() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            with urllib.request.urlopen(url) as response:
+                assert json.load(response) == {
+                    "ready": True, "warm": 2, "devices": 2
+                }
+            list(exporter.collect())
+        finally:
+            server.shutdown()
+            exporter.close()
+        # the scrape reuses the tokens and links of the pre-warm
+        assert simulator.counts()['logins'] == 2
+        for ups in exporter.ups_devices:
+            assert ups.stats.logins == 1
+            assert ups.stats.phases['discovery'].count == 1
+
+
+def test_prewarm_without_threading(monkeypatch) -> None:
+    threads = set()
+    prewarm = UPSScraper.prewarm
+
+    def prewarm_in_thread(ups) -> bool:
+        threads.add(threading.get_ident())
+        return prewarm(ups)
+
+    monkeypatch.setattr(UPSScraper, "prewarm", prewarm_in_thread)
+    with Simulator(3) as simulator:
+        exporter = UPSMultiExporter(simulator.config())
+        try:
+            assert exporter.prewarm() == 3
+        finally:
+            exporter.close()
+    # one UPS after the other, without a thread per UPS
+    assert threads == {threading.get_ident()}
+
+
+@pytest.mark.parametrize("exporter_class",
+                         [UPSMultiExporter, AsyncUPSMultiExporter])
+def test_probe(exporter_class) -> None:
+    with Simulator(2) as simulator:
+        target, _ = simulator.config()
+        exporter = exporter_class(simulator.config())
+        server, _ = start_http_server(0, '127.0.0.1', exporter,
+                                      CollectorRegistry())
+        url = f"http://127.0.0.1:{server.server_port}/probe"
+        try:
+            with urllib.request.urlopen(f"{url}?target={target}") as response:
+                exposition = response.read().decode()
+            for status, query in [(404, "?target=unknown"), (400, "")]:
+                with pytest.raises(urllib.error.HTTPError) as error:
+                    urllib.request.urlopen(url + query)
+                assert error.value.code == status
+        finally:
+            server.shutdown()
+            exporter.close()
+        counts = simulator.counts()
+    samples = [
+        sample
+        for family in text_string_to_metric_families(exposition)
+        for sample in family.samples
+    ]
+    assert {sample.labels['ups_id'] for sample in samples} == {target}
+    assert len(samples) > 1
+    assert counts['logins'] == 1
+
+
+def test_sharding(ups_scraper_conf) -> None:
+    device = next(iter(ups_scraper_conf.values()))
+    config = {f"ups{i}": device for i in range(200)}
+    shards = [shard_devices(config, index, 4) for index in range(4)]
+    assert sorted(ups_id for shard in shards for ups_id in shard) \
+        == sorted(config)
+    assert all(shards)
+
+    # a fifth shard only takes UPSs over, about one fifth of them
+    moved = [
+        ups_id for ups_id in config
+        if shard_of(ups_id, 5) != shard_of(ups_id, 4)
+    ]
+    assert all(shard_of(ups_id, 5) == 4 for ups_id in moved)
+    assert 20 < len(moved) < 60
+
+    exporter = UPSMultiExporter(config, shard_index=1, shard_count=4)
+    registry = CollectorRegistry()
+    registry.register(ExporterCollector(exporter))
+    try:
+        assert [ups.name for ups in exporter.ups_devices] == list(shards[1])
+        info = [
+            sample.labels
+            for family in registry.collect()
+            if family.name == 'eaton_ups_exporter_shard'
+            for sample in family.samples
+        ]
+    finally:
+        exporter.close()
+    assert info == [
+        {'ups_id': ups_id, 'shard_index': '1', 'shard_count': '4'}
+        for ups_id in shards[1]
+    ]
+
+
+def test_processes() -> None:
+    with Simulator(3) as simulator:
+        config = simulator.config()
+        exporter = ProcessUPSMultiExporter(config, processes=2)
+        registry = CollectorRegistry()
+        registry.register(exporter)
+        registry.register(ExporterCollector(exporter))
+        try:
+            assert [worker.devices for worker in exporter.workers] \
+                == [list(config)[::2], list(config)[1::2]]
+            generate_latest(registry)
+            exposition = generate_latest(registry).decode()
+            probed = exporter.scrape_device(exporter.ups_devices[0])
+        finally:
+            exporter.close()
+        counts = simulator.counts()
+    assert not any(worker.process.is_alive() for worker in exporter.workers)
+    assert probed['ups_id'] == exporter.ups_devices[0].name
+    assert len(probed[METRIC_VALUES]) == len(METRICS)
+
+    samples = {
+        (sample.name, sample.labels.get('ups_id')): sample.value
+        for family in text_string_to_metric_families(exposition)
+        for sample in family.samples
+        if sample.labels.get('result', 'success') == 'success'
+    }
+    # the sessions and tokens of the workers are kept across scrapes
+    assert counts['logins'] == 3
+    for ups_id in config:
+        assert samples[('eaton_ups_input_volts', ups_id)] > 0
+        assert samples[('eaton_ups_scrape_success', ups_id)] == 1
+        # the ScrapeStats of the workers are reported by the parent
+        assert samples[('eaton_ups_exporter_scrapes_total', ups_id)] == 2
+        assert samples[('eaton_ups_exporter_logins_total', ups_id)] == 1
+
+
+def test_hung_worker_is_restarted(monkeypatch) -> None:
+    with Simulator(2, settings=SimulatorSettings(latency=0.2)) as simulator:
+        exporter = ProcessUPSMultiExporter(simulator.config(), processes=1)
+        worker, = exporter.workers
+        try:
+            process = worker.process
+            monkeypatch.setattr(
+                exporter, "reply_timeout", lambda worker, command: 0.1
+            )
+            assert list(exporter.scrape_live()) == []
+            assert exporter.scrape_success == {'ups1': False, 'ups2': False}
+            assert worker.process is not process
+            assert not process.is_alive()
+
+            monkeypatch.undo()
+            assert len(list(exporter.scrape_live())) == 2
+            assert exporter.scrape_success == {'ups1': True, 'ups2': True}
+        finally:
+            exporter.close()
+
+
+@pytest.mark.parametrize("exporter_class, options", [
+    (UPSMultiExporter, {'threading': True}),
+    (AsyncUPSMultiExporter, {}),
+    (ProcessUPSMultiExporter, {'processes': 2}),
+])
+def test_reload(exporter_class, options, tmp_path) -> None:
+    config_file = tmp_path / "config.json"
+    with Simulator(3) as simulator:
+        first, second, third = simulator.config().items()
+        config_file.write_text(json.dumps(dict([first, second])))
+        exporter = exporter_class(str(config_file), **options)
+        try:
+            list(exporter.collect())
+            kept = exporter.ups_devices[0]
+
+            config_file.write_text(json.dumps(dict([first, third])))
+            watcher = ConfigWatcher(exporter.reload, str(config_file), 1)
+            os.utime(config_file, ns=(0, 0))
+            assert watcher.check()
+            assert not watcher.check()
+            assert [ups.name for ups in exporter.ups_devices] \
+                == [first[0], third[0]]
+            assert exporter.ups_devices[0] is kept
+            # unchanged config, or an invalid one, keeps the UPSs
+            assert not exporter.reload()
+            config_file.write_text("{")
+            assert not exporter.reload()
+
+            ups_ids = {
+                sample.labels['ups_id']
+                for gauge in exporter.collect()
+                for sample in gauge.samples
+            }
+        finally:
+            exporter.close()
+        counts = simulator.counts()
+    assert ups_ids == {first[0], third[0]}
+    # only the added UPS logged in again
+    assert counts['logins'] == 3
+
+
+def test_reload_resizes_worker_pool() -> None:
+    with Simulator(5) as simulator:
+        devices = list(simulator.config().items())
+        exporter = UPSMultiExporter(dict(devices[:1]), threading=True)
+        try:
+            executor = exporter.executor
+            assert executor._max_workers == 1
+            list(exporter.collect())
+
+            assert exporter.reload(dict(devices))
+            assert exporter.executor is not executor
+            assert exporter.executor._max_workers == 5
+            # the old pool lets its threads exit
+            with pytest.raises(RuntimeError):
+                executor.submit(print)
+            list(exporter.collect())
+            assert exporter.scrape_success == {
+                name: True for name, _ in devices
+            }
+        finally:
+            exporter.close()
+
+        # a fixed number of workers is kept
+        exporter = UPSMultiExporter(
+            dict(devices[:1]), threading=True, scrape_workers=2
+        )
+        try:
+            executor = exporter.executor
+            assert exporter.reload(dict(devices))
+            assert exporter.executor is executor
+        finally:
+            exporter.close()
+
+
+def test_concurrent_collects_share_a_scrape() -> None:
+    settings = SimulatorSettings(latency=0.1)
+    with Simulator(2, settings=settings) as simulator:
+        exporter = UPSMultiExporter(simulator.config(), threading=True,
+                                    scrape_cache_ttl=60)
+        try:
+            list(exporter.collect())
+            requests = simulator.counts()['requests']
+
+            exporter.coalescer.clear()
+            collects = [
+                threading.Thread(target=lambda: list(exporter.collect()))
+                for _ in range(4)
+            ]
+            for collect in collects:
+                collect.start()
+            for collect in collects:
+                collect.join()
+            # and from the cache
+            list(exporter.collect())
+            list(exporter.probe(exporter.ups_devices[0]))
+            list(exporter.probe(exporter.ups_devices[0]))
+        finally:
+            exporter.close()
+        counts = simulator.counts()
+    # one scrape of 3 endpoints per UPS, and one probe
+    assert counts['requests'] == requests + 2 * 3 + 3
+    assert exporter.coalescer.shared == 3
+    assert exporter.coalescer.cached == 2
+
+
+def test_prerendered_exposition() -> None:
+    with Simulator(2) as simulator:
+        exporter = UPSMultiExporter(simulator.config(), polling_interval=60)
+        registry = CollectorRegistry()
+        registry.register(exporter)
+        prerendered = PrerenderedExposition(registry)
+        exporter.poller.subscribe(prerendered.render)
+        server, _ = start_http_server(0, '127.0.0.1', exporter, registry,
+                                      prerendered)
+        connection = http.client.HTTPConnection(
+            '127.0.0.1', server.server_port
+        )
+        try:
+            deadline = time.monotonic() + 5
+            while not prerendered.renders and time.monotonic() < deadline:
+                time.sleep(0.05)
+            rendered = prerendered.rendered
+            assert rendered is not None
+            text, compressed = rendered
+
+            responses, sockets = [], []
+            for encoding in ['gzip', 'identity', 'gzip']:
+                connection.request('GET', '/metrics',
+                                   headers={'Accept-Encoding': encoding})
+                response = connection.getresponse()
+                responses.append((
+                    response.status,
+                    response.getheader('Content-Encoding'),
+                    response.read()
+                ))
+                sockets.append(connection.sock)
+            connection.request('GET', '/ready')
+            assert connection.getresponse().status == 200
+            sockets.append(connection.sock)
+        finally:
+            connection.close()
+            server.shutdown()
+            exporter.close()
+    assert b'eaton_ups_input_volts{ups_id="ups1"}' in text
+    assert gzip.decompress(compressed) == text
+    assert responses == [
+        (200, 'gzip', compressed),
+        (200, None, text),
+        (200, 'gzip', compressed),
+    ]
+    assert prerendered.renders == 1
+    # one connection, kept alive between requests
+    assert sockets[0] is not None
+    assert all(socket is sockets[0] for socket in sockets)
+
+
+def test_idle_connections_are_closed() -> None:
+    with Simulator(1) as simulator:
+        exporter = UPSMultiExporter(simulator.config())
+        server, _ = start_http_server(0, '127.0.0.1', exporter,
+                                      CollectorRegistry(), idle_timeout=0.2)
+        connection = http.client.HTTPConnection(
+            '127.0.0.1', server.server_port
+        )
+        try:
+            connection.request('GET', '/ready')
+            assert connection.getresponse().read()
+            sock = connection.sock
+            assert sock is not None
+            # the server closes the connection once idle
+            sock.settimeout(5)
+            assert sock.recv(1) == b''
+        finally:
+            connection.close()
+            server.shutdown()
+            exporter.close()
+
+
+@pytest.mark.parametrize("exporter_class",
+                         [UPSMultiExporter, AsyncUPSMultiExporter])
+def test_sampling(exporter_class) -> None:
+    with Simulator(2) as simulator:
+        sampled, _ = simulator.config()
+        exporter = exporter_class(simulator.config(), sampling_interval=0.02,
+                                  sampling_window=60,
+                                  sampled_devices=[sampled])
+        sampler = exporter.sampler
+        assert sampler is not None
+
+        def samples() -> int:
+            window = sampler.windows.get(sampled)
+            if window is None:
+                return 0
+            return sum(not math.isnan(timestamp)
+                       for timestamp in window.rows[::window.width])
+
+        try:
+            # samples start once the UPSs are warm
+            list(exporter.collect())
+            deadline = time.monotonic() + 5
+            while samples() < 5 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            families = {
+                family.name: family for family in exporter.collect()
+            }
+        finally:
+            exporter.close()
+
+    def value(name: str) -> float:
+        sample, = families[name].samples
+        assert sample.labels == {'ups_id': sampled}
+        return sample.value
+
+    assert value('eaton_ups_output_volts_min') == 230
+    assert value('eaton_ups_output_volts_max') == 230
+    volts = [value(f'eaton_ups_input_volts_{aggregate}')
+             for aggregate in ('min', 'mean', 'max')]
+    assert 225 <= volts[0] <= volts[1] <= volts[2] <= 235
+    assert 225 <= value('eaton_ups_input_volts_last') <= 235
+    # fixed memory, the oldest samples are replaced
+    assert len(sampler.windows) == 1
+    assert sampler.capacity == 60 / 0.02 + 1
+
+
+def test_sample_window() -> None:
+    window = SampleWindow(2, 3)
+    for timestamp in range(5):
+        window.append(timestamp, [timestamp, math.nan])
+    assert len(window.rows) == 3 * 3
+    assert window.aggregate(0) == [(2, 4, 3, 4), None]
+    assert window.aggregate(4) == [(4, 4, 4, 4), None]
+
+
+@pytest.mark.parametrize("exporter_class",
+                         [UPSMultiExporter, AsyncUPSMultiExporter])
+def test_alarms(exporter_class) -> None:
+    with Simulator(1) as simulator:
+        ups, = simulator.servers
+        # more than one page of the log
+        for index in range(ALARM_PAGE_SIZE + 10):
+            ups.log_alarm('fanFailure', active=index % 2 == 0)
+        ups.log_alarm('onBattery', level='critical')
+        exporter = exporter_class(simulator.config(), alarms=True)
+        try:
+            def collect() -> dict:
+                return {
+                    (sample.name, sample.labels.get('code')): sample.value
+                    for family in exporter.collect()
+                    for sample in family.samples
+                    if sample.name.startswith('eaton_ups_alarm')
+                }
+
+            first = collect()
+            requests = simulator.counts()['requests']
+            ups.log_alarm('onBattery', level='critical', active=False)
+            ups.log_alarm('fanFailure')
+            second = collect()
+            # one request of the new events, beside the 3 endpoints
+            assert simulator.counts()['requests'] == requests + 3 + 1
+            # a reset log is read again from its start
+            ups.clear_alarms()
+            ups.log_alarm('overload')
+            third = collect()
+        finally:
+            exporter.close()
+    assert first == {
+        ('eaton_ups_alarm_active', 'onBattery'): 1,
+        ('eaton_ups_alarm_events_total', 'fanFailure'): ALARM_PAGE_SIZE + 10,
+        ('eaton_ups_alarm_events_total', 'onBattery'): 1,
+    }
+    assert second == {
+        ('eaton_ups_alarm_active', 'fanFailure'): 1,
+        ('eaton_ups_alarm_events_total', 'fanFailure'): ALARM_PAGE_SIZE + 11,
+        ('eaton_ups_alarm_events_total', 'onBattery'): 2,
+    }
+    assert third == {
+        ('eaton_ups_alarm_active', 'overload'): 1,
+        ('eaton_ups_alarm_events_total', 'fanFailure'): ALARM_PAGE_SIZE + 11,
+        ('eaton_ups_alarm_events_total', 'onBattery'): 2,
+        ('eaton_ups_alarm_events_total', 'overload'): 1,
+    }
+
+
+def test_unfiltered_alarm_log() -> None:
+    def page(last: int) -> dict:
+        # the oldest events, as answered by a card ignoring the filter
+        return {'members': [
+            {'id': index, 'code': 'fanFailure', 'status': {'active': True}}
+            for index in range(1, min(last, 3) + 1)
+        ]}
+
+    alarm_log = AlarmLog(page_size=3)
+    assert not alarm_log.apply(page(2))
+    assert not alarm_log.apply(page(2))
+    # events up to the cursor are not counted again
+    assert alarm_log.events == {('unknown', 'fanFailure'): 2}
+    # once the log fills the page, later events cannot be read
+    with pytest.raises(ValueError):
+        alarm_log.apply(page(3))
+    assert alarm_log.unfiltered
+    assert alarm_log.events == {('unknown', 'fanFailure'): 2}
+
+
+@pytest.mark.parametrize("exporter_class",
+                         [UPSMultiExporter, AsyncUPSMultiExporter])
+def test_missing_alarm_log(exporter_class) -> None:
+    with Simulator(1) as simulator:
+        ups, = simulator.servers
+        # answered with 404 and {"code": "notFound"}
+        ups.alarm_log = False
+        exporter = exporter_class(simulator.config(), alarms=True)
+        try:
+            names = {
+                sample.name
+                for family in exporter.collect()
+                for sample in family.samples
+            }
+        finally:
+            exporter.close()
+        counts = simulator.counts()
+    assert 'eaton_ups_input_volts' in names
+    assert not any(name.startswith('eaton_ups_alarm') for name in names)
+    # no relogin for the missing page
+    assert counts['logins'] == 1
+
+
+def test_subsystem_collectors() -> None:
+    with Simulator(2) as simulator:
+        config = simulator.config()
+        config['ups1']['collectors'] = ['avr']
+        exporter = UPSMultiExporter(config, collectors=['outlets', 'bypass'])
+        try:
+            list(exporter.collect())
+            requests = simulator.counts()['requests']
+            families = {
+                family.name: family for family in exporter.collect()
+            }
+            # 3 endpoints, 2 outlets, bypass and avr only for ups1
+            assert simulator.counts()['requests'] == requests + 7 + 6
+        finally:
+            exporter.close()
+
+    def samples(name: str) -> set:
+        return {
+            tuple(sorted(sample.labels.items()))
+            for sample in families[name].samples
+        }
+
+    assert samples('eaton_ups_outlet_watts') == {
+        (('outlet', outlet), ('ups_id', ups_id))
+        for outlet in ('1', '2') for ups_id in ('ups1', 'ups2')
+    }
+    assert samples('eaton_ups_bypass_volts') == {
+        (('ups_id', 'ups1'),), (('ups_id', 'ups2'),)
+    }
+    assert samples('eaton_ups_avr_health_status') == {(('ups_id', 'ups1'),)}
+    assert 'eaton_ups_inverter_volts' not in families
+    for ups in exporter.ups_devices:
+        assert ups.stats.phases['outlets'].count == 2 * 2
+
+
+def test_malformed_subsystem_links() -> None:
+    overview = {
+        'outlets': {'members': [
+            {'@id': '/outlets/1'}, {'id': 2}, 'outlet', {'@id': None},
+        ]},
+        'bypass': {'id': 1},
+        'chargers': [],
+        'avr': {'@id': '/avr'},
+    }
+    links = subsystem_links(
+        'https://ups', overview, ['outlets', 'bypass', 'chargers', 'avr']
+    )
+    assert links == {
+        'ups_outlets/1': 'https://ups/outlets/1',
+        'ups_avr': 'https://ups/avr',
+    }
@@ -1,16 +1,34 @@
+import json
+import threading
+import time
+
 import pytest
-from . import first_ups_details
-from prometheus_eaton_ups_exporter.scraper import UPSScraper
+from requests import Response
+from . import fake_api_pages, fake_load_page, first_ups_details
+from benchmarks.simulator import (
+        PASSWORD,
+        USERNAME,
+        Simulator,
+        SimulatorSettings,
+        )
+from prometheus_eaton_ups_exporter import scraper as scraper_module
+from prometheus_eaton_ups_exporter.breaker import CLOSED, OPEN
+from prometheus_eaton_ups_exporter.scraper import UPSResponse, UPSScraper
 from prometheus_eaton_ups_exporter.scraper_globals import (
         AUTHENTICATION_FAILED,
+        BREAKER_BACKOFF,
         CERTIFICATE_VERIFY_FAILED,
         CONNECTION_ERROR,
         INVALID_URL_ERROR,
         LoginFailedException,
         MISSING_SCHEMA_ERROR,
+        REQUEST_TIMEOUT,
         REST_API_PATH,
         TIMEOUT_ERROR,
+        TOKEN_CHECK_INTERVAL,
         )
+from prometheus_eaton_ups_exporter.tokens import check_interval
+from prometheus_eaton_ups_exporter.transport import UPSAdapter
 
 
 def ups_scraper(address,
@@ -41,6 +59,7 @@ def scraper_fixture(ups_scraper_conf):
 def test_login(scraper_fixture) -> None:
     token_type, access_token = scraper_fixture.login()
     assert token_type == "Bearer"
+    assert scraper_fixture.token_expires > time.monotonic()
 
 
 @pytest.mark.vcr()
@@ -214,3 +233,291 @@ def test_auth_failed_exception(monkeypatch, ups_scraper_conf) -> None:
         scraper.load_page(address + REST_API_PATH)
     assert pytest_wrapped_e.type == LoginFailedException
     assert pytest_wrapped_e.value.error_code == AUTHENTICATION_FAILED
+
+
+def test_get_measures_caches_links(monkeypatch, ups_scraper_conf) -> None:
+    address, auth, ups_name = first_ups_details(ups_scraper_conf)
+    scraper = ups_scraper(address, auth, ups_name)
+    pages = fake_api_pages(address)
+    requested = []
+    monkeypatch.setattr(scraper, "load_page", fake_load_page(pages, requested))
+
+    assert scraper.get_measures()
+    assert len(requested) == 5
+
+    requested.clear()
+    assert scraper.get_measures()
+    assert requested == list(scraper.get_links().values())
+
+    # moved endpoints are discovered again
+    api = address + REST_API_PATH
+    pages[api + '/inputs2/1'] = pages.pop(api + '/inputs/1')
+    pages[api]['inputs']['@id'] += '2'
+    measures = scraper.get_measures()
+    assert measures['ups_inputs'] == pages[api + '/inputs2/1']
+    assert scraper.get_links()['ups_inputs'] == api + '/inputs2/1'
+
+
+def test_outdated_links_are_discovered_again() -> None:
+    with Simulator(1) as simulator:
+        server, = simulator.servers
+        scraper = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups1')
+        try:
+            assert scraper.get_measures()
+            links = scraper.get_links()
+            inputs = links['ups_inputs']
+            links['ups_inputs'] += '2'
+            measures = scraper.get_measures()
+        finally:
+            scraper.close()
+        counts = simulator.counts()
+    assert measures['ups_inputs']
+    assert scraper.get_links()['ups_inputs'] == inputs
+    # the 404 is no expired session
+    assert counts['logins'] == 1
+
+
+def test_concurrent_get_measures(monkeypatch, ups_scraper_conf) -> None:
+    address, auth, ups_name = first_ups_details(ups_scraper_conf)
+    scraper = UPSScraper(address, auth, ups_name, device_concurrency=3)
+    requested = []
+    monkeypatch.setattr(
+        scraper, "load_page",
+        fake_load_page(fake_api_pages(address), requested)
+    )
+    try:
+        first_measures = scraper.get_measures()
+        requested.clear()
+        assert scraper.get_measures() == first_measures
+        assert sorted(requested) == sorted(scraper.get_links().values())
+    finally:
+        scraper.close()
+
+
+def test_relogin_is_shared(monkeypatch, ups_scraper_conf) -> None:
+    address, auth, ups_name = first_ups_details(ups_scraper_conf)
+    scraper = ups_scraper(address, auth, ups_name)
+    logins = []
+
+    def login():
+        logins.append(None)
+        return "Bearer", f"token{len(logins)}"
+
+    monkeypatch.setattr(scraper, "login", login)
+    rejected_token = (scraper.token_type, scraper.access_token)
+    scraper.relogin(rejected_token)
+    scraper.relogin(rejected_token)
+    assert len(logins) == 1
+    assert scraper.access_token == "token1"
+
+
+def test_scrape_timeout_exception(ups_scraper_conf) -> None:
+    address, auth, ups_name = first_ups_details(ups_scraper_conf)
+    scraper = UPSScraper(address, auth, ups_name, scrape_timeout=0)
+    # the deadline passes before the first request is sent
+    assert scraper.get_measures() == {}
+
+    scraper.deadline = time.monotonic()
+    with pytest.raises(LoginFailedException) as pytest_wrapped_e:
+        scraper.request_timeout(REQUEST_TIMEOUT)
+    assert pytest_wrapped_e.value.error_code == TIMEOUT_ERROR
+
+    # the deadline of a scrape does not apply to other threads
+    timeouts = []
+    thread = threading.Thread(
+        target=lambda: timeouts.append(
+            scraper.request_timeout(REQUEST_TIMEOUT)
+        )
+    )
+    thread.start()
+    thread.join()
+    assert timeouts == [REQUEST_TIMEOUT]
+
+
+def test_request_timeout_message() -> None:
+    settings = SimulatorSettings(latency=0.5)
+    with Simulator(1, settings=settings) as simulator:
+        server, = simulator.servers
+        scraper = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups1')
+        try:
+            scraper.relogin((None, None))
+            # the deadline cuts the timeout of the request short
+            scraper.deadline = time.monotonic() + 0.1
+            with pytest.raises(LoginFailedException) as pytest_wrapped_e:
+                scraper.load_page(server.address + REST_API_PATH)
+        finally:
+            scraper.close()
+    assert pytest_wrapped_e.value.error_code == TIMEOUT_ERROR
+    seconds = float(pytest_wrapped_e.value.message.split()[-2])
+    assert 0 < seconds <= 0.1
+
+
+def test_refresh_token(monkeypatch, ups_scraper_conf) -> None:
+    address, auth, ups_name = first_ups_details(ups_scraper_conf)
+    scraper = ups_scraper(address, auth, ups_name)
+    logins = []
+
+    def login():
+        logins.append(None)
+        scraper.token_expires = time.monotonic() + 899
+        return "Bearer", f"token{len(logins)}"
+
+    monkeypatch.setattr(scraper, "login", login)
+    # no token yet, nothing to renew
+    assert not scraper.refresh_token(60)
+
+    scraper.token_type, scraper.access_token = "Bearer", "token0"
+    scraper.token_expires = time.monotonic() + 30
+    assert scraper.refresh_token(60)
+    assert scraper.access_token == "token1"
+    assert not scraper.refresh_token(60)
+    assert len(logins) == 1
+
+
+def test_token_check_interval() -> None:
+    # two checks within the margin, at most TOKEN_CHECK_INTERVAL apart
+    assert check_interval(4) == 2
+    assert check_interval(3600) == TOKEN_CHECK_INTERVAL
+    with pytest.raises(ValueError):
+        check_interval(0)
+
+
+def test_response_is_decoded_once(monkeypatch) -> None:
+    decoded = []
+
+    def json_loads(content):
+        decoded.append(content)
+        return json.loads(content)
+
+    monkeypatch.setattr(scraper_module, "json_loads", json_loads)
+    response = Response()
+    response.status_code = 200
+    response._content = b'{"measures": {"voltage": 230}}'
+
+    page = UPSResponse(response)
+    assert page.json() == page.json() == {"measures": {"voltage": 230}}
+    assert len(decoded) == 1
+
+    response = Response()
+    response._content = b'<html><p>Unauthorized</p></html>'
+    page = UPSResponse(response)
+    for _ in range(2):
+        with pytest.raises(json.decoder.JSONDecodeError):
+            page.json()
+    assert len(decoded) == 2
+
+
+def test_simulated_ups_token_expiry() -> None:
+    settings = SimulatorSettings(token_lifetime=0.2)
+    with Simulator(1, settings=settings) as simulator:
+        server = simulator.servers[0]
+        ups = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups1')
+        try:
+            measures = ups.get_measures()
+            assert measures['ups_id'] == 'ups1'
+            assert 'realtime' in measures['ups_inputs']['measures']
+            assert server.counts['logins'] == 1
+
+            time.sleep(0.3)
+            assert ups.get_measures()
+            assert server.counts['logins'] == 2
+        finally:
+            ups.close()
+
+
+def test_circuit_breaker(monkeypatch) -> None:
+    scraper = UPSScraper("http://127.0.0.1:9", ("", ""), "ups",
+                         breaker_threshold=2)
+    now = [0.0]
+    scraper.breaker.clock = lambda: now[0]
+    logins = []
+
+    def login():
+        logins.append(now[0])
+        raise LoginFailedException(CONNECTION_ERROR, "Connection refused")
+
+    monkeypatch.setattr(scraper, "login", login)
+    for _ in range(4):
+        assert scraper.get_measures() == {}
+    # opened after the second failure, skipped since
+    assert len(logins) == 2
+    assert scraper.breaker.state == OPEN
+
+    # a failing probe after the backoff doubles it
+    now[0] = BREAKER_BACKOFF
+    assert scraper.get_measures() == {}
+    assert len(logins) == 3
+    now[0] += 2 * BREAKER_BACKOFF - 1
+    scraper.get_measures()
+    assert len(logins) == 3
+
+    # a successful probe closes the breaker
+    now[0] += 1
+    monkeypatch.setattr(scraper, "login", lambda: ("Bearer", "token"))
+    monkeypatch.setattr(scraper, "load_page", fake_load_page(
+        fake_api_pages(scraper.ups_address), []
+    ))
+    assert scraper.get_measures()
+    assert scraper.breaker.state == CLOSED
+    assert scraper.stats.skipped == 3
+
+
+def test_connection_reuse() -> None:
+    with Simulator(1) as simulator:
+        server = simulator.servers[0]
+        ups = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups1')
+        idle = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups2',
+                          keepalive_idle=0)
+        try:
+            for _ in range(3):
+                assert ups.get_measures()
+                assert idle.get_measures()
+        finally:
+            ups.close()
+            idle.close()
+    assert ups.stats.requests == idle.stats.requests == 13
+    assert ups.stats.new_connections == 1
+    assert idle.stats.new_connections == 13
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_tls_session_resumption(certfile, resume) -> None:
+    with Simulator(1, certfile=certfile) as simulator:
+        server = simulator.servers[0]
+        ups = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups1',
+                         insecure=True, keepalive_idle=0,
+                         tls_session_resumption=resume)
+        # requests' default TLS settings unless resuming sessions
+        adapter = ups.session.get_adapter(server.address)
+        assert isinstance(adapter, UPSAdapter)
+        assert (adapter.ssl_context is not None) == resume
+        try:
+            assert ups.get_measures()
+            assert ups.get_measures()
+        finally:
+            ups.close()
+    assert ups.stats.tls_handshakes == ups.stats.new_connections == 10
+    assert ups.stats.tls_resumed == (9 if resume else 0)
+
+
+def test_refresh_intervals() -> None:
+    now = [0.0]
+    with Simulator(1) as simulator:
+        server = simulator.servers[0]
+        ups = UPSScraper(server.address, (USERNAME, PASSWORD), 'ups1',
+                         refresh_intervals={'powerbank': 60})
+        ups.schedule.clock = lambda: now[0]
+        try:
+            scrapes = [ups.get_measures() for _ in range(3)]
+            now[0] = 60
+            scrapes.append(ups.get_measures())
+            ups.invalidate_links()
+            scrapes.append(ups.get_measures())
+        finally:
+            ups.close()
+    # the last powerbank page is merged into the scrapes in between
+    assert all(scrape['ups_powerbank'] for scrape in scrapes)
+    assert scrapes[1]['ups_powerbank'] is scrapes[0]['ups_powerbank']
+    assert ups.stats.phases['inputs'].count == 5
+    # loaded by the first scrape, after the interval and after rediscovery
+    assert ups.stats.phases['powerbank'].count == 3